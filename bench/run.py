@@ -0,0 +1,273 @@
+# bench/run.py
+# End-to-end benchmark: synthetic corpus -> per-stage throughput, latency and peak RSS.
+#
+#   python bench/run.py --rows 10000 --out bench_results.json
+#   python bench/run.py --rows 100000 --stages phase2 export --compare bench_baseline.json
+#
+# Every stage runs in its own child process against its own copy of the scratch DB,
+# so peak RSS is per stage and stages do not see each other's writes.
+from __future__ import annotations
+import argparse, json, os, platform, shutil, sqlite3, subprocess, sys, time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+STAGES = ["aspect_tagger", "phase1", "phase2", "phase3", "export", "dashboard_load"]
+# stages that read the output of a processing stage rather than the raw corpus
+NEEDS_PROCESSED = {"export", "dashboard_load"}
+RESULT_PREFIX = "BENCH_RESULT "
+
+# ---------- measurement helpers ----------
+def _peak_rss_mb():
+    try:
+        import resource
+        r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(r / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+        except Exception:
+            return None
+
+def _weighted_pct(samples, q):
+    """samples: [(per_row_seconds, n_rows)] -> q-th percentile of per-row latency."""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    total = sum(n for _, n in samples)
+    target = q * total
+    acc = 0
+    for v, n in samples:
+        acc += n
+        if acc >= target:
+            return v
+    return samples[-1][0]
+
+class BatchRecorder:
+    """Wrap a module function and record (rows, seconds) for each call."""
+
+    def __init__(self):
+        self.samples = []
+
+    def wrap(self, module, name, count):
+        orig = getattr(module, name)
+
+        def wrapped(*a, **kw):
+            t0 = time.perf_counter()
+            res = orig(*a, **kw)
+            n = count(a, kw, res)
+            if n:
+                self.samples.append(((time.perf_counter() - t0) / n, n))
+            return res
+
+        setattr(module, name, wrapped)
+
+def _count_raw(db):
+    con = sqlite3.connect(db)
+    try:
+        return con.execute("SELECT COUNT(*) FROM reviews_raw").fetchone()[0]
+    finally:
+        con.close()
+
+def _count_unprocessed(db):
+    con = sqlite3.connect(db)
+    try:
+        return con.execute("""
+            SELECT COUNT(*) FROM reviews_raw r
+            LEFT JOIN reviews_processed p ON p.review_id = r.id
+            WHERE p.review_id IS NULL
+        """).fetchone()[0]
+    finally:
+        con.close()
+
+# ---------- stages (run inside the child process) ----------
+def stage_aspect_tagger(db, rec):
+    from nlp.aspects import AspectTagger
+    con = sqlite3.connect(db)
+    texts = [t for (t,) in con.execute("SELECT text FROM reviews_raw")]
+    con.close()
+    tagger = AspectTagger(top_k=5)
+    for t in texts:
+        t0 = time.perf_counter()
+        tagger.tag(t)
+        rec.samples.append((time.perf_counter() - t0, 1))
+    return len(texts)
+
+def stage_phase1(db, rec):
+    import realtime.process_new_phase1 as m
+    rec.wrap(m, "process_frame", lambda a, kw, r: len(a[1]))
+    m.main()
+    return _count_raw(db)
+
+def stage_phase2(db, rec):
+    import realtime.process_new_phase2 as m
+    rec.wrap(m, "upsert", lambda a, kw, r: len(a[1]))
+    m.main()
+    return _count_raw(db)
+
+def stage_phase3(db, rec):
+    import realtime.process_new_phase3 as m
+    rec.wrap(m, "infer_with_cache", lambda a, kw, r: len(a[0]))
+    before = _count_unprocessed(db)
+    while _count_unprocessed(db) > 0:
+        left = _count_unprocessed(db)
+        m.main()
+        if _count_unprocessed(db) >= left:     # no progress -> stop instead of spinning
+            break
+    return before - _count_unprocessed(db)
+
+def stage_export(db, rec):
+    import tools.export_for_powerbi as m
+    t0 = time.perf_counter()
+    m.main()
+    n = _count_raw(db)
+    rec.samples.append(((time.perf_counter() - t0) / max(n, 1), n))
+    return n
+
+def stage_dashboard_load(db, rec):
+    # Same loader as streamlit_app.load_data (the app itself needs a Streamlit runtime)
+    from src.dashboard_data import load_frames
+    from src.db_models import get_read_engine
+    t0 = time.perf_counter()
+    with get_read_engine().connect() as conn:
+        df_reviews, df_proc = load_frames(conn)
+    n = len(df_proc)
+    rec.samples.append(((time.perf_counter() - t0) / max(n, 1), n))
+    return n
+
+def run_child(stage, db, real_models):
+    if stage == "phase3" and not real_models:
+        from bench import stubs
+        stubs.install()
+    rec = BatchRecorder()
+    t0 = time.perf_counter()
+    rows = globals()[f"stage_{stage}"](db, rec)
+    seconds = time.perf_counter() - t0
+    result = {
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        "p50_ms": _ms(_weighted_pct(rec.samples, 0.50)),
+        "p99_ms": _ms(_weighted_pct(rec.samples, 0.99)),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+def _ms(v):
+    return None if v is None else round(v * 1000, 4)
+
+# ---------- parent ----------
+def _child_env(db, work, stage):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{db}",
+        "EXPORT_DIR": os.path.join(work, "export"),
+        "BERTOPIC_MODEL_DIR": os.path.join(work, "bertopic_st"),
+        "BERTOPIC_MODEL_PATH": os.path.join(work, "bertopic_model"),
+        "INFERENCE_CACHE_PATH": os.path.join(work, "inference_cache.db"),
+        "AUTOTUNE_DIR": os.path.join(work, "autotune"),
+        "PHASE1_MODEL_PATH": os.path.join(work, "models", "phase1_sentiment.joblib"),
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    return env
+
+def run_stage(stage, base_db, processed_db, work_root, real_models):
+    work = os.path.join(work_root, stage)
+    shutil.rmtree(work, ignore_errors=True)
+    os.makedirs(os.path.join(work, "data", "processed"), exist_ok=True)
+    db = os.path.join(work, "bench.db")
+    shutil.copyfile(processed_db if stage in NEEDS_PROCESSED and processed_db else base_db, db)
+
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", stage, "--db", db]
+    if real_models:
+        cmd.append("--real-models")
+    proc = subprocess.run(cmd, cwd=work, env=_child_env(db, work, stage),
+                          capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):]), db
+    tail = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+    return {"error": f"exit {proc.returncode}", "detail": tail}, db
+
+def compare(current, baseline, tolerance):
+    """Return a list of regression messages (throughput down / latency or RSS up > tolerance)."""
+    base = {(r["rows"], s): v for r in baseline.get("runs", []) for s, v in r["stages"].items()}
+    out = []
+    for r in current["runs"]:
+        for s, v in r["stages"].items():
+            b = base.get((r["rows"], s))
+            if not b or "error" in v or "error" in b:
+                continue
+            checks = [("rows_per_sec", -1), ("p99_ms", +1), ("peak_rss_mb", +1)]
+            for key, direction in checks:
+                if b.get(key) in (None, 0) or v.get(key) is None:
+                    continue
+                change = (v[key] - b[key]) / b[key]
+                if change * direction > tolerance:
+                    out.append(f"{s}@{r['rows']}: {key} {b[key]} -> {v[key]} ({change:+.1%})")
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[10_000], help="corpus sizes (10k-5M)")
+    ap.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    ap.add_argument("--work-dir", default=os.path.join(ROOT, "data", "bench"))
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--real-models", action="store_true", help="use the real NLP models in phase 3")
+    ap.add_argument("--compare", default="", help="baseline JSON to check for regressions")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    ap.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    ap.add_argument("--db", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        return run_child(args.child, args.db, args.real_models)
+
+    from bench.synth import create_db
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "real_models": args.real_models,
+            "seed": args.seed,
+        },
+        "runs": [],
+    }
+    for n in args.rows:
+        work_root = os.path.join(args.work_dir, f"rows_{n}")
+        os.makedirs(work_root, exist_ok=True)
+        base_db = os.path.join(work_root, "base.db")
+        t0 = time.perf_counter()
+        create_db(base_db, n, seed=args.seed)
+        print(f"[{n} rows] corpus generated in {time.perf_counter() - t0:.1f}s")
+
+        stages, processed_db = {}, None
+        # processing stages first so export/dashboard read a fully processed DB
+        for stage in sorted(args.stages, key=STAGES.index):
+            res, db = run_stage(stage, base_db, processed_db, work_root, args.real_models)
+            stages[stage] = res
+            if stage in {"phase1", "phase3"} and "error" not in res:
+                processed_db = db
+            print(f"[{n} rows] {stage}: {json.dumps(res)}")
+        report["runs"].append({"rows": n, "stages": stages})
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for msg in regressions:
+            print("REGRESSION", msg)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} vs {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# bench/stubs.py
+# Small offline stand-ins for the heavy NLP dependencies of phase 3, so the benchmark
+# measures the pipeline's own overhead (DB, batching, caching, writes) without downloads.
+# Call install() before importing realtime.process_new_phase3.
+from __future__ import annotations
+import json, os, re, sys, types, zlib
+from collections import Counter
+
+import numpy as np
+
+DIM = 64
+_WORD_RE = re.compile(r"[a-z][a-z']+")
+_STOP = {"the", "and", "is", "was", "are", "a", "an", "in", "of", "to", "i", "it", "about",
+         "also", "care", "feels", "but", "too", "this", "that", "for", "on", "with"}
+_POS = {"superb", "excellent", "great", "helpful", "quick", "premium", "bright", "snappy", "fine"}
+_NEG = {"drains", "overheats", "grainy", "crashes", "delayed", "damaged", "lags", "inconsistent", "dim"}
+_TOPIC_WORDS = ["battery", "camera", "screen", "ui", "shipping", "packaging", "price", "support", "quality"]
+
+def _words(text: str):
+    return _WORD_RE.findall((text or "").lower())
+
+def embed(docs) -> np.ndarray:
+    """Hashed bag-of-words embedding (deterministic, L2-normalized)."""
+    out = np.zeros((len(docs), DIM), dtype=np.float32)
+    for i, d in enumerate(docs):
+        for w in _words(d):
+            out[i, zlib.crc32(w.encode()) % DIM] += 1.0
+    n = np.linalg.norm(out, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    return out / n
+
+# ---------- transformers ----------
+def _sentiment_one(text: str):
+    ws = _words(text)
+    pos = sum(w in _POS for w in ws)
+    neg = sum(w in _NEG for w in ws)
+    if pos > neg:
+        return {"label": "positive", "score": 0.6 + 0.4 * pos / (pos + neg)}
+    if neg > pos:
+        return {"label": "negative", "score": 0.6 + 0.4 * neg / (pos + neg)}
+    return {"label": "neutral", "score": 0.55}
+
+def pipeline(task=None, model=None, **kw):
+    def run(inputs, **call_kw):
+        if isinstance(inputs, str):
+            return [_sentiment_one(inputs)]
+        return [_sentiment_one(t) for t in inputs]
+    return run
+
+# ---------- keybert ----------
+class KeyBERT:
+    def __init__(self, *a, **kw):
+        pass
+
+    def extract_keywords(self, doc, keyphrase_ngram_range=(1, 1), stop_words=None, top_n=5, **kw):
+        c = Counter(w for w in _words(doc) if w not in _STOP and len(w) > 2)
+        total = sum(c.values()) or 1
+        return [(w, n / total) for w, n in c.most_common(top_n)]
+
+# ---------- spacy ----------
+class _Span:
+    def __init__(self, text):
+        self.text = text
+
+class _Doc:
+    _CHUNK_RE = re.compile(r"\b(?:the|a|an|my|your|this)\s+[a-zA-Z]+(?:\s+[a-zA-Z]+)?")
+    _SENT_RE = re.compile(r"[^.!?]+[.!?]*")
+
+    def __init__(self, text):
+        self.text = text
+        self.noun_chunks = [_Span(m.group(0)) for m in self._CHUNK_RE.finditer(text or "")]
+        self.sents = [_Span(m.group(0).strip()) for m in self._SENT_RE.finditer(text or "") if m.group(0).strip()]
+
+class _Language:
+    def __call__(self, text):
+        return _Doc(text)
+
+    def pipe(self, texts, **kw):
+        for t in texts:
+            yield _Doc(t)
+
+def spacy_load(name, **kw):
+    return _Language()
+
+# ---------- hdbscan / sentence-transformers ----------
+class HDBSCAN:
+    def __init__(self, *a, **kw):
+        pass
+
+class SentenceTransformer:
+    def __init__(self, *a, **kw):
+        pass
+
+    def encode(self, docs, batch_size=32, show_progress_bar=False, **kw):
+        return embed(list(docs))
+
+# ---------- bertopic ----------
+def _topic_of(text: str) -> int:
+    ws = set(_words(text))
+    for i, w in enumerate(_TOPIC_WORDS):
+        if w in ws:
+            return i
+    return -1
+
+class BERTopic:
+    def __init__(self, embedding_model=None, **kw):
+        self.embedding_model = embedding_model
+        self.topic_representations_ = None
+        self.topic_embeddings_ = None
+        self.topics_ = None
+        self._outliers = 1
+
+    def _init_topics(self):
+        self.topic_representations_ = {-1: [("misc", 1.0)]}
+        self.topic_representations_.update(
+            {i: [(w, 1.0), ("the", 0.5), ("phone", 0.2)] for i, w in enumerate(_TOPIC_WORDS)})
+        self.topic_embeddings_ = np.vstack([embed(["misc"]), embed(_TOPIC_WORDS)])
+
+    def fit(self, docs, embeddings=None, **kw):
+        self._init_topics()
+        self.topics_ = [_topic_of(d) for d in docs]
+        return self
+
+    def reduce_topics(self, docs, nr_topics=10, **kw):
+        return self
+
+    def transform(self, docs, embeddings=None):
+        topics = [_topic_of(d) for d in docs]
+        return topics, np.array([0.9 if t != -1 else 0.1 for t in topics])
+
+    def get_topics(self):
+        return dict(self.topic_representations_ or {})
+
+    def get_topic(self, tid):
+        return (self.topic_representations_ or {}).get(tid, False)
+
+    def _extract_embeddings(self, docs, method="document", verbose=False):
+        return embed(list(docs))
+
+    def save(self, path, serialization="safetensors", save_ctfidf=False, save_embedding_model=None):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "topics.json"), "w") as f:
+            json.dump({str(k): v for k, v in (self.topic_representations_ or {}).items()}, f)
+        with open(os.path.join(path, "config.json"), "w") as f:
+            json.dump({"embedding_model": save_embedding_model, "stub": True}, f)
+
+    @classmethod
+    def load(cls, path, embedding_model=None):
+        m = cls(embedding_model=embedding_model)
+        m._init_topics()
+        return m
+
+def install() -> None:
+    """Register the stubs under the real module names."""
+    mods = {
+        "transformers": {"pipeline": pipeline},
+        "keybert": {"KeyBERT": KeyBERT},
+        "spacy": {"load": spacy_load},
+        "hdbscan": {"HDBSCAN": HDBSCAN},
+        "sentence_transformers": {"SentenceTransformer": SentenceTransformer},
+        "bertopic": {"BERTopic": BERTopic},
+    }
+    for name, attrs in mods.items():
+        m = types.ModuleType(name)
+        m.__dict__.update(attrs)
+        m.__bench_stub__ = True
+        sys.modules[name] = m
@@ -0,0 +1,147 @@
+# bench/synth.py
+# Synthetic review corpora shaped like sample_reviews.csv (brands, aspects, ratings, noise),
+# streamed into a scratch SQLite DB with the project's schema.
+from __future__ import annotations
+import os, sys, csv, random, sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+BRANDS = ["Nimbus", "Aurora", "Quasar", "Zenith", "Pulse"]
+ASPECTS = ["battery", "camera", "screen", "UI", "shipping", "packaging", "price", "support", "quality"]
+
+# (clause, rating bias) -- same phrasing as sample_reviews.csv plus a few neutral/mixed ones
+CLAUSES = [
+    ("the camera quality is superb and the UI feels snappy", +1),
+    ("battery life is excellent and the screen is bright", +1),
+    ("customer support was helpful and delivery was quick", +1),
+    ("great value for money and build quality feels premium", +1),
+    ("the UI lags and touch response is inconsistent", -1),
+    ("shipping was delayed and packaging arrived damaged", -1),
+    ("battery drains fast and the device overheats", -1),
+    ("camera is grainy in low light and the app crashes", -1),
+    ("screen refresh rate is 120hz but brightness is too dim outdoors", 0),
+    ("price is ok, nothing special about the packaging", 0),
+    ("night mode photos look fine, zoom is average", 0),
+]
+FILLER = ["same here", "lol", "this", "+1", "agreed", "came here to say this", "🔥🔥🔥", "👍"]
+URLS = ["https://example.com/review", "https://imgur.com/a/xyz", "www.example.org/thread"]
+
+def _typo(s: str, rng: random.Random) -> str:
+    if len(s) < 8:
+        return s
+    i = rng.randrange(1, len(s) - 1)
+    return s[:i] + s[i + 1] + s[i] + s[i + 2:]
+
+RATING_WEIGHTS = {1: 25, 2: 22, 3: 9, 4: 22, 5: 42}   # distribution in sample_reviews.csv
+
+def _clauses_for(rating: int):
+    bias = 1 if rating >= 4 else (-1 if rating <= 2 else 0)
+    return [c for c, b in CLAUSES if b == bias]
+
+def generate(n_rows: int, seed: int = 7, days: int = 120,
+             dup_rate: float = 0.08, filler_rate: float = 0.05, long_rate: float = 0.03
+             ) -> Iterator[Dict]:
+    """Yield synthetic review dicts with both sample_reviews.csv and reviews_raw fields."""
+    rng = random.Random(seed)
+    start = datetime(2024, 8, 1)
+    ratings, weights = zip(*RATING_WEIGHTS.items())
+    recent = []
+    for i in range(n_rows):
+        rating = rng.choices(ratings, weights)[0]
+        brand = rng.choice(BRANDS)
+        r = rng.random()
+        if r < dup_rate and recent:
+            text = rng.choice(recent)                    # repost / copy-paste
+        elif r < dup_rate + filler_rate:
+            text = rng.choice(FILLER)                    # junk one-liners
+        else:
+            pool = _clauses_for(rating)
+            n_clauses = rng.randint(4, 12) if rng.random() < long_rate else rng.randint(1, 2)
+            # mixed reviews: occasionally pull a clause from the whole set
+            parts = [rng.choice(pool) if rng.random() < 0.85 else rng.choice(CLAUSES)[0]
+                     for _ in range(n_clauses)]
+            text = ". ".join(parts) + f". Also, I care about {rng.choice(ASPECTS)}."
+            if rng.random() < 0.1:
+                text = _typo(text, rng)
+            if rng.random() < 0.05:
+                text += " " + rng.choice(URLS)
+            recent.append(text)
+            if len(recent) > 500:
+                recent.pop(0)
+        source = "reddit" if rng.random() < 0.8 else "youtube"
+        created = start + timedelta(seconds=rng.randrange(days * 86400))
+        yield {
+            "review_id": f"R{i:09d}",
+            "date": created.date().isoformat(),
+            "product_id": f"P{rng.randint(100, 199)}",
+            "brand": brand,
+            "rating": rating,
+            "review_text": text,
+            "source": source,
+            "author": f"user{rng.randrange(50000)}",
+            "created_at": created.isoformat(sep=" "),
+        }
+
+def _raw_row(d: Dict) -> Tuple:
+    return (d["source"], f"bench-{d['review_id']}", d["author"], d["review_text"],
+            f"https://example.com/{d['source']}/{d['review_id']}", d["created_at"])
+
+def write_csv(path: str, n_rows: int, seed: int = 7) -> str:
+    """Write a sample_reviews.csv-shaped file (review_id,date,product_id,brand,rating,review_text)."""
+    cols = ["review_id", "date", "product_id", "brand", "rating", "review_text"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(cols)
+        for d in generate(n_rows, seed=seed):
+            w.writerow([d[c] for c in cols])
+    return path
+
+def create_db(path: str, n_rows: int, seed: int = 7, chunk: int = 50_000) -> str:
+    """Create a fresh DB at `path` with the project schema and `n_rows` synthetic reviews."""
+    from sqlalchemy import create_engine
+    from src.db_models import Base
+
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    eng = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=eng)
+    eng.dispose()
+
+    con = sqlite3.connect(path)
+    try:
+        buf = []
+        for d in generate(n_rows, seed=seed):
+            buf.append(_raw_row(d))
+            if len(buf) >= chunk:
+                _flush(con, buf)
+        _flush(con, buf)
+    finally:
+        con.close()
+    return path
+
+def _flush(con, buf):
+    if buf:
+        con.executemany(
+            "INSERT INTO reviews_raw (source, source_id, author, text, url, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            buf,
+        )
+        con.commit()
+        buf.clear()
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("path")
+    ap.add_argument("--rows", type=int, default=10_000)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--csv", action="store_true", help="write a sample_reviews.csv-shaped file instead of a DB")
+    args = ap.parse_args()
+    if args.csv:
+        write_csv(args.path, args.rows, args.seed)
+    else:
+        create_db(args.path, args.rows, args.seed)
+    print(f"Wrote {args.rows} synthetic reviews to {args.path}")
@@ -1,4 +1,6 @@
+import os, re, sys
 from airflow import DAG
+from airflow.decorators import task
 from airflow.operators.bash import BashOperator
 from datetime import datetime, timedelta
 
@@ -9,29 +11,76 @@ default_args = {
     "retry_delay": timedelta(minutes=5),
 }
 
+# --- Fan-out configuration ---
+# One ingest task per group; groups are ";"-separated, subreddits inside a group ","-separated.
+REDDIT_GROUPS = [g.strip() for g in os.getenv("DAG_REDDIT_GROUPS", "iphone,Android;gadgets").split(";") if g.strip()]
+# One task per YouTube video id (empty -> no YouTube ingestion)
+YOUTUBE_VIDEO_IDS = [v.strip() for v in os.getenv("DAG_YOUTUBE_VIDEO_IDS", "").split(",") if v.strip()]
+
+def _task_suffix(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_]+", "_", name)[:60].strip("_")
+
 with DAG(
     "aspect_sentiment_pipeline",
     default_args=default_args,
-    description="Ingest Reddit → Process → Export for Power BI",
+    description="Ingest Reddit + YouTube (parallel) → sharded processing → incremental export for Power BI",
     schedule_interval="@hourly",  # run once daily (change to @hourly / cron as needed)
     start_date=datetime(2025, 9, 12),
     catchup=False,
+    max_active_runs=1,   # shards of the next run must not overlap with this one
     tags=["aspect-sentiment", "portfolio"],
 ) as dag:
 
-    ingest = BashOperator(
-        task_id="ingest_reddit",
-        bash_command="python /opt/airflow/realtime/ingest_reddit_stream.py",
-    )
+    # Ingestors only write; processing is done by the shard tasks below
+    ingest = [
+        BashOperator(
+            task_id=f"ingest_reddit_{_task_suffix(group)}",
+            bash_command="python /opt/airflow/realtime/ingest_reddit_stream.py",
+            env={"REDDIT_SUBREDDITS": group, "REDDIT_REALTIME_BATCH": "0"},
+            append_env=True,
+        )
+        for group in REDDIT_GROUPS
+    ] + [
+        BashOperator(
+            task_id=f"ingest_youtube_{_task_suffix(video_id)}",
+            bash_command="python /opt/airflow/realtime/ingest_youtube_poll.py",
+            env={"YOUTUBE_VIDEO_ID": video_id, "YOUTUBE_ONESHOT": "1", "YOUTUBE_REALTIME_BATCH": "0"},
+            append_env=True,
+        )
+        for video_id in YOUTUBE_VIDEO_IDS
+    ]
 
-    process = BashOperator(
-        task_id="process_reviews",
-        bash_command="python /opt/airflow/realtime/process_new_phase3.py",
+    # Train/migrate the topic model once so shards never race on first-run training
+    prepare_models = BashOperator(
+        task_id="prepare_models",
+        bash_command="python /opt/airflow/realtime/process_new_phase3.py --prepare",
+        trigger_rule="all_done",   # one failed source must not block processing of the others
     )
 
+    @task
+    def plan_shards():
+        sys.path.append("/opt/airflow")
+        from src.db_models import get_engine
+        from src.shards import plan_id_shards
+        with get_engine().connect() as conn:
+            shards = plan_id_shards(conn)
+        print(f"{len(shards)} shards: {shards}")
+        return [{"SHARD_MIN_ID": str(s["min_id"]), "SHARD_MAX_ID": str(s["max_id"])} for s in shards]
+
+    shards = plan_shards()
+
+    # one mapped task per id range; wall-clock is bounded by the slowest shard
+    process = BashOperator.partial(
+        task_id="process_shard",
+        bash_command="python /opt/airflow/realtime/process_new_phase3.py --drain",
+        append_env=True,
+    ).expand(env=shards)
+
     export = BashOperator(
         task_id="export_for_powerbi",
-        bash_command="python /opt/airflow/tools/export_for_powerbi.py",
+        bash_command="python /opt/airflow/tools/export_for_powerbi.py --incremental",
+        trigger_rule="none_failed",   # still runs when there was nothing to shard
     )
 
-    ingest >> process >> export
\ No newline at end of file
+    ingest >> prepare_models >> shards
+    process >> export
@@ -0,0 +1,84 @@
+# nlp/aspect_sentiment.py
+# Aspect-scoped sentiment: split each review into sentences/clauses, keep only the clauses the
+# AspectTagger finds an aspect in, score those clauses in one batched sentiment call and fold the
+# results into one row per (review, aspect). Clauses without an aspect are never sent to the model,
+# and no clause is clipped to 512 characters, so "camera is great, but battery drains" gets
+# camera=POSITIVE / battery=NEGATIVE instead of one label for the whole comment.
+from __future__ import annotations
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+from nlp import sentiment
+from nlp.aspects import AspectTagger
+
+ASPECT_SENT_MAX_CHARS = int(os.getenv("ASPECT_SENT_MAX_CHARS", "400"))   # per clause, not per review
+
+_SENT_RE = re.compile(r"[^.!?\n]+[.!?]*")
+# contrast markers usually switch aspect and polarity inside one sentence
+_CLAUSE_RE = re.compile(r"\s*(?:;|,?\s+\b(?:but|however|although|though|whereas|while|except)\b)\s*", re.I)
+_SIGN = {"POSITIVE": 1, "NEGATIVE": -1, "NEUTRAL": 0}
+
+def split_clauses(text: str) -> List[str]:
+    out = []
+    for m in _SENT_RE.finditer(text or ""):
+        for part in _CLAUSE_RE.split(m.group(0)):
+            part = part.strip(" ,.!?")
+            if len(part) > 2:
+                out.append(part)
+    return out
+
+def aspect_clauses(texts: Sequence[str], tagger: AspectTagger) -> List[Dict[str, List[str]]]:
+    """Per text: aspect -> clauses mentioning it (a clause with two aspects counts for both)."""
+    out = []
+    for txt in texts:
+        by_aspect: Dict[str, List[str]] = defaultdict(list)
+        for clause in split_clauses(txt):
+            for aspect in tagger.tag(clause).labels:
+                by_aspect[aspect].append(clause[:ASPECT_SENT_MAX_CHARS])
+        out.append(dict(by_aspect))
+    return out
+
+def score_aspects(texts: Sequence[str], model, tagger: AspectTagger, stats: Dict[str, int] = None,
+                  tuner=None) -> List[List[Dict]]:
+    """
+    Per text: [{"aspect", "sentiment_label", "score", "score_signed", "n_sentences"}, ...].
+    Each distinct clause is scored once, across the whole batch (micro-batched by `tuner` if given).
+    """
+    per_text = aspect_clauses(texts, tagger)
+    uniq: Dict[str, int] = {}
+    for by_aspect in per_text:
+        for clauses in by_aspect.values():
+            for c in clauses:
+                uniq.setdefault(c, len(uniq))
+    results = sentiment.classify(model, list(uniq), tuner=tuner) if uniq else []
+    scored = [(r["label"].upper(), float(r["score"])) for r in results]
+
+    if stats is not None:
+        stats["clauses_scored"] = stats.get("clauses_scored", 0) + len(uniq)
+        stats["chars_scored"] = stats.get("chars_scored", 0) + sum(len(c) for c in uniq)
+        stats["chars_total"] = stats.get("chars_total", 0) + sum(len(t or "") for t in texts)
+
+    out = []
+    for by_aspect in per_text:
+        rows = []
+        for aspect, clauses in by_aspect.items():
+            votes: Dict[str, float] = defaultdict(float)
+            counts: Dict[str, int] = defaultdict(int)
+            signed = []
+            for c in dict.fromkeys(clauses):
+                label, score = scored[uniq[c]]
+                votes[label] += score
+                counts[label] += 1
+                signed.append(score * _SIGN.get(label, 0))
+            label = max(votes, key=votes.get)   # confidence-weighted vote over the aspect's clauses
+            rows.append({
+                "aspect": aspect,
+                "sentiment_label": label,
+                "score": votes[label] / counts[label],
+                "score_signed": sum(signed) / len(signed),
+                "n_sentences": len(signed),
+            })
+        out.append(rows)
+    return out
@@ -0,0 +1,254 @@
+# nlp/cache.py
+# Persistent inference cache keyed by (normalized-text hash, model version).
+# SQLite on disk, in-process LRU in front, optional SimHash near-duplicate lookups.
+# SimHash is only computed in near-dup mode; after switching it on, stamp the rows cached before:
+#   python -m nlp.cache --backfill-simhash
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+CACHE_PATH = os.getenv("INFERENCE_CACHE_PATH", "data/inference_cache.db")
+CACHE_LRU_SIZE = int(os.getenv("INFERENCE_CACHE_LRU", "50000"))
+CACHE_NEAR_DUP = os.getenv("INFERENCE_CACHE_NEAR_DUP", "0") == "1"
+NEAR_DUP_MAX_DIST = int(os.getenv("INFERENCE_CACHE_SIMHASH_DIST", "6"))  # Hamming bits out of 64
+NEAR_DUP_MIN_TOKENS = 4   # very short texts ("same here") only match exactly
+# candidates sharing the most bands are checked first; a crowded bucket is cut off after this many
+NEAR_DUP_MAX_CANDIDATES = int(os.getenv("INFERENCE_CACHE_SIMHASH_CANDIDATES", "5000"))
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+")
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_WS_RE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    t = (text or "").lower()
+    t = _URL_RE.sub(" url ", t)
+    t = _NON_WORD_RE.sub(" ", t)
+    return _WS_RE.sub(" ", t).strip()
+
+def text_hash(norm: str) -> str:
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+def simhash(norm: str) -> int:
+    """64-bit SimHash over character 3-shingles (stable on short comments)."""
+    if not norm:
+        return 0
+    feats = [norm[i:i + 3] for i in range(max(1, len(norm) - 2))]
+    v = [0] * 64
+    for f in feats:
+        h = int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(64):
+            v[i] += 1 if (h >> i) & 1 else -1
+    out = 0
+    for i in range(64):
+        if v[i] > 0:
+            out |= 1 << i
+    return out
+
+def _signed(x: int) -> int:
+    # SQLite INTEGER is signed 64-bit
+    return x - (1 << 64) if x >= (1 << 63) else x
+
+def _bands(h: int) -> List[int]:
+    # 4 x 16-bit bands used as candidate buckets; exact Hamming distance is checked after
+    return [(h >> (16 * i)) & 0xFFFF for i in range(4)]
+
+class InferenceCache:
+    def __init__(self, model_version: str, path: str = CACHE_PATH,
+                 lru_size: int = CACHE_LRU_SIZE, near_dup: bool = CACHE_NEAR_DUP):
+        self.model_version = model_version
+        self.lru_size = lru_size
+        self.near_dup = near_dup
+        self._lru: "OrderedDict[str, Dict]" = OrderedDict()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.con = sqlite3.connect(path)
+        self._ensure_schema()
+        self.stats = {"lookups": 0, "lru_hits": 0, "db_hits": 0, "near_hits": 0, "misses": 0,
+                      "inferred": 0, "inference_seconds": 0.0}
+
+    def _ensure_schema(self):
+        cur = self.con.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS inference_cache (
+                text_hash TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                simhash INTEGER,
+                b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER,
+                result TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (text_hash, model_version)
+            )
+        """)
+        for i in range(4):
+            cur.execute(f"CREATE INDEX IF NOT EXISTS ix_inference_cache_b{i} "
+                        f"ON inference_cache(model_version, b{i})")
+        self.con.commit()
+
+    # ---------- LRU ----------
+    def _lru_get(self, key: str) -> Optional[Dict]:
+        hit = self._lru.get(key)
+        if hit is not None:
+            self._lru.move_to_end(key)
+        return hit
+
+    def _lru_put(self, key: str, value: Dict) -> None:
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    # ---------- lookups ----------
+    def _near_lookup(self, norm: str) -> Optional[Dict]:
+        if len(norm.split()) < NEAR_DUP_MIN_TOKENS:
+            return None
+        h = simhash(norm)
+        b = _bands(h)
+        rows = self.con.execute(
+            "SELECT text_hash, simhash FROM inference_cache WHERE model_version = ? "
+            "AND (b0 = ? OR b1 = ? OR b2 = ? OR b3 = ?) "
+            "ORDER BY (b0 = ?) + (b1 = ?) + (b2 = ?) + (b3 = ?) DESC LIMIT ?",
+            (self.model_version, *b, *b, NEAR_DUP_MAX_CANDIDATES),
+        ).fetchall()
+        best = None
+        for k, sh in rows:
+            dist = bin((sh & 0xFFFFFFFFFFFFFFFF) ^ h).count("1")
+            if dist <= NEAR_DUP_MAX_DIST and (best is None or dist < best[0]):
+                best = (dist, k)
+        if best is None:
+            return None
+        res = self.con.execute("SELECT result FROM inference_cache WHERE text_hash = ? AND model_version = ?",
+                               (best[1], self.model_version)).fetchone()
+        return json.loads(res[0])
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[Dict]]:
+        out: List[Optional[Dict]] = [None] * len(texts)
+        keys = [text_hash(normalize_text(t)) for t in texts]
+        pending = {}
+        for i, k in enumerate(keys):
+            self.stats["lookups"] += 1
+            hit = self._lru_get(k)
+            if hit is not None:
+                out[i] = hit
+                self.stats["lru_hits"] += 1
+            else:
+                pending.setdefault(k, []).append(i)
+
+        uniq = list(pending)
+        for start in range(0, len(uniq), 500):
+            chunk = uniq[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = self.con.execute(
+                f"SELECT text_hash, result, simhash IS NULL FROM inference_cache "
+                f"WHERE model_version = ? AND text_hash IN ({marks})",
+                (self.model_version, *chunk),
+            ).fetchall()
+            unstamped = []
+            for k, res, no_simhash in rows:
+                if self.near_dup and no_simhash:
+                    unstamped.append(texts[pending[k][0]])
+                val = json.loads(res)
+                self._lru_put(k, val)
+                for i in pending.pop(k):
+                    out[i] = val
+                    self.stats["db_hits"] += 1
+            if unstamped:   # cached while near-dup mode was off
+                self.backfill_simhash(unstamped)
+
+        for k, idxs in pending.items():
+            val = self._near_lookup(normalize_text(texts[idxs[0]])) if self.near_dup else None
+            if val is not None:
+                self._lru_put(k, val)
+                for i in idxs:
+                    out[i] = val
+                self.stats["near_hits"] += len(idxs)
+            else:
+                self.stats["misses"] += len(idxs)
+        return out
+
+    def put_many(self, texts: Sequence[str], results: Sequence[Dict]) -> None:
+        rows = []
+        for t, res in zip(texts, results):
+            norm = normalize_text(t)
+            k = text_hash(norm)
+            self._lru_put(k, res)
+            if self.near_dup:
+                sh = simhash(norm)
+                rows.append((k, self.model_version, _signed(sh), *_bands(sh), json.dumps(res)))
+            else:
+                rows.append((k, self.model_version, None, None, None, None, None, json.dumps(res)))
+        self.con.executemany("""
+            INSERT OR REPLACE INTO inference_cache
+                (text_hash, model_version, simhash, b0, b1, b2, b3, result)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        self.con.commit()
+
+    def backfill_simhash(self, texts: Sequence[str]) -> int:
+        """Stamp SimHash + bands on cached rows of these texts that were stored without one (any model version)."""
+        rows = {}
+        for t in texts:
+            norm = normalize_text(t)
+            sh = simhash(norm)
+            rows[text_hash(norm)] = (_signed(sh), *_bands(sh))
+        cur = self.con.executemany(
+            "UPDATE inference_cache SET simhash = ?, b0 = ?, b1 = ?, b2 = ?, b3 = ? "
+            "WHERE text_hash = ? AND simhash IS NULL",
+            [(*v, k) for k, v in rows.items()],
+        )
+        self.con.commit()
+        return cur.rowcount
+
+    def unstamped(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM inference_cache WHERE simhash IS NULL").fetchone()[0]
+
+    # ---------- reporting ----------
+    def record_inference(self, n_texts: int, seconds: float) -> None:
+        self.stats["inferred"] += n_texts
+        self.stats["inference_seconds"] += seconds
+
+    def report(self) -> Dict:
+        s = dict(self.stats)
+        hits = s["lru_hits"] + s["db_hits"] + s["near_hits"]
+        per_text = s["inference_seconds"] / s["inferred"] if s["inferred"] else 0.0
+        s["hit_rate"] = round(hits / s["lookups"], 4) if s["lookups"] else 0.0
+        # rows served without models (cache hits + in-batch duplicates) x measured cost per inferred text
+        s["saved_seconds_est"] = round(max(s["lookups"] - s["inferred"], 0) * per_text, 3)
+        s["inference_seconds"] = round(s["inference_seconds"], 3)
+        return s
+
+    def close(self) -> None:
+        self.con.close()
+
+if __name__ == "__main__":
+    import argparse, sys
+    import pandas as pd
+    from sqlalchemy import text as sql
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from src import archive, queries
+    from src.db_models import get_engine
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backfill-simhash", action="store_true",
+                    help="stamp SimHash on rows cached while INFERENCE_CACHE_NEAR_DUP was off (reads reviews_raw)")
+    ap.add_argument("--page", type=int, default=10_000)
+    args = ap.parse_args()
+    cache = InferenceCache("", near_dup=True)
+    try:
+        if args.backfill_simhash and cache.unstamped():
+            after, stamped = 0, 0
+            with get_engine().connect() as conn:
+                while True:
+                    df = pd.read_sql(sql(queries.RAW_TEXT_PAGE), conn, params={"after": after, "limit": args.page})
+                    if df.empty:
+                        break
+                    df = archive.hydrate(df.rename(columns={"id": "review_id"}))
+                    stamped += cache.backfill_simhash(df["text"].fillna("").tolist())
+                    after = int(df["review_id"].iloc[-1])
+            print(f"Stamped SimHash on {stamped} cached rows.")
+        print(f"{cache.unstamped()} cached rows without SimHash.")
+    finally:
+        cache.close()
@@ -0,0 +1,141 @@
+# nlp/sentiment.py
+# Sentiment inference backends behind one callable with the transformers pipeline's output
+# format ([{"label": ..., "score": ...}, ...]):
+#   torch : eager transformers.pipeline (default)
+#   onnx  : model exported once to ONNX, dynamically quantized to int8, served by onnxruntime
+# Selected with SENTIMENT_BACKEND; tools/sentiment_backend_agreement.py compares the two.
+from __future__ import annotations
+import json
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+SENTIMENT_MODEL = os.getenv("SENTIMENT_MODEL", "cardiffnlp/twitter-roberta-base-sentiment-latest")
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "torch").lower()        # torch | onnx
+SENTIMENT_BATCH = int(os.getenv("SENTIMENT_BATCH", "32"))
+SENTIMENT_MAX_TOKENS = int(os.getenv("SENTIMENT_MAX_TOKENS", "512"))
+ONNX_MODEL_DIR = os.getenv("SENTIMENT_ONNX_DIR", "/opt/airflow/models/sentiment_onnx")
+ONNX_QUANTIZE = os.getenv("SENTIMENT_ONNX_QUANTIZE", "1") == "1"           # dynamic int8 weights
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))       # 0 = onnxruntime default (all cores)
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "1"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+META_FILE = "export.json"
+
+# ---------- export ----------
+def export_onnx(model_name: str = SENTIMENT_MODEL, out_dir: str = ONNX_MODEL_DIR,
+                quantize: bool = ONNX_QUANTIZE, opset: int = 17) -> Dict:
+    """Export the HF checkpoint to ONNX (dynamic batch/sequence axes), optionally int8-quantize it."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    sample = tok(["export sample"], return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask") if k in sample]
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[k] for k in input_names), fp32_path,
+            input_names=input_names, output_names=["logits"],
+            dynamic_axes={**{k: {0: "batch", 1: "seq"} for k in input_names}, "logits": {0: "batch"}},
+            opset_version=opset,
+        )
+    tok.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)   # keeps id2label next to the graph
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILE), weight_type=QuantType.QInt8)
+
+    meta = {
+        "model": model_name, "opset": opset, "quantized": quantize,
+        "fp32_mb": round(os.path.getsize(fp32_path) / 2**20, 1),
+    }
+    if quantize:
+        meta["int8_mb"] = round(os.path.getsize(os.path.join(out_dir, INT8_FILE)) / 2**20, 1)
+    with open(os.path.join(out_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def onnx_ready(out_dir: str = ONNX_MODEL_DIR, model_name: str = SENTIMENT_MODEL, quantize: bool = ONNX_QUANTIZE) -> bool:
+    meta_path = os.path.join(out_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    graph = INT8_FILE if quantize else FP32_FILE
+    return meta.get("model") == model_name and os.path.exists(os.path.join(out_dir, graph))
+
+# ---------- backends ----------
+class OnnxSentiment:
+    """onnxruntime session over the exported graph; same call/return shape as the pipeline."""
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, quantized: bool = ONNX_QUANTIZE,
+                 intra_op_threads: int = ONNX_INTRA_OP_THREADS, inter_op_threads: int = ONNX_INTER_OP_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = intra_op_threads
+        opts.inter_op_num_threads = max(1, inter_op_threads)
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.id2label = {int(k): v for k, v in AutoConfig.from_pretrained(model_dir).id2label.items()}
+
+    def __call__(self, texts, batch_size: int = SENTIMENT_BATCH, **kw) -> List[Dict]:
+        if isinstance(texts, str):
+            texts = [texts]
+        out: List[Dict] = []
+        for start in range(0, len(texts), max(1, batch_size)):
+            chunk = list(texts[start:start + batch_size])
+            enc = self.tokenizer(chunk, padding=True, truncation=True,
+                                 max_length=SENTIMENT_MAX_TOKENS, return_tensors="np")
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            logits = self.session.run(["logits"], feeds)[0]
+            logits = logits - logits.max(axis=1, keepdims=True)
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+            best = probs.argmax(axis=1)
+            out.extend({"label": self.id2label[int(b)], "score": float(p[b])} for b, p in zip(best, probs))
+        return out
+
+def load_sentiment(backend: str = SENTIMENT_BACKEND, model_name: str = SENTIMENT_MODEL):
+    """Callable texts -> [{"label", "score"}]; exports the ONNX graph on first use if it is missing."""
+    if backend == "onnx":
+        if not onnx_ready(ONNX_MODEL_DIR, model_name):
+            print(f"Exporting {model_name} to ONNX in {ONNX_MODEL_DIR} ...")
+            print(" ", export_onnx(model_name, ONNX_MODEL_DIR))
+        return OnnxSentiment(ONNX_MODEL_DIR)
+    if backend != "torch":
+        raise ValueError(f"Unknown SENTIMENT_BACKEND: {backend!r} (torch | onnx)")
+    from transformers import pipeline
+    return pipeline("sentiment-analysis", model=model_name)
+
+def backend_tag(backend: str = SENTIMENT_BACKEND) -> str:
+    """Part of the inference cache version: quantized scores differ slightly from the eager model's."""
+    if backend == "onnx":
+        return f"onnx-{'int8' if ONNX_QUANTIZE else 'fp32'}"
+    return "torch"
+
+def classify(model, texts: Sequence[str], batch_size: int = SENTIMENT_BATCH, tuner=None) -> List[Dict]:
+    """
+    Run a backend over texts (clipped to 512 chars like before) in batches: SENTIMENT_BATCH rows
+    each, or token-budgeted micro-batches when a src.autotune.BatchTuner is passed.
+    """
+    clipped = [(t or "")[:512] for t in texts]
+    if not clipped:
+        return []
+    if tuner is not None:
+        return tuner.map_batches(
+            clipped, lambda chunk: list(model(chunk, batch_size=len(chunk), truncation=True)),
+            max_tokens_per_text=SENTIMENT_MAX_TOKENS)
+    return list(model(clipped, batch_size=batch_size, truncation=True))
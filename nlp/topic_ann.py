@@ -0,0 +1,204 @@
+# nlp/topic_ann.py
+# Fast topic assignment for new reviews: nearest topic centroid or kNN vote over
+# labelled training embeddings, instead of BERTopic's UMAP + HDBSCAN transform path.
+from __future__ import annotations
+import logging
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+log = logging.getLogger("topic-ann")
+
+ANN_BACKEND = os.getenv("ANN_BACKEND", "auto").lower()        # auto | hnswlib | faiss | numpy
+ANN_KNN_K = int(os.getenv("ANN_KNN_K", "15"))
+ANN_MIN_SIM = float(os.getenv("ANN_MIN_SIM", "0.0"))          # below this -> outlier (-1)
+ANN_TEMPERATURE = float(os.getenv("ANN_TEMPERATURE", "0.05")) # softmax temperature for centroid probs
+
+# Reference embeddings for kNN mode, saved next to the safetensors model
+KNN_EMBEDDINGS_FILE = "knn_embeddings.npy"
+KNN_TOPICS_FILE = "knn_topics.npy"
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+# ---------- backends (all return cosine similarity, highest first) ----------
+class _NumpyIndex:
+    name = "numpy"
+
+    def __init__(self, vectors: np.ndarray, chunk: int = 2048):
+        self.vectors = vectors
+        self.chunk = chunk
+
+    def search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(self.vectors))
+        ids, sims = [], []
+        for start in range(0, len(q), self.chunk):
+            s = q[start:start + self.chunk] @ self.vectors.T
+            top = np.argpartition(-s, k - 1, axis=1)[:, :k]
+            top_s = np.take_along_axis(s, top, axis=1)
+            order = np.argsort(-top_s, axis=1)
+            ids.append(np.take_along_axis(top, order, axis=1))
+            sims.append(np.take_along_axis(top_s, order, axis=1))
+        return np.vstack(ids), np.vstack(sims)
+
+class _HnswIndex:
+    name = "hnswlib"
+
+    def __init__(self, vectors: np.ndarray):
+        import hnswlib
+        self.n = len(vectors)
+        self.index = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+        self.index.init_index(max_elements=self.n, ef_construction=200, M=16)
+        self.index.add_items(vectors, np.arange(self.n))
+
+    def search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.n)
+        self.index.set_ef(max(50, k * 2))
+        labels, dist = self.index.knn_query(q, k=k)
+        return labels.astype(np.int64), 1.0 - dist
+
+class _FaissIndex:
+    name = "faiss"
+
+    def __init__(self, vectors: np.ndarray):
+        import faiss
+        self.n = len(vectors)
+        self.index = faiss.IndexFlatIP(vectors.shape[1]) if self.n < 50_000 \
+            else faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        self.index.add(vectors)
+
+    def search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sims, ids = self.index.search(q, min(k, self.n))
+        return ids.astype(np.int64), sims
+
+def _make_backend(vectors: np.ndarray, backend: str = ANN_BACKEND):
+    order = {"auto": ["hnswlib", "faiss", "numpy"]}.get(backend, [backend])
+    for name in order:
+        try:
+            if name == "hnswlib":
+                return _HnswIndex(vectors)
+            if name == "faiss":
+                return _FaissIndex(vectors)
+            if name == "numpy":
+                return _NumpyIndex(vectors)
+        except ImportError:
+            continue
+    return _NumpyIndex(vectors)
+
+# ---------- topic index ----------
+class TopicIndex:
+    """
+    mode="centroid": vectors are topic embeddings, assign the closest topic.
+    mode="knn":      vectors are labelled training docs, assign by similarity-weighted vote.
+    """
+
+    def __init__(self, vectors: np.ndarray, topic_ids: np.ndarray, mode: str,
+                 backend: str = ANN_BACKEND, k: int = ANN_KNN_K, min_sim: float = ANN_MIN_SIM):
+        self.mode = mode
+        self.topic_ids = np.asarray(topic_ids, dtype=np.int64)
+        self.k = 1 if mode == "centroid" else max(1, k)
+        self.min_sim = min_sim
+        self.index = _make_backend(_normalize(vectors), backend)
+
+    @classmethod
+    def from_centroids(cls, topic_model, **kw) -> "TopicIndex":
+        emb = np.asarray(topic_model.topic_embeddings_)
+        offset = int(getattr(topic_model, "_outliers", 0))
+        ids = np.arange(len(emb)) - offset
+        keep = ids != -1    # outlier "centroid" is not a real cluster
+        return cls(emb[keep], ids[keep], mode="centroid", **kw)
+
+    @classmethod
+    def from_reference(cls, model_dir: str, **kw) -> "TopicIndex":
+        emb = np.load(os.path.join(model_dir, KNN_EMBEDDINGS_FILE), mmap_mode="r")
+        ids = np.load(os.path.join(model_dir, KNN_TOPICS_FILE))
+        keep = ids != -1
+        return cls(np.asarray(emb[keep]), ids[keep], mode="knn", **kw)
+
+    @property
+    def backend(self) -> str:
+        return self.index.name
+
+    def assign(self, embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        q = _normalize(embeddings)
+        if self.mode == "centroid":
+            # softmax over all centroid similarities gives a calibrated-ish probability
+            nn, sims = self.index.search(q, len(self.topic_ids))
+            top_sim = sims[:, 0]
+            z = np.exp((sims - top_sim[:, None]) / ANN_TEMPERATURE)
+            probs = 1.0 / z.sum(axis=1)
+            topics = self.topic_ids[nn[:, 0]]
+        else:
+            nn, sims = self.index.search(q, self.k)
+            votes = self.topic_ids[nn]
+            w = np.clip(sims, 0.0, None) + 1e-9
+            topics = np.empty(len(q), dtype=np.int64)
+            probs = np.empty(len(q), dtype=np.float64)
+            for i in range(len(q)):
+                uniq, inv = np.unique(votes[i], return_inverse=True)
+                score = np.bincount(inv, weights=w[i])
+                j = int(np.argmax(score))
+                topics[i] = uniq[j]
+                probs[i] = score[j] / score.sum()
+            top_sim = sims[:, 0]
+        topics = np.where(top_sim < self.min_sim, -1, topics)
+        return topics, probs.astype(np.float64)
+
+# ---------- helpers for phase 3 ----------
+def embed_documents(topic_model, docs: List[str]) -> np.ndarray:
+    return topic_model._extract_embeddings(docs, method="document", verbose=False)
+
+def save_reference(model_dir: str, embeddings: np.ndarray, topic_ids) -> None:
+    """Persist training embeddings + topics so kNN mode can be built without refitting."""
+    np.save(os.path.join(model_dir, KNN_EMBEDDINGS_FILE), np.asarray(embeddings, dtype=np.float32))
+    np.save(os.path.join(model_dir, KNN_TOPICS_FILE), np.asarray(topic_ids, dtype=np.int64))
+
+def has_reference(model_dir: str) -> bool:
+    return os.path.exists(os.path.join(model_dir, KNN_EMBEDDINGS_FILE)) and \
+        os.path.exists(os.path.join(model_dir, KNN_TOPICS_FILE))
+
+def build_index(topic_model, mode: str, model_dir: str = "") -> TopicIndex:
+    """
+    kNN needs the reference saved at training time; models migrated from a pickle or saved by
+    hand have none, so they fall back to centroids (check index.mode) until they are retrained.
+    """
+    if mode == "knn":
+        if model_dir and has_reference(model_dir):
+            return TopicIndex.from_reference(model_dir)
+        log.warning("kNN topic mode needs %s in %s; using centroid assignment until the model is retrained "
+                    "(python tools/train_topics.py --save)", KNN_EMBEDDINGS_FILE, model_dir or "<model dir>")
+    return TopicIndex.from_centroids(topic_model)
+
+def agreement_report(topic_model, index: TopicIndex, docs: List[str]) -> Dict:
+    """Compare ANN assignment against the full topic_model.transform path on the same docs."""
+    t0 = time.perf_counter()
+    full_topics, _ = topic_model.transform(docs)
+    t_full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ann_topics, ann_probs = index.assign(embed_documents(topic_model, docs))
+    t_ann = time.perf_counter() - t0
+
+    full_topics = np.asarray(full_topics, dtype=np.int64)
+    agree = full_topics == ann_topics
+    non_outlier = full_topics != -1
+    per_topic = {}
+    for tid in np.unique(full_topics):
+        m = full_topics == tid
+        per_topic[int(tid)] = {"n": int(m.sum()), "agreement": round(float(agree[m].mean()), 4)}
+    return {
+        "mode": index.mode,
+        "backend": index.backend,
+        "n_docs": len(docs),
+        "agreement": round(float(agree.mean()), 4) if len(docs) else None,
+        "agreement_non_outlier": round(float(agree[non_outlier].mean()), 4) if non_outlier.any() else None,
+        "mean_prob": round(float(ann_probs.mean()), 4) if len(docs) else None,
+        "seconds_transform": round(t_full, 3),
+        "seconds_ann": round(t_ann, 3),
+        "per_topic": per_topic,
+    }
@@ -0,0 +1,339 @@
+# nlp/topic_training.py
+# Memory-bounded BERTopic training. The corpus is never loaded whole: reviews_raw is streamed in
+# primary-key pages into a fixed-size reservoir sample (optionally stratified by source / brand /
+# product_id), embedded in batches into one preallocated float32 matrix, and only that sample is
+# fitted. Peak memory and fit time follow TOPIC_TRAIN_SAMPLE, not the table size. A disjoint
+# held-out sample is assigned in chunks afterwards for the quality report; the remaining history
+# is assigned by tools/reprocess.py --stages topics (the new model changes topics_version).
+#
+#   topic_model = new_model(embedder)
+#   embeddings, report = fit_sampled(topic_model, engine)
+from __future__ import annotations
+import heapq
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from nlp import topic_ann, topics
+from src import archive, autotune, queries
+
+TOPIC_TRAIN_SAMPLE = int(os.getenv("TOPIC_TRAIN_SAMPLE", "50000"))       # 0 = every row (still streamed)
+TOPIC_TRAIN_HOLDOUT = int(os.getenv("TOPIC_TRAIN_HOLDOUT", "2000"))      # held-out docs for the quality report
+TOPIC_TRAIN_STRATIFY = os.getenv("TOPIC_TRAIN_STRATIFY", "")             # "" | source | brand | product_id
+TOPIC_TRAIN_SEED = int(os.getenv("TOPIC_TRAIN_SEED", "42"))
+TOPIC_TRAIN_PAGE_ROWS = int(os.getenv("TOPIC_TRAIN_PAGE_ROWS", "10000"))
+TOPIC_EMBED_BATCH = int(os.getenv("TOPIC_EMBED_BATCH", "256"))
+TOPIC_ASSIGN_CHUNK = int(os.getenv("TOPIC_ASSIGN_CHUNK", "2000"))
+TOPIC_NR_TOPICS = int(os.getenv("TOPIC_NR_TOPICS", "10"))
+TOPIC_TRAIN_MAX_STRATA = int(os.getenv("TOPIC_TRAIN_MAX_STRATA", "1000"))  # refuse higher-cardinality columns
+
+STRATA_COLUMNS = ("source", "brand", "product_id")
+REPORT_FILE = "training_report.json"
+TOP_WORDS = 10
+
+# ---------- model ----------
+def new_model(embedder):
+    """Unfitted BERTopic with the pipeline's vectorizer / HDBSCAN settings."""
+    from bertopic import BERTopic
+    from hdbscan import HDBSCAN
+    from sklearn.feature_extraction.text import CountVectorizer
+    vectorizer = CountVectorizer(
+        stop_words="english",
+        min_df=2,
+        max_df=0.8,
+        ngram_range=(1, 2)
+    )
+    hdbscan_model = HDBSCAN(
+        min_cluster_size=3,
+        min_samples=1,
+        gen_min_span_tree=True,
+        prediction_data=True   # needed for transform()
+    )
+    return BERTopic(
+        embedding_model=embedder,
+        vectorizer_model=vectorizer,
+        hdbscan_model=hdbscan_model,
+        nr_topics=None
+    )
+
+# ---------- sampling ----------
+class Reservoir:
+    """
+    Uniform sample of up to `size` items from a stream of unknown length. Every item draws a
+    random key and the `size` smallest keys are kept (bottom-k), so memory stays at `size` items
+    and any prefix of items() is itself a uniform sample.
+    """
+
+    def __init__(self, size: int, rng: random.Random):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self._heap: List[Tuple[float, int, str]] = []   # (-key, arrival, item): max-heap on key
+
+    def offer(self, item: str) -> None:
+        self.seen += 1
+        if self.size <= 0:
+            return
+        key = self.rng.random()
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, (-key, self.seen, item))
+        elif key < -self._heap[0][0]:
+            heapq.heapreplace(self._heap, (-key, self.seen, item))
+
+    def items(self) -> List[str]:
+        """Sampled items, smallest key first."""
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+def stream_texts(conn, page_rows: int = TOPIC_TRAIN_PAGE_ROWS,
+                 keep: Optional[Callable[[str], bool]] = None) -> Iterator[pd.DataFrame]:
+    """reviews_raw in primary-key pages (archived text hydrated), without empty / rejected texts."""
+    after = 0
+    while True:
+        page = pd.read_sql(text(queries.RAW_TEXT_PAGE), conn, params={"after": after, "limit": page_rows})
+        if page.empty:
+            return
+        after = int(page["id"].iloc[-1])
+        page = archive.hydrate(page, id_col="id")
+        page = page[page["text"].fillna("").str.strip() != ""]
+        if keep is not None and len(page):
+            page = page[page["text"].map(keep).astype(bool)]
+        yield page
+
+def _stratum(value) -> str:
+    return "" if value is None or pd.isna(value) else str(value)
+
+def largest_remainder(weights: Dict[str, int], total: int) -> Dict[str, int]:
+    """Split total proportionally to weights; the parts sum to exactly total (small ones may get 0)."""
+    n = sum(weights.values())
+    if n <= 0 or total <= 0:
+        return {k: 0 for k in weights}
+    quotas = {k: total * w / n for k, w in weights.items()}
+    out = {k: int(q) for k, q in quotas.items()}
+    short = total - sum(out.values())
+    for k in sorted(quotas, key=lambda k: quotas[k] - out[k], reverse=True)[:short]:
+        out[k] += 1
+    return out
+
+def strata_sizes(conn, column: str, size: int, holdout: int,
+                 max_strata: int = TOPIC_TRAIN_MAX_STRATA) -> Dict[str, Tuple[int, int]]:
+    """
+    (train, holdout) docs per stratum, proportional to its row count (largest remainder), so
+    the sample stays at exactly size + holdout however many strata there are. Strata too
+    small for a share get nothing. size=0 takes every row of every stratum.
+    """
+    if column not in STRATA_COLUMNS:
+        raise ValueError(f"TOPIC_TRAIN_STRATIFY must be one of {STRATA_COLUMNS}, got {column!r}")
+    n_strata = int(conn.execute(text(f"SELECT COUNT(DISTINCT {column}) FROM reviews_raw")).scalar() or 0)
+    if n_strata > max_strata:
+        raise ValueError(f"{column} has {n_strata} distinct values (TOPIC_TRAIN_MAX_STRATA={max_strata}); "
+                         f"stratify by a coarser column")
+    counts = {_stratum(v): int(n) for v, n in
+              conn.execute(text(f"SELECT {column}, COUNT(*) FROM reviews_raw GROUP BY {column}")).fetchall()}
+    train = counts if not size else largest_remainder(counts, size)
+    held = largest_remainder(counts, holdout)
+    return {s: (train[s], held[s]) for s in counts if train[s] or held[s]}
+
+def sample_corpus(conn, size: int = TOPIC_TRAIN_SAMPLE, holdout: int = TOPIC_TRAIN_HOLDOUT,
+                  stratify: str = TOPIC_TRAIN_STRATIFY, seed: int = TOPIC_TRAIN_SEED,
+                  page_rows: int = TOPIC_TRAIN_PAGE_ROWS,
+                  keep: Optional[Callable[[str], bool]] = None) -> Tuple[List[str], List[str], Dict]:
+    """
+    (training docs, disjoint held-out docs, stats) in one streamed pass. Training docs come in
+    sample order: docs[:k] is a (stratified) sample of size k, so several sizes can be compared
+    from one pass. size=0 keeps every row.
+    """
+    rng = random.Random(seed)
+    if stratify:
+        alloc = strata_sizes(conn, stratify, size, holdout)
+    else:
+        # size=0: a reservoir as large as the table, i.e. everything
+        n = size or int(conn.execute(text("SELECT COUNT(*) FROM reviews_raw")).scalar() or 0)
+        alloc = {"": (n, holdout)}
+    pools = {s: Reservoir(t + h, rng) for s, (t, h) in alloc.items()}
+    rows_read = 0
+    for page in stream_texts(conn, page_rows, keep):
+        rows_read += len(page)
+        strata = page[stratify].map(_stratum) if stratify else [""] * len(page)
+        for s, doc in zip(strata, page["text"]):
+            pool = pools.get(s)
+            if pool is not None:   # None: no share allocated, or a value that arrived after the GROUP BY
+                pool.offer(doc)
+
+    ranked, held = [], []
+    for s, pool in pools.items():
+        items = pool.items()
+        n_train = alloc[s][0]
+        # rank / allocation interleaves the strata, so every prefix keeps their proportions
+        ranked.extend(((i + 1) / n_train, doc) for i, doc in enumerate(items[:n_train]))
+        held.extend(items[n_train:])
+    ranked.sort(key=lambda t: t[0])
+    docs = [doc for _, doc in ranked]
+    stats = {"rows_seen": rows_read, "train_docs": len(docs), "holdout_docs": len(held),
+             "stratify": stratify or None, "strata": len(pools), "seed": seed}
+    return docs, held, stats
+
+# ---------- embedding / assignment ----------
+def embed_batched(embedder, docs: Sequence[str], batch_size: int = TOPIC_EMBED_BATCH) -> np.ndarray:
+    """Encode in batches into one preallocated float32 matrix (no list of per-batch arrays)."""
+    out = None
+    for i in range(0, len(docs), batch_size):
+        chunk = list(docs[i:i + batch_size])
+        emb = np.asarray(embedder.encode(chunk, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+        if out is None:
+            out = np.empty((len(docs), emb.shape[1]), dtype=np.float32)
+        out[i:i + len(chunk)] = emb
+    return out if out is not None else np.zeros((0, 0), dtype=np.float32)
+
+def assign_chunked(topic_model, docs: Sequence[str], chunk: int = TOPIC_ASSIGN_CHUNK,
+                   batch_size: int = TOPIC_EMBED_BATCH) -> Tuple[np.ndarray, np.ndarray]:
+    """topic_model.transform over chunks of docs; returns (topic ids, max probabilities)."""
+    embedder = getattr(topic_model, "embedding_model", None)
+    embedder = getattr(embedder, "embedding_model", embedder)   # BERTopic wraps SentenceTransformer
+    ids, probs = [], []
+    for i in range(0, len(docs), chunk):
+        part = list(docs[i:i + chunk])
+        emb = embed_batched(embedder, part, batch_size) if hasattr(embedder, "encode") else None
+        t, p = topic_model.transform(part, embeddings=emb)
+        ids.append(np.asarray(t, dtype=np.int64))
+        p = np.asarray(p, dtype=np.float64)
+        probs.append(p.max(axis=1) if p.ndim == 2 else p)
+    if not ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(ids), np.concatenate(probs)
+
+# ---------- quality ----------
+def _top_words(topic_model, n: int = TOP_WORDS) -> Dict[int, List[str]]:
+    return {int(t): [w for w, _ in (words or [])[:n] if w]
+            for t, words in (topic_model.get_topics() or {}).items() if int(t) != -1}
+
+def npmi_coherence(top_words: Dict[int, List[str]], docs: Sequence[str]) -> Optional[float]:
+    """Mean NPMI of each topic's top-word pairs, from document co-occurrence in docs (-1..1)."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    vocab = sorted({w.lower() for words in top_words.values() for w in words})
+    if not vocab or not len(docs):
+        return None
+    X = CountVectorizer(vocabulary=vocab, ngram_range=(1, 2), binary=True).transform(docs)
+    n = X.shape[0]
+    co = (X.T @ X).toarray() / n
+    p = np.diag(co)
+    index = {w: i for i, w in enumerate(vocab)}
+    scores = []
+    for words in top_words.values():
+        ix = [index[w.lower()] for w in words]
+        pair = []
+        for a in range(len(ix)):
+            for b in range(a + 1, len(ix)):
+                pij = co[ix[a], ix[b]]
+                if pij <= 0:
+                    pair.append(-1.0)
+                elif pij >= 1:
+                    pair.append(1.0)
+                else:
+                    pair.append(np.log(pij / (p[ix[a]] * p[ix[b]])) / -np.log(pij))
+        if pair:
+            scores.append(float(np.mean(pair)))
+    return round(float(np.mean(scores)), 4) if scores else None
+
+def _shares(ids: np.ndarray) -> pd.Series:
+    return pd.Series(ids).value_counts(normalize=True)
+
+def quality_report(topic_model, docs: Sequence[str], topic_ids: Sequence[int],
+                   holdout: Sequence[str] = (), chunk: int = TOPIC_ASSIGN_CHUNK) -> Dict:
+    """Topic quality on the training sample, plus outliers / drift on the held-out docs."""
+    ids = np.asarray(topic_ids, dtype=np.int64)
+    words = _top_words(topic_model)
+    all_words = [w for ws in words.values() for w in ws]
+    report = {
+        "n_topics": len(words),
+        "outlier_ratio": round(float((ids == -1).mean()), 4) if len(ids) else None,
+        "largest_topic_share": round(float(_shares(ids[ids != -1]).max()), 4) if (ids != -1).any() else None,
+        "topic_diversity": round(len(set(all_words)) / len(all_words), 4) if all_words else None,
+        "npmi_coherence": npmi_coherence(words, docs),
+    }
+    if len(holdout):
+        t0 = time.perf_counter()
+        h_ids, h_probs = assign_chunked(topic_model, holdout, chunk)
+        train_s, hold_s = _shares(ids), _shares(h_ids)
+        idx = train_s.index.union(hold_s.index)
+        a = train_s.reindex(idx, fill_value=0).to_numpy()
+        b = hold_s.reindex(idx, fill_value=0).to_numpy()
+        m = (a + b) / 2
+        kl = lambda x: float(np.sum(np.where(x > 0, x * np.log2(np.where(x > 0, x, 1) / np.where(m > 0, m, 1)), 0)))
+        report.update({
+            "holdout_outlier_ratio": round(float((h_ids == -1).mean()), 4),
+            "holdout_mean_prob": round(float(np.mean(h_probs)), 4),
+            # 0 = held-out docs spread over the topics exactly like the sample, 1 = disjoint
+            "holdout_js_distance": round(float(np.sqrt(max(0.0, (kl(a) + kl(b)) / 2))), 4),
+            "holdout_assign_s": round(time.perf_counter() - t0, 2),
+        })
+    return report
+
+# ---------- training ----------
+def fit_on(topic_model, docs: List[str], embeddings: np.ndarray, nr_topics: int = TOPIC_NR_TOPICS) -> Dict:
+    """Fit + reduce on an in-memory sample; returns timings."""
+    t0 = time.perf_counter()
+    topic_model.fit(docs, embeddings)
+    if nr_topics:
+        topic_model.reduce_topics(docs, nr_topics=nr_topics)  # force more diversity
+    return {"fit_s": round(time.perf_counter() - t0, 2)}
+
+def fit_sampled(topic_model, engine, size: int = TOPIC_TRAIN_SAMPLE, holdout: int = TOPIC_TRAIN_HOLDOUT,
+                stratify: str = TOPIC_TRAIN_STRATIFY, seed: int = TOPIC_TRAIN_SEED,
+                keep: Optional[Callable[[str], bool]] = None) -> Optional[Tuple[np.ndarray, Dict]]:
+    """
+    Sample, embed and fit topic_model in place. Returns (training embeddings, report), or None
+    when reviews_raw has nothing to train on.
+    """
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        docs, held, stats = sample_corpus(conn, size, holdout, stratify, seed, keep=keep)
+    if not docs:
+        return None
+    report = {"sample": stats, "sample_s": round(time.perf_counter() - t0, 2)}
+    t0 = time.perf_counter()
+    embeddings = embed_batched(topic_model.embedding_model, docs)
+    report["embed_s"] = round(time.perf_counter() - t0, 2)
+    report["embeddings_mb"] = round(embeddings.nbytes / 2**20, 1)
+    report.update(fit_on(topic_model, docs, embeddings))
+    report["quality"] = quality_report(topic_model, docs, topic_model.topics_, held)
+    report["rss_mb"] = round(autotune.rss_mb(), 1)
+    return embeddings, report
+
+def save_report(model_dir: str, report: Dict) -> None:
+    """Next to the model files; not part of topics.model_version()."""
+    with open(os.path.join(model_dir, REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+def save_model_dir(topic_model, embeddings, report: Dict, model_dir: str) -> None:
+    """
+    Write the complete model (BERTopic files, ANN reference, report) to a sibling directory and
+    only then swap it in, so a failed save leaves the live model untouched and no stale
+    reference / report from the old model survives.
+    """
+    parent = os.path.dirname(os.path.abspath(model_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{os.path.basename(model_dir)}.new-", dir=parent)
+    os.chmod(tmp, 0o755)   # mkdtemp is owner-only; other services (dashboard, Airflow workers) read the model
+    try:
+        topics.save_model(topic_model, tmp)
+        topic_ann.save_reference(tmp, embeddings, topic_model.topics_)
+        save_report(tmp, report)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    old = None
+    if os.path.isdir(model_dir):
+        # a directory can't be os.replace()d over a non-empty one: move the old model aside first
+        old = tempfile.mkdtemp(prefix=f".{os.path.basename(model_dir)}.old-", dir=parent)
+        os.replace(model_dir, os.path.join(old, "model"))
+    os.replace(tmp, model_dir)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,125 @@
+# nlp/topics.py
+# BERTopic persistence (safetensors) + cached, vectorized topic labels.
+from __future__ import annotations
+import hashlib
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# Lightweight reference saved alongside the model instead of pickling the encoder.
+EMBEDDING_MODEL = os.getenv("BERTOPIC_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# --- Junk words to filter out of topic labels ---
+JUNK_WORDS = {
+    # basic stopwords
+    "the","a","an","is","are","was","were","be","been","do","did","does",
+    "at","in","on","with","to","from","of","by","about","into","over","under",
+    "so","very","much","many","few","more","most","some","any","all","every",
+    "can","could","should","would","will","may","might","must",
+
+    # casual / reddit filler
+    "lol","haha","omg","damn","bro","dude","hey","hi","hello",
+    "pls","please","thanks","thank","thx","yep","yeah","nope","ok","okay",
+    "idk","imo","imho","btw","wtf","smh","lmao","rofl",
+
+    # tech filler
+    "app","apps","update","version","feature","features","option","options",
+    "thing","stuff","item","items","product","products","device","devices",
+    "model","models","series","line","brand","brands",
+
+    # short tokens
+    "nah","yup","wow","ugh","meh","ayy","ehh",
+
+    # from your list
+    "not","and","but","you","your","this","pro","for","new","one","get",
+    "just","like","iphone","phone","message","read"
+}
+
+MISC_LABEL = "Misc"
+
+# Files written by BERTopic.save(serialization="safetensors") that define the topics.
+_VERSION_FILES = ("topics.json", "config.json", "ctfidf_config.json")
+
+def clean_topic_label(words: List[Tuple[str, float]] | None) -> str:
+    """Turn BERTopic's (word, weight) list into a short human label."""
+    if not words:
+        return MISC_LABEL
+    clean_words = [w for w, _ in words if w.lower() not in JUNK_WORDS and len(w) > 2]
+    if not clean_words:
+        return words[0][0]
+    return " ".join(clean_words[:3])
+
+# ---------- persistence ----------
+def save_model(topic_model, model_dir: str, embedding_model: str = EMBEDDING_MODEL) -> None:
+    os.makedirs(model_dir, exist_ok=True)
+    topic_model.save(
+        model_dir,
+        serialization="safetensors",
+        save_ctfidf=True,
+        save_embedding_model=embedding_model,
+    )
+
+def load_model(model_dir: str, embedding_model: str = EMBEDDING_MODEL):
+    from bertopic import BERTopic
+    return BERTopic.load(model_dir, embedding_model=embedding_model)
+
+def model_version(model_dir: str) -> str:
+    """Content fingerprint of a saved model directory (changes on every retrain)."""
+    h = hashlib.sha1()
+    for name in _VERSION_FILES:
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()[:12]
+
+# ---------- topic_id -> label table ----------
+def build_label_table(topic_model) -> Dict[int, str]:
+    labels = {}
+    reps = getattr(topic_model, "topic_representations_", None) or {}
+    for tid, words in reps.items():
+        tid = int(tid)
+        labels[tid] = MISC_LABEL if tid == -1 else clean_topic_label(words)
+    return labels
+
+def ensure_label_table(conn) -> None:
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS topic_labels (
+            model_version TEXT NOT NULL,
+            topic_id INTEGER NOT NULL,
+            topic_label TEXT,
+            PRIMARY KEY (model_version, topic_id)
+        )
+    """))
+
+def load_topic_labels(conn, topic_model, version: str) -> pd.Series:
+    """
+    Return a topic_id -> label Series for this model version.
+    Labels are computed once per version and persisted in `topic_labels`.
+    `conn` is a SQLAlchemy connection (SQLite or Postgres).
+    """
+    ensure_label_table(conn)
+    rows = conn.execute(
+        text("SELECT topic_id, topic_label FROM topic_labels WHERE model_version = :v"), {"v": version}
+    ).fetchall()
+    if not rows and version == "untrained":
+        conn.commit()
+        return pd.Series(build_label_table(topic_model), dtype=object)
+    if not rows:
+        table = build_label_table(topic_model)
+        if table:
+            conn.execute(text("""
+                INSERT INTO topic_labels (model_version, topic_id, topic_label)
+                VALUES (:v, :t, :l)
+                ON CONFLICT (model_version, topic_id) DO UPDATE SET topic_label = excluded.topic_label
+            """), [{"v": version, "t": tid, "l": lab} for tid, lab in table.items()])
+        rows = list(table.items())
+    conn.commit()
+    return pd.Series({int(t): l for t, l in rows}, dtype=object)
+
+def label_topics(topic_ids: Iterable[int], labels: pd.Series) -> np.ndarray:
+    """Vectorized lookup; unknown ids fall back to Misc."""
+    return pd.Series(np.asarray(list(topic_ids), dtype=np.int64)).map(labels).fillna(MISC_LABEL).to_numpy()
@@ -0,0 +1,101 @@
+# nlp/triage.py
+# Cheap pre-filter in front of the phase-3 models: length / character heuristics, a compiled
+# boilerplate matcher and a dependency-free language check. triage() returns a reason code for
+# text that is not worth a model call (phase 3 stores a default result with that reason), or
+# None for text that goes on to the models. A triaged row drops out of the dashboard KPIs, so
+# every rule errs towards keeping: terse English reviews ("Great phone!", keyword lists without
+# function words) must reach the models.
+from __future__ import annotations
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+TRIAGE_MIN_CHARS = int(os.getenv("TRIAGE_MIN_CHARS", "6"))
+TRIAGE_MIN_WORDS = int(os.getenv("TRIAGE_MIN_WORDS", "2"))                 # one-word replies only
+TRIAGE_MIN_ALPHA_RATIO = float(os.getenv("TRIAGE_MIN_ALPHA_RATIO", "0.5"))   # letters / non-space chars
+TRIAGE_LANG = os.getenv("TRIAGE_LANG", "en").lower()                        # en | off
+TRIAGE_MIN_FOREIGN_WORDS = int(os.getenv("TRIAGE_MIN_FOREIGN_WORDS", "4"))  # one language's function words
+
+REASONS = ["empty", "url_only", "boilerplate", "too_short", "no_text", "non_english"]
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+|\[[^\]]*\]\([^)]*\)", re.I)   # plain links + markdown links
+_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?", re.UNICODE)
+_BOILERPLATE_RE = re.compile(
+    r"^\s*\[(?:deleted|removed)\]\s*$"
+    r"|i am a bot|this action was performed automatically|beep boop"
+    r"|^\s*!?remindme\b"
+    r"|please contact the moderators of this subreddit"
+    r"|your (?:post|comment|submission) (?:has been|was) removed"
+    r"|^\s*(?:this|same|lol|lmao|thanks?(?: you)?|\+1|agreed|ok(?:ay)?|yes|no|nice|wow)\W*$",
+    re.I,
+)
+# Most frequent English function words
+_EN_WORDS = frozenset("""
+    the a an and or but if of to in on at for with from by as is are was were be been it its this that
+    i you he she we they my your our their me him her them not no do does did have has had can could will
+    would should just so very too what which who when where how all any some more than then there here
+""".split())
+# Function words of the languages most often mixed into these subreddits. Latin-script text only
+# counts as non-English when one of these lists clearly outnumbers the English words: the absence
+# of English function words alone says nothing ("Battery life excellent, screen bright").
+# Words that are also English (or brand / spec vocabulary) are left out.
+_FOREIGN_WORDS = {
+    "es": "el la los las del y que es por para con una uno muy pero como está esta este mi tu su se lo más "
+          "porque cuando también tengo tiene sin sobre hay",
+    "pt": "o os as da do das dos e que é um uma com não para por mais muito mas como está meu minha "
+          "tem também quando isso",
+    "fr": "le la les des du et est une un que qui pour pas avec sur mais je tu il elle nous vous très "
+          "dans ce cette mon ma sont être",
+    "de": "der die das und ist nicht ein eine ich du er sie wir mit auf für aber sehr auch zu den dem "
+          "von sich nur noch wie",
+    "it": "il lo la gli le di che è e per non una un con sono ma molto anche questo questa mio del della",
+    "nl": "de het een en is niet van ik je dat met op voor maar zijn ook heel dit deze",
+}
+_FOREIGN_WORDS = {lang: frozenset(w for w in ws.split() if w not in _EN_WORDS and w not in {"die", "den"})
+                  for lang, ws in _FOREIGN_WORDS.items()}
+
+def _latin_ratio(letters: str) -> float:
+    return sum(1 for ch in letters if ch < "ɐ") / max(len(letters), 1)   # Basic Latin .. IPA block
+
+def triage(text: Optional[str]) -> Optional[str]:
+    """Reason code for junk / non-English text, None if the text should go to the models."""
+    if not text or not text.strip():
+        return "empty"
+    stripped = _URL_RE.sub(" ", text).strip()
+    if not stripped:
+        return "url_only"
+    if _BOILERPLATE_RE.search(text):
+        return "boilerplate"
+    chars = [ch for ch in stripped if not ch.isspace()]
+    letters = "".join(ch for ch in chars if ch.isalpha())
+    if TRIAGE_LANG == "en" and letters and _latin_ratio(letters) < 0.7:
+        return "non_english"   # mostly non-Latin script
+    words = _WORD_RE.findall(stripped)
+    if len(stripped) < TRIAGE_MIN_CHARS or len(words) < TRIAGE_MIN_WORDS:
+        return "too_short"
+    if len(letters) / max(len(chars), 1) < TRIAGE_MIN_ALPHA_RATIO:
+        return "no_text"   # emoji / symbols / numbers
+    if TRIAGE_LANG == "en" and _foreign_language(words):
+        return "non_english"
+    return None
+
+def _foreign_language(words: List[str]) -> Optional[str]:
+    """A language whose function words clearly dominate (well over the English ones), else None."""
+    lower = [w.lower() for w in words]
+    en = sum(1 for w in lower if w in _EN_WORDS)
+    best, hits = None, 0
+    for lang, vocab in _FOREIGN_WORDS.items():
+        n = sum(1 for w in lower if w in vocab)
+        if n > hits:
+            best, hits = lang, n
+    if hits >= TRIAGE_MIN_FOREIGN_WORDS and hits >= 2 * (en + 1):
+        return best
+    return None
+
+def triage_many(texts: Sequence[Optional[str]]) -> List[Optional[str]]:
+    return [triage(t) for t in texts]
+
+def summarize(reasons: Sequence[Optional[str]]) -> Dict[str, int]:
+    c = Counter(r for r in reasons if r)
+    return {r: c[r] for r in REASONS if c[r]}
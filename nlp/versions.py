@@ -0,0 +1,28 @@
+# nlp/versions.py
+# Per-stage version fingerprints stamped on every reviews_processed row (<stage>_version columns).
+# A fingerprint changes whenever anything that shapes a stage's output changes (model name,
+# backend, lexicon, thresholds), so tools/reprocess.py can find and recompute just the rows and
+# stages an upgrade made stale instead of the whole history.
+from __future__ import annotations
+import hashlib
+import json
+
+# stage -> reviews_processed columns it produces (aspect_sentiment writes review_aspect_sentiment)
+STAGE_FIELDS = {
+    "aspects": ["aspects", "aspect_csv"],
+    "sentiment": ["sentiment_label", "score", "score_signed"],
+    "topics": ["topic_id", "topic_prob", "topic_label", "topic_source"],
+    "aspect_sentiment": [],
+}
+STAGES = list(STAGE_FIELDS)
+
+def column(stage: str) -> str:
+    return f"{stage}_version"
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:12]
+
+def lexicon_fingerprint() -> str:
+    """Changes with any edit to nlp.aspects.LEXICON (aspect names or patterns)."""
+    from nlp.aspects import LEXICON
+    return fingerprint(json.dumps(LEXICON, sort_keys=True))
@@ -0,0 +1,239 @@
+# realtime/ingest_reddit_service.py
+# Long-running Reddit ingestion: one consumer thread per subreddit group polls /r/<group>/comments,
+# all consumers share one token bucket (the client id's request quota), and kept comments go
+# through the bounded DBWriter queue in batches. Each subreddit's newest committed comment id is
+# checkpointed, so a restart resumes where the last run stopped instead of re-reading the buffer.
+#
+#   python realtime/ingest_reddit_service.py                          # runs until SIGTERM / Ctrl+C
+#   REDDIT_SUBREDDIT_GROUPS="iphone,ipad;Android,GooglePixel;gadgets" python realtime/ingest_reddit_service.py
+#   python realtime/ingest_reddit_service.py --max-runtime-s 60       # e.g. against tools/fake_reddit_api.py
+
+import os, sys, json, time, signal, argparse, threading, logging
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.db_models import Review, init_db
+from src.db_writer import DBWriter, WRITER_BATCH_ROWS, WRITER_FLUSH_MS
+from src.rate_limit import TokenBucket
+from realtime.ingest_reddit_stream import (
+    SUBREDDITS, MATCH_MODE, comment_record, create_reddit, make_trigger, should_keep,
+)
+
+log = logging.getLogger("reddit-service")
+
+# ---------- knobs ----------
+# ";"-separated groups of ","-separated subreddits (same format as DAG_REDDIT_GROUPS); default: one per subreddit
+GROUPS = [
+    [s.strip() for s in g.split(",") if s.strip()]
+    for g in os.getenv("REDDIT_SUBREDDIT_GROUPS", ";".join(SUBREDDITS)).split(";") if g.strip()
+]
+RATE_PER_MIN = float(os.getenv("REDDIT_RATE_PER_MIN", "90"))     # Reddit allows 100 QPM per OAuth client
+RATE_BURST = int(os.getenv("REDDIT_RATE_BURST", "5"))
+POLL_INTERVAL_S = float(os.getenv("REDDIT_POLL_INTERVAL_S", "10"))  # per group, when it is caught up
+CATCHUP_PAGES = int(os.getenv("REDDIT_CATCHUP_PAGES", "5"))      # max 100-comment pages per poll
+HANDOFF_QUEUE = int(os.getenv("REDDIT_HANDOFF_QUEUE", "64"))     # pages in flight to the writer; consumers block when full
+BATCH_ROWS = int(os.getenv("REDDIT_BATCH_ROWS", str(WRITER_BATCH_ROWS)))
+BATCH_MS = int(os.getenv("REDDIT_BATCH_MS", str(WRITER_FLUSH_MS)))
+CHECKPOINT_PATH = os.getenv("REDDIT_CHECKPOINT_PATH", "data/reddit_checkpoints.json")
+CHECKPOINT_EVERY_S = float(os.getenv("REDDIT_CHECKPOINT_EVERY_S", "5"))
+STATS_EVERY_S = float(os.getenv("REDDIT_STATS_EVERY_S", "60"))
+
+PAGE = 100   # listing page size; one API request per page
+
+def _id36(comment_id: str) -> int:
+    # comment ids are base36 and handed out in creation order across all of Reddit
+    return int(comment_id, 36)
+
+# ---------- checkpoints ----------
+class Checkpoints:
+    """Newest committed comment id per subreddit, persisted atomically to a JSON file."""
+
+    def __init__(self, path: str = CHECKPOINT_PATH, save_every_s: float = CHECKPOINT_EVERY_S):
+        self.path = path
+        self.save_every_s = save_every_s
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self.state: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def cursor(self, group: List[str]) -> int:
+        # a combined listing is only "seen" up to the least advanced member
+        with self._lock:
+            ids = [self.state.get(s.lower(), {}).get("last_id") for s in group]
+        return 0 if not all(ids) else min(_id36(i) for i in ids)
+
+    def advance(self, group: List[str], last_id: str, created_utc: float) -> None:
+        with self._lock:
+            for s in group:
+                cur = self.state.get(s.lower())
+                if cur and _id36(cur["last_id"]) >= _id36(last_id):
+                    continue
+                self.state[s.lower()] = {
+                    "last_id": last_id,
+                    "last_created_utc": created_utc,
+                    "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                }
+                self._dirty = True
+            due = self._dirty and time.monotonic() - self._saved_at >= self.save_every_s
+        if due:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)   # a crash mid-write never leaves a truncated checkpoint
+            self._dirty, self._saved_at = False, time.monotonic()
+
+# ---------- consumers ----------
+def fetch_new(subreddit, cursor: int, bucket: TokenBucket, stop: threading.Event) -> Tuple[list, bool]:
+    """
+    Comments newer than `cursor`, oldest first, spending one token per listing page.
+    Returns (comments, caught_up); caught_up is False when CATCHUP_PAGES ran out first (a gap).
+    A fetch cut short by `stop` returns no comments: the pages read so far are only the newest ones,
+    and committing past them would skip the rest.
+    """
+    new = []
+    limit = PAGE * max(1, CATCHUP_PAGES)
+    it = iter(subreddit.comments(limit=limit))
+    i = 0
+    while True:
+        if i % PAGE == 0 and i < limit and not bucket.acquire(stop=stop):   # next item triggers the next request
+            return [], True
+        try:
+            c = next(it)
+        except StopIteration:
+            break
+        i += 1
+        if _id36(c.id) <= cursor:
+            return new[::-1], True
+        new.append(c)
+    return new[::-1], cursor == 0 or i < limit
+
+def consume(group: List[str], reddit, bucket: TokenBucket, writer: DBWriter, checkpoints: Checkpoints,
+            on_commit, stop: threading.Event, stats: Dict[str, int]) -> None:
+    sr_name = "+".join(group)
+    subreddit = reddit.subreddit(sr_name)
+    cursor = checkpoints.cursor(group)
+    backoff = POLL_INTERVAL_S
+    log.info("Consumer %s starting from %s", sr_name, "checkpoint" if cursor else "Reddit's buffer")
+
+    while not stop.is_set():
+        try:
+            comments, caught_up = fetch_new(subreddit, cursor, bucket, stop)
+        except Exception as e:
+            stats["errors"] += 1
+            log.warning("Poll of %s failed: %s (retry in %.0fs)", sr_name, e, backoff)
+            stop.wait(backoff)
+            backoff = min(backoff * 2, 300)
+            continue
+        if stop.is_set():
+            break   # shutting down: leave the cursor where it is, the next run catches up from the checkpoint
+        backoff = POLL_INTERVAL_S
+        stats["polls"] += 1
+        if not caught_up:
+            stats["gaps"] += 1
+            log.warning("%s: more than %d pages behind, older comments were skipped", sr_name, CATCHUP_PAGES)
+
+        if comments:
+            rows = []
+            for c in comments:
+                body = c.body or ""
+                # link_title comes with the listing; comment.submission.title would cost a request each
+                if not should_keep(body, getattr(c, "link_title", "") or ""):
+                    continue
+                rec = comment_record(c, body)
+                if rec:
+                    rows.append(rec)
+            last = comments[-1]
+            cursor = _id36(last.id)
+            stats["seen"] += len(comments)
+            stats["kept"] += len(rows)
+            # also submitted when empty so the checkpoint moves past filtered-out comments in order
+            fut = writer.submit(Review.__table__, rows, conflict_cols=["source_id"])
+            fut.add_done_callback(lambda f, last=last: on_commit(group, last, f))
+
+        if caught_up:
+            stop.wait(POLL_INTERVAL_S)
+
+# ---------- service ----------
+def run(groups: List[List[str]] = GROUPS, max_runtime_s: float = 0, checkpoint_path: str = CHECKPOINT_PATH):
+    init_db()
+    checkpoints = Checkpoints(checkpoint_path)
+    bucket = TokenBucket(RATE_PER_MIN / 60.0, RATE_BURST)
+    writer = DBWriter(batch_rows=BATCH_ROWS, flush_ms=BATCH_MS, queue_size=HANDOFF_QUEUE)
+    trigger = make_trigger(writer)
+    stop = threading.Event()
+    stats = {"+".join(g): {"polls": 0, "seen": 0, "kept": 0, "gaps": 0, "errors": 0} for g in groups}
+
+    def on_commit(group, last, fut):
+        # runs on the writer thread once the page's rows are committed; futures resolve in submit order
+        if fut.exception() is not None:
+            return   # checkpoint stays behind; the rows are fetched again on restart
+        checkpoints.advance(group, last.id, float(getattr(last, "created_utc", 0) or 0))
+        if trigger and fut.result():
+            trigger.notify(fut.result())
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    log.info("Reddit service: %d consumers %s | %.0f req/min shared | match=%s",
+             len(groups), ["+".join(g) for g in groups], RATE_PER_MIN, MATCH_MODE)
+    consumers = [
+        threading.Thread(
+            target=consume, name=f"reddit-{'+'.join(g)}", daemon=True,
+            args=(g, create_reddit(), bucket, writer, checkpoints, on_commit, stop, stats["+".join(g)]),
+        )
+        for g in groups   # one praw instance per thread; praw objects are not thread-safe
+    ]
+    for t in consumers:
+        t.start()
+
+    started = last_stats = time.monotonic()
+    try:
+        while not stop.is_set():
+            stop.wait(1.0)
+            now = time.monotonic()
+            if max_runtime_s and now - started >= max_runtime_s:
+                log.info("Max runtime of %.0fs reached, stopping.", max_runtime_s)
+                stop.set()
+            if now - last_stats >= STATS_EVERY_S:
+                log.info("Stats: %s | bucket=%s | writer=%s", stats, bucket.stats, writer.stats)
+                last_stats = now
+    finally:
+        stop.set()
+        for t in consumers:
+            t.join(timeout=30)   # a consumer may be mid-request
+        writer.flush()           # commits what is queued; callbacks advance checkpoints and notify the trigger
+        if trigger:
+            trigger.close()
+        writer.close()
+        checkpoints.save()
+        log.info("Reddit service stopped: %s | bucket=%s | writer=%s", stats, bucket.stats, writer.stats)
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--groups", help='override REDDIT_SUBREDDIT_GROUPS, e.g. "iphone,ipad;gadgets"')
+    ap.add_argument("--max-runtime-s", type=float, default=0, help="stop after this long (0 = run until signalled)")
+    ap.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    args = ap.parse_args()
+
+    groups = GROUPS
+    if args.groups:
+        groups = [[s.strip() for s in g.split(",") if s.strip()] for g in args.groups.split(";") if g.strip()]
+    run(groups, args.max_runtime_s, args.checkpoint)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # realtime/ingest_reddit_stream.py
-# Stream comments until a fixed number (default 50), processing every M new saved rows.
+# Stream comments until a fixed number (default 50); new rows are processed in the background
+# every M saved rows or T ms (src/process_trigger.py).
 # Uses Reddit's own buffer instead of explicit backfill.
 
 import os, re, sys, time, logging
@@ -10,13 +11,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from dotenv import load_dotenv
 import praw
-from src.db_models import SessionLocal, Review, init_db
-
-# Optional: trigger the mini NLP pipeline after each mini-batch
-try:
-    from realtime.process_new import main as process_batch
-except Exception:
-    process_batch = None
+from sqlalchemy import select
+from src.db_models import Review, get_read_engine, init_db
+from src.db_writer import DBWriter
+from src.process_trigger import ProcessTrigger, load_processor
 
 # ---------- logging ----------
 logging.basicConfig(
@@ -31,6 +29,9 @@ load_dotenv()
 CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 UA = os.getenv("REDDIT_USER_AGENT", "aspect-sentiment-bi/0.1")
+# Point praw at another host (e.g. tools/fake_reddit_api.py) for local testing
+OAUTH_URL = os.getenv("REDDIT_OAUTH_URL")     # API host, default https://oauth.reddit.com
+REDDIT_URL = os.getenv("REDDIT_URL")          # token endpoint host, default https://www.reddit.com
 
 SUBREDDITS = [
     s.strip() for s in os.getenv("REDDIT_SUBREDDITS", "iphone,Android,gadgets").split(",") if s.strip()
@@ -78,7 +79,8 @@ if MATCH_MODE not in {"AND", "OR"}:
     MATCH_MODE = "AND"
 
 # knobs
-REALTIME_BATCH = int(os.getenv("REDDIT_REALTIME_BATCH", "5"))      # process after this many
+REALTIME_BATCH = int(os.getenv("REDDIT_REALTIME_BATCH", "100"))    # process after this many (0 = off)
+REALTIME_FLUSH_MS = int(os.getenv("REDDIT_REALTIME_FLUSH_MS", "5000"))  # ...or once the oldest waited this long
 STREAM_COMMENTS = int(os.getenv("REDDIT_STREAM_COMMENTS", "50"))  # stop after N comments (default 50)
 
 def _compile_or(words: List[str]) -> Optional[re.Pattern]:
@@ -99,50 +101,66 @@ def create_reddit() -> praw.Reddit:
     if not CLIENT_ID or not CLIENT_SECRET or not UA:
         log.error("Missing Reddit credentials. Check .env")
         sys.exit(1)
-    return praw.Reddit(client_id=CLIENT_ID, client_secret=CLIENT_SECRET, user_agent=UA)
+    urls = {k: v for k, v in (("oauth_url", OAUTH_URL), ("reddit_url", REDDIT_URL)) if v}
+    return praw.Reddit(client_id=CLIENT_ID, client_secret=CLIENT_SECRET, user_agent=UA, **urls)
 
 # ---------- DB insert helper ----------
-def save_comment(session: SessionLocal, comment, body: str, title: str) -> bool:
+def already_saved(source_id: str) -> bool:
+    # read-only connection: never waits on the writer thread (WAL)
+    with get_read_engine().connect() as conn:
+        q = select(Review.id).where(Review.source == "reddit", Review.source_id == source_id)
+        return conn.execute(q).first() is not None
+
+def comment_record(comment, body: str) -> Optional[dict]:
+    """reviews_raw row for a comment, or None for bots / empty bodies."""
     author = str(comment.author) if comment.author else "[deleted]"
     a = author.lower()
 
     if a.endswith("bot") or a in {"automoderator", "bot"}:
-        return False
+        return None
     if not body or not body.strip():
-        return False
-
-    exists = session.query(Review.id).filter_by(source="reddit", source_id=comment.id).first()
-    if exists:
-        return False
+        return None
 
-    url = f"https://www.reddit.com{comment.permalink}"
-    rec = Review(
+    return dict(
         source="reddit",
         source_id=comment.id,
         author=author,
         text=body,
-        url=url,
+        url=f"https://www.reddit.com{comment.permalink}",
     )
-    session.add(rec)
-    session.commit()
-    log.info("Saved %s | u/%s | %s", comment.id, author, url)
+
+def save_comment(writer: DBWriter, comment, body: str, title: str) -> bool:
+    rec = comment_record(comment, body)
+    if rec is None or already_saved(comment.id):
+        return False
+
+    # queued for the writer thread; ON CONFLICT covers a duplicate still in flight
+    writer.submit(Review.__table__, [rec], conflict_cols=["source_id"])
+    log.info("Saved %s | u/%s | %s", comment.id, rec["author"], rec["url"])
     return True
 
 # ---------- Stream until N comments ----------
-def stream_and_process(reddit, session, max_comments: int = STREAM_COMMENTS):
+def make_trigger(writer: DBWriter) -> Optional[ProcessTrigger]:
+    if REALTIME_BATCH <= 0:
+        return None
+    # phase 3 by default (REALTIME_PROCESSOR); imported here so only a processing ingestor loads the models
+    process_batch = load_processor()
+    if process_batch is None:
+        return None
+    # processing runs on the trigger's thread; the stream keeps going meanwhile
+    return ProcessTrigger(process_batch, REALTIME_BATCH, REALTIME_FLUSH_MS, before=writer.flush)
+
+def stream_and_process(reddit, writer, trigger: Optional[ProcessTrigger] = None,
+                       max_comments: int = STREAM_COMMENTS):
     sr = "+".join(SUBREDDITS) if SUBREDDITS else "all"
     log.info("Streaming from: %s | match=%s | keywords=%s | products=%s",
              sr, MATCH_MODE, len(KEYWORDS), len(PRODUCT_TERMS))
 
-    saved_since_last_process = 0
     total_saved = 0
 
     # Use skip_existing=False → pulls Reddit's buffer first, then live
     stream = reddit.subreddit(sr).stream.comments(skip_existing=False)
     for comment in stream:
-        if total_saved >= max_comments:
-            log.info("Reached %d comments, stopping stream.", max_comments)
-            break
         try:
             body = comment.body or ""
             try:
@@ -151,36 +169,35 @@ def stream_and_process(reddit, session, max_comments: int = STREAM_COMMENTS):
                 title = ""
             if not should_keep(body, title):
                 continue
-            if save_comment(session, comment, body, title):
-                saved_since_last_process += 1
+            if save_comment(writer, comment, body, title):
                 total_saved += 1
-
-            if REALTIME_BATCH > 0 and saved_since_last_process >= REALTIME_BATCH:
-                if process_batch:
-                    log.info("Processing mini-batch of %d new rows...", saved_since_last_process)
-                    try:
-                        process_batch()
-                    except Exception as e:
-                        log.warning("Processing error: %s", e)
-                saved_since_last_process = 0
+                if trigger:
+                    trigger.notify()
         except KeyboardInterrupt:
             raise
         except Exception as e:
             log.warning("Error handling comment: %s", e)
-            session.rollback()
             time.sleep(1)
+        # checked right after a save: a quiet stream may not yield another comment for a long time
+        if total_saved >= max_comments:
+            log.info("Reached %d comments, stopping stream.", max_comments)
+            break
+    return total_saved
 
 def main():
     init_db()
     reddit = create_reddit()
-    session = SessionLocal()
+    writer = DBWriter()
+    trigger = make_trigger(writer)
     try:
-        stream_and_process(reddit, session)
+        stream_and_process(reddit, writer, trigger)
     except KeyboardInterrupt:
         log.info("Shutting down (Ctrl+C).")
     finally:
-        session.close()
-        log.info("DB session closed.")
+        if trigger:
+            trigger.close()   # processes whatever is still pending
+        writer.close()
+        log.info("DB writer closed.")
 
 if __name__ == "__main__":
     main()
@@ -6,13 +6,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from dotenv import load_dotenv
 from googleapiclient.discovery import build
-from src.db_models import SessionLocal, Review, init_db
-
-# Optional: trigger the processing step after each mini-batch
-try:
-    from realtime.process_new import main as process_batch
-except Exception:
-    process_batch = None
+from sqlalchemy import select
+from src.db_models import Review, get_read_engine, init_db
+from src.db_writer import DBWriter
+from src.process_trigger import ProcessTrigger, load_processor
 
 # ---------- logging ----------
 logging.basicConfig(
@@ -41,9 +38,11 @@ if MATCH_MODE not in {"AND", "OR"}:
 
 BACKFILL_TOTAL   = int(os.getenv("YOUTUBE_BACKFILL_TOTAL", "20"))
 OVERSAMPLE       = int(os.getenv("YOUTUBE_BACKFILL_OVERSAMPLE", "8"))
-REALTIME_BATCH   = int(os.getenv("YOUTUBE_REALTIME_BATCH", "5"))
+REALTIME_BATCH   = int(os.getenv("YOUTUBE_REALTIME_BATCH", "100"))      # process after this many (0 = off)
+REALTIME_FLUSH_MS = int(os.getenv("YOUTUBE_REALTIME_FLUSH_MS", "5000"))  # ...or once the oldest waited this long
 POLL_SECONDS     = int(os.getenv("YOUTUBE_POLL_SECONDS", "60"))
 YOUTUBE_MAX_PAGES = int(os.getenv("YOUTUBE_MAX_PAGES", "3"))
+YOUTUBE_ONESHOT  = os.getenv("YOUTUBE_ONESHOT", "0") == "1"   # backfill + one poll round, then exit (Airflow)
 
 def _compile_or(words: List[str]) -> Optional[re.Pattern]:
     if not words: return None
@@ -67,13 +66,19 @@ def create_youtube():
     return build("youtube", "v3", developerKey=API_KEY)
 
 # ---------- DB insert helper ----------
-def save_comment(session: SessionLocal, cid: str, author: str, text: str, video_id: str) -> bool:
-    if session.query(Review).filter_by(source="youtube", source_id=cid).first():
+def already_saved(cid: str) -> bool:
+    # read-only connection: never waits on the writer thread (WAL)
+    with get_read_engine().connect() as conn:
+        q = select(Review.id).where(Review.source == "youtube", Review.source_id == cid)
+        return conn.execute(q).first() is not None
+
+def save_comment(writer: DBWriter, cid: str, author: str, text: str, video_id: str) -> bool:
+    if already_saved(cid):
         return False
     url = f"https://www.youtube.com/watch?v={video_id}" if video_id else ""
-    rec = Review(source="youtube", source_id=cid, author=author or "", text=text or "", url=url)
-    session.add(rec)
-    session.commit()
+    rec = dict(source="youtube", source_id=cid, author=author or "", text=text or "", url=url)
+    # queued for the writer thread; ON CONFLICT covers a duplicate still in flight
+    writer.submit(Review.__table__, [rec], conflict_cols=["source_id"])
     log.info("Saved youtube comment %s | %s", cid, url)
     return True
 
@@ -108,7 +113,7 @@ def _comment_threads_iter(yt, *, video_id: str = "", channel_id: str = "", raw_l
             return
 
 # ---------- Backfill overall N ----------
-def backfill_recent_total(yt, session):
+def backfill_recent_total(yt, writer):
     if BACKFILL_TOTAL <= 0:
         return 0
     raw_limit = max(BACKFILL_TOTAL * OVERSAMPLE, BACKFILL_TOTAL)
@@ -126,7 +131,7 @@ def backfill_recent_total(yt, session):
 
         if not should_keep(text, title):
             continue
-        if save_comment(session, cid, author, text, video_id):
+        if save_comment(writer, cid, author, text, video_id):
             saved += 1
             if saved >= BACKFILL_TOTAL:
                 break
@@ -136,8 +141,17 @@ def backfill_recent_total(yt, session):
     return saved
 
 # ---------- Poll loop ----------
-def poll_and_process(yt, session):
-    saved_since_last_process = 0
+def make_trigger(writer: DBWriter) -> Optional[ProcessTrigger]:
+    if REALTIME_BATCH <= 0:
+        return None
+    # phase 3 by default (REALTIME_PROCESSOR); imported here so only a processing ingestor loads the models
+    process_batch = load_processor()
+    if process_batch is None:
+        return None
+    # processing runs on the trigger's thread; polling keeps going meanwhile
+    return ProcessTrigger(process_batch, REALTIME_BATCH, REALTIME_FLUSH_MS, before=writer.flush)
+
+def poll_and_process(yt, writer, trigger: Optional[ProcessTrigger] = None):
     log.info(
         "Polling YouTube (%s) every %ss | match=%s | keywords=%s | products=%s",
         f"video={VIDEO_ID}" if VIDEO_ID else f"channel={CHANNEL_ID}",
@@ -157,42 +171,40 @@ def poll_and_process(yt, session):
 
                 if not should_keep(text, title):
                     continue
-                if save_comment(session, cid, author, text, video_id):
-                    saved_since_last_process += 1
+                if save_comment(writer, cid, author, text, video_id):
                     new_saves += 1
+                    if trigger:
+                        trigger.notify()
 
                 # If we’ve already saved this comment in a prior poll, DB de-dup returns False and we just move on
 
-                if REALTIME_BATCH > 0 and saved_since_last_process >= REALTIME_BATCH:
-                    if process_batch:
-                        log.info("Processing mini-batch of %d new rows...", saved_since_last_process)
-                        try:
-                            process_batch()
-                        except Exception as e:
-                            log.warning("Processing error: %s", e)
-                    saved_since_last_process = 0
-
             if new_saves == 0:
                 log.info("No new matching comments this round.")
+            if YOUTUBE_ONESHOT:
+                break
             time.sleep(POLL_SECONDS)
         except KeyboardInterrupt:
             log.info("Stopped by user.")
             break
         except Exception as e:
             log.warning("Poll error: %s", e)
-            session.rollback()
+            if YOUTUBE_ONESHOT:
+                raise
             time.sleep(5)
 
 def main():
     init_db()
     yt = create_youtube()
-    session = SessionLocal()
+    writer = DBWriter()
+    trigger = make_trigger(writer)
     try:
-        backfill_recent_total(yt, session)   # overall N (default 20)
-        poll_and_process(yt, session)        # process every M new (default 5)
+        backfill_recent_total(yt, writer)     # overall N (default 20)
+        poll_and_process(yt, writer, trigger) # process every M new / T ms (background)
     finally:
-        session.close()
-        log.info("DB session closed.")
+        if trigger:
+            trigger.close()   # processes whatever is still pending
+        writer.close()
+        log.info("DB writer closed.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
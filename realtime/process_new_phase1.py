@@ -1,13 +1,16 @@
 
-import os, pandas as pd, numpy as np
+import os, re, pandas as pd, numpy as np
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from sqlalchemy import text as sqltext
+from sqlalchemy import text as sqltext, select, insert
 from sqlalchemy.orm import Session
 from src.db_models import engine, SessionLocal, Review, Processed, init_db
-from sklearn.linear_model import LogisticRegression
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.pipeline import Pipeline
+from src import analytics, backlog, metrics, profiling
+import argparse
+import joblib
+from datetime import datetime
+from sklearn.linear_model import SGDClassifier
+from sklearn.feature_extraction.text import HashingVectorizer
 
 
 # -------------------------------------------
@@ -18,81 +21,193 @@ VOCAB_ASPECTS = [
     "shipping","packaging","build","delivery","quality","price"
 ]
 
-def simple_aspects(text):
-    """Return list of aspects found in text (keyword-based)."""
-    t = (text or "").lower()
-    return [w for w in VOCAB_ASPECTS if w in t]
+def simple_aspects(texts: pd.Series) -> pd.Series:
+    """Comma-joined vocabulary aspects per text (substring match), vectorized over the Series."""
+    lower = texts.fillna("").str.lower()
+    out = np.full(len(lower), "", dtype=object)
+    for w in VOCAB_ASPECTS:
+        hit = lower.str.contains(w, regex=False).to_numpy()
+        out = np.where(hit, out + (w + ","), out)
+    return pd.Series(out, index=texts.index).str.rstrip(",")
 
 # -------------------------------------------
 #  Weakly supervised sentiment baseline
 # -------------------------------------------
-def train_baseline(df):
-    pos_words = ["great","excellent","superb","helpful","quick","premium","bright","snappy"]
-    neg_words = ["drains","overheats","grainy","crashes","delayed","damaged","lags","inconsistent"]
-
-    def weak_label(t):
-        t = (t or "").lower()
-        pos = any(w in t for w in pos_words)
-        neg = any(w in t for w in neg_words)
-        if pos and not neg: return "POS"
-        if neg and not pos: return "NEG"
-        return "NEU"
-
-    df["weak_label"] = df["text"].apply(weak_label)
-    train = df[df["weak_label"] != "NEU"]
-
-    if len(train) < 20:
+# Trained once on the full history, persisted with joblib and refreshed incrementally on every run
+# from its last_review_id watermark (HashingVectorizer is stateless, SGDClassifier supports partial_fit).
+# A model without weakly labelled rows only ever predicts NEU, so it is never persisted.
+MODEL_PATH = os.getenv("PHASE1_MODEL_PATH", "models/phase1_sentiment.joblib")
+TRAIN_CHUNK = int(os.getenv("PHASE1_TRAIN_CHUNK", "50000"))
+BATCH_SIZE = int(os.getenv("PHASE1_BATCH", "20000"))
+
+POS_WORDS = ["great","excellent","superb","helpful","quick","premium","bright","snappy"]
+NEG_WORDS = ["drains","overheats","grainy","crashes","delayed","damaged","lags","inconsistent"]
+CLASSES = np.array(["NEG", "POS"])
+POS_RE = re.compile("|".join(map(re.escape, POS_WORDS)))
+NEG_RE = re.compile("|".join(map(re.escape, NEG_WORDS)))
+
+def weak_labels(texts: pd.Series) -> pd.Series:
+    """POS if only positive cue words occur, NEG if only negative ones, else NEU."""
+    lower = texts.fillna("").str.lower()
+    pos = lower.str.contains(POS_RE).to_numpy()
+    neg = lower.str.contains(NEG_RE).to_numpy()
+    return pd.Series(
+        np.select([pos & ~neg, neg & ~pos], ["POS", "NEG"], default="NEU"),
+        index=texts.index,
+    )
+
+def new_model():
+    return {
+        "vectorizer": HashingVectorizer(n_features=2**18, ngram_range=(1,2), alternate_sign=False),
+        "clf": SGDClassifier(loss="log_loss", alpha=1e-5, random_state=0),
+        "n_labelled": 0,
+        "last_review_id": 0,
+    }
+
+def partial_train(model, df):
+    """Weak-label df["text"] and update the model in place. Returns #rows used."""
+    labels = weak_labels(df["text"])
+    train = df[labels != "NEU"]
+    if not train.empty:
+        X = model["vectorizer"].transform(train["text"].fillna(""))
+        model["clf"].partial_fit(X, labels[labels != "NEU"], classes=CLASSES)
+        model["n_labelled"] += len(train)
+    if not df.empty:
+        model["last_review_id"] = max(model["last_review_id"], int(df["id"].max()))
+    return len(train)
+
+def save_model(model, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    joblib.dump(model, tmp)
+    os.replace(tmp, path)   # atomic swap so concurrent readers never see a partial file
+
+def load_model(path=MODEL_PATH, writable=False):
+    if not os.path.exists(path):
         return None
+    # read-only memory map for prediction; a private copy is needed to partial_fit
+    return joblib.load(path, mmap_mode=None if writable else "r")
+
+def _iter_reviews(after_id=0):
+    q = sqltext("SELECT id, text FROM reviews_raw WHERE id > :after ORDER BY id")
+    for chunk in pd.read_sql(q, con=engine, params={"after": after_id}, chunksize=TRAIN_CHUNK):
+        yield chunk
 
-    pipe = Pipeline([
-        ("tfidf", TfidfVectorizer(min_df=2, ngram_range=(1,2))),
-        ("logreg", LogisticRegression(max_iter=1000))
-    ])
-    pipe.fit(train["text"], train["weak_label"])
-    return pipe
+def train_full_history(path=MODEL_PATH):
+    model = new_model()
+    for chunk in _iter_reviews():
+        partial_train(model, chunk)
+    if model["n_labelled"] == 0:
+        # nothing to learn from yet: keep no model on disk, so the next run trains again
+        print("No weakly labelled rows in history yet; phase-1 model not saved (predicting NEU).")
+        return model
+    save_model(model, path)
+    print(f"Trained phase-1 model on history ({model['n_labelled']} weakly labelled rows).")
+    return model
+
+def refresh_model(path=MODEL_PATH):
+    """Fold reviews ingested since the last training/refresh into the persisted model."""
+    model = load_model(path, writable=True)
+    if model is None or model["n_labelled"] == 0:
+        return train_full_history(path)
+    used = 0
+    for chunk in _iter_reviews(model["last_review_id"]):
+        used += partial_train(model, chunk)
+    save_model(model, path)
+    print(f"Refreshed phase-1 model with {used} new weakly labelled rows.")
+    return model
+
+def latest_review_id() -> int:
+    with engine.connect() as conn:
+        return int(conn.execute(sqltext("SELECT MAX(id) FROM reviews_raw")).scalar() or 0)
+
+def current_model(path=MODEL_PATH):
+    """Persisted model, refreshed first when reviews arrived after its watermark; trained if missing/unlabelled."""
+    model = load_model(path)
+    if model is None or model["n_labelled"] == 0:
+        return train_full_history(path)
+    if latest_review_id() > model["last_review_id"]:
+        return refresh_model(path)
+    return model
+
+def predict(model, texts):
+    """Return (labels, scores) arrays; NEU/0.0 until the model has seen labelled data."""
+    if model is None or model["n_labelled"] == 0:
+        return np.full(len(texts), "NEU", dtype=object), np.zeros(len(texts))
+    with metrics.stage("tokenize"):
+        X = model["vectorizer"].transform(pd.Series(texts).fillna(""))
+    with metrics.stage("inference"):
+        proba = model["clf"].predict_proba(X)
+    labels = model["clf"].classes_[np.argmax(proba, axis=1)]
+    scores = np.max(proba, axis=1)
+    return labels.astype(object), scores
 
 # -------------------------------------------
 #  Main pipeline
 # -------------------------------------------
-def main():
+def fetch_new(conn, limit=BATCH_SIZE, after=0):
+    q = (
+        select(Review.id, Review.text)
+        .outerjoin(Processed, Processed.review_id == Review.id)
+        .where(Processed.id.is_(None), Review.id > after)
+        .order_by(Review.id)
+        .limit(limit)
+    )
+    return pd.DataFrame(conn.execute(q).all(), columns=["id", "text"])
+
+def process_frame(model, df):
+    """Vectorized phase-1 result rows for a frame of (id, text)."""
+    labels, scores = predict(model, df["text"])
+    sign = pd.Series(labels).map({"POS": 1.0, "NEG": -1.0, "NEU": 0.0}).to_numpy()
+    out = pd.DataFrame({
+        "review_id": df["id"].astype(int).to_numpy(),
+        "sentiment_label": labels,
+        "score": scores,
+        "score_signed": scores * sign,
+    })
+    with metrics.stage("aspects"):
+        out["aspect_csv"] = simple_aspects(df["text"]).to_numpy()
+    out["processed_at"] = datetime.utcnow()
+    return out
+
+def main(profiler=None):
     init_db()
+    with metrics.pipeline_run("phase1", engine, profiler):
+        run()
+
+def run():
+    with metrics.stage("model_load"):
+        model = current_model()
+
+    total = 0
+    with engine.connect() as conn:
+        after = backlog.after(conn)
+        while True:
+            with metrics.stage("fetch"):
+                df = fetch_new(conn, after=after)
+            if df.empty:
+                break
+            # Prediction only -- the model is persisted and shared across batches
+            out = process_frame(model, df)
+            # Core executemany instead of one ORM object per row
+            with metrics.stage("write"):
+                conn.execute(insert(Processed.__table__), out.to_dict("records"))
+                conn.commit()
+            total += len(out)
+            after = int(df["id"].iloc[-1])
+            metrics.incr("rows_processed", len(out))
+            print(f"Processed {len(out)} reviews (cumulative: {total}).")
+        backlog.advance(conn)
+        conn.commit()
+
+    if total == 0:
+        print("No new reviews found.")
+        return
+    print(f"Processed {total} reviews.")
     sess = SessionLocal()
     try:
-        rows = sess.query(Review).outerjoin(
-            Processed, Processed.review_id == Review.id
-        ).filter(Processed.id == None).limit(1000).all()
-
-        if not rows:
-            print("No new reviews found.")
-            return
-
-        df = pd.DataFrame([{"id": r.id, "text": r.text or ""} for r in rows])
-
-        # Train baseline classifier
-        model = train_baseline(df.copy())
-        if model is None:
-            preds = [("NEU", 0.0)] * len(df)
-        else:
-            proba = model.predict_proba(df["text"])
-            labels = model.classes_[np.argmax(proba, axis=1)]
-            scores = np.max(proba, axis=1)
-            preds = list(zip(labels, scores))
-
-        # Save processed rows
-        for (rid, text), (lab, score) in zip(df[["id","text"]].values, preds):
-            aspects = simple_aspects(text)
-            sign = {"POS":1.0, "NEG":-1.0, "NEU":0.0}[lab]
-            rec = Processed(
-                review_id=int(rid),
-                sentiment_label=lab,
-                score=float(score),
-                score_signed=float(score*sign),
-                aspect_csv=",".join(aspects)
-            )
-            sess.add(rec)
-        sess.commit()
-        print(f"Processed {len(df)} reviews.")
-        export_power_bi_tables(sess)
+        with metrics.stage("export"):
+            export_power_bi_tables(sess)
     finally:
         sess.close()
 
@@ -106,29 +221,33 @@ def export_power_bi_tables(sess: Session):
     )
     df_reviews.to_csv("data/processed/reviews_clean.csv", index=False)
 
-    rows = []
+    an = analytics.open_duckdb(parquet_dir="")
+    if an is not None:
+        # aggregates computed by DuckDB over the attached DB and written straight to CSV
+        an.export_tables("data/processed", {**analytics.EXPLODED_EXPORT_SQL, "daily_metrics.csv": analytics.DAILY_SQL})
+    else:
+        export_aggregates_pandas(df_reviews)
+
+    pd.DataFrame(columns=["review_id","topic_id","topic_label","topic_prob"]).to_csv(
+        "data/processed/topics.csv", index=False
+    )
+    print("Exported Power BI tables to data/processed/.")
+
+def export_aggregates_pandas(df_reviews: pd.DataFrame):
     proc = pd.read_sql(
-        sqltext("SELECT review_id, aspect_csv, sentiment_label, score_signed FROM reviews_processed"),
+        sqltext("SELECT review_id, aspect_csv, sentiment_label, score_signed FROM reviews_processed "
+                "WHERE triage_reason IS NULL"),
         con=engine
     )
-    for _, r in proc.iterrows():
-        for a in (r["aspect_csv"].split(",") if r["aspect_csv"] else []):
-            if a:
-                rows.append({"review_id": r["review_id"], "aspect": a, "confidence": 0.7})
-    pd.DataFrame(rows).to_csv("data/processed/aspects.csv", index=False)
-
-    aspect_sent = []
-    for _, r in proc.iterrows():
-        aspects = r["aspect_csv"].split(",") if r["aspect_csv"] else []
-        for a in aspects:
-            if a:
-                aspect_sent.append({
-                    "review_id": r["review_id"],
-                    "aspect": a,
-                    "sentiment_label": r["sentiment_label"],
-                    "score_signed": r["score_signed"]
-                })
-    pd.DataFrame(aspect_sent).to_csv("data/processed/aspect_sentiment.csv", index=False)
+    # one row per (review, aspect) via explode instead of iterrows
+    exploded = proc.assign(aspect=proc["aspect_csv"].fillna("").str.split(",")).explode("aspect")
+    exploded = exploded[exploded["aspect"].fillna("") != ""]
+
+    aspects = exploded[["review_id", "aspect"]].assign(confidence=0.7)
+    aspects.to_csv("data/processed/aspects.csv", index=False)
+
+    aspect_sent = exploded[["review_id", "aspect", "sentiment_label", "score_signed"]]
+    aspect_sent.to_csv("data/processed/aspect_sentiment.csv", index=False)
 
     df_reviews["date"] = pd.to_datetime(df_reviews["created_at"]).dt.date
     joined = proc.merge(df_reviews[["review_id","date"]], on="review_id", how="left")
@@ -138,11 +257,12 @@ def export_power_bi_tables(sess: Session):
     ).reset_index()
     daily.to_csv("data/processed/daily_metrics.csv", index=False)
 
-    pd.DataFrame(columns=["review_id","topic_id","topic_label","topic_prob"]).to_csv(
-        "data/processed/topics.csv", index=False
-    )
-    print("Exported Power BI tables to data/processed/.")
-
 # -------------------------------------------
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--retrain", action="store_true", help="retrain the phase-1 model on the full history")
+    profiling.add_cli_args(ap)
+    args = ap.parse_args()
+    if args.retrain:
+        train_full_history()
+    main(profiler=profiling.from_args(args, "phase1"))
\ No newline at end of file
@@ -1,36 +1,54 @@
 # realtime/process_new_phase3.py
-import os, sqlite3, sys
-import json
+import os, sys, time
+import json, hashlib
 import pandas as pd
-from transformers import pipeline
 from bertopic import BERTopic
 from keybert import KeyBERT
 import spacy
 from datetime import datetime
-from sklearn.feature_extraction.text import CountVectorizer
-from hdbscan import HDBSCAN
 from dotenv import load_dotenv
+from sqlalchemy import text
 
 sys.path.append("/opt/airflow/src")
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from nlp import aspect_sentiment, sentiment, topic_training, topics, topic_ann, triage, versions
+from nlp.aspects import AspectTagger
+from nlp.cache import InferenceCache, normalize_text, text_hash
+from src import autotune, backlog, metrics, profiling, queries
+from src.db_models import Processed, ReviewAspectSentiment, get_engine, init_db, upsert
 
 print("process_new_phase3.py STARTED")
 
 # --- Load environment ---
 load_dotenv()
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
-DB_PATH = DB_URL.replace("sqlite:///", "", 1)
-
-# --- Sentiment pipeline (3-class) ---
-sentiment_pipeline = pipeline(
-    "sentiment-analysis",
-    model="cardiffnlp/twitter-roberta-base-sentiment-latest"
-)
+DB_PATH = DB_URL.replace("sqlite:///", "", 1) if DB_URL.startswith("sqlite:///") else ""
+engine = get_engine(DB_URL)
+
+# --- Sentiment model (3-class); SENTIMENT_BACKEND=torch | onnx (int8, see nlp/sentiment.py) ---
+SENTIMENT_MODEL = sentiment.SENTIMENT_MODEL
+sentiment_model = sentiment.load_sentiment()
+# token-budgeted micro-batches tuned toward AUTOTUNE_TARGET_MS, remembered per host (src/autotune.py)
+sentiment_tuner = autotune.BatchTuner.for_stage("sentiment", sentiment.backend_tag())
+
+# --- Aspect-scoped sentiment (only sentences that mention a tagged aspect are scored) ---
+ASPECT_SENTIMENT = os.getenv("ASPECT_SENTIMENT", "1") == "1"
+ASPECTS_MIN_HITS = int(os.getenv("ASPECTS_MIN_HITS", "1"))
+aspect_tagger = AspectTagger(min_hits=ASPECTS_MIN_HITS)
+ASPECT_SENTIMENT_FIELDS = ["sentiment_label", "score", "score_signed", "n_sentences", "processed_at", "updated_at"]
+
+# --- Triage (junk / non-English rows skip the models and get TRIAGE_DEFAULT) ---
+TRIAGE = os.getenv("TRIAGE", "1") == "1"
+TRIAGE_DEFAULT = {"aspects": "[]", "aspect_csv": "", "sentiment_label": "NEUTRAL", "score": 0.0,
+                  "score_signed": 0.0, "topic_id": -1, "topic_prob": 0.0,
+                  "topic_label": topics.MISC_LABEL, "topic_source": "triage"}
 
 # --- Aspect extractor (KeyBERT + spaCy) ---
+SPACY_MODEL = "en_core_web_sm"
+KEYBERT_TOP_N = 5
 kw_model = KeyBERT()
-nlp = spacy.load("en_core_web_sm")
+nlp = spacy.load(SPACY_MODEL)
 
 def extract_aspects(txt: str):
     if not txt:
@@ -39,97 +57,63 @@ def extract_aspects(txt: str):
     noun_chunks = [chunk.text for chunk in doc.noun_chunks if len(chunk.text) > 2]
 
     keywords = kw_model.extract_keywords(
-        txt, keyphrase_ngram_range=(1, 2), stop_words="english", top_n=5
+        txt, keyphrase_ngram_range=(1, 2), stop_words="english", top_n=KEYBERT_TOP_N
     )
     keys = [kw for kw, _ in keywords]
 
     combined = list(set(keys + noun_chunks))
     return ",".join(combined[:5])
 
-def analyze_sentiment(txt: str):
-    res = sentiment_pipeline(txt[:512])[0]  # clip text
+def _to_row(res):
     label = res["label"].upper()
     score = float(res["score"])
     sign = {"POSITIVE": 1, "NEGATIVE": -1, "NEUTRAL": 0}.get(label, 0)
     return label, score, score * sign
 
+def analyze_sentiment(txt: str):
+    return _to_row(sentiment.classify(sentiment_model, [txt])[0])
+
+def analyze_sentiments(texts):
+    """Batched: token-budgeted micro-batches (SENTIMENT_BATCH rows each with AUTOTUNE=0)."""
+    return [_to_row(r) for r in sentiment.classify(sentiment_model, texts, tuner=sentiment_tuner)]
+
 # --- Load or train BERTopic ---
-MODEL_PATH = "/opt/airflow/models/bertopic_model"
-os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-
-vectorizer = CountVectorizer(
-    stop_words="english",
-    min_df=2,
-    max_df=0.8,
-    ngram_range=(1, 2)
-)
-
-hdbscan_model = HDBSCAN(
-    min_cluster_size=3,
-    min_samples=1,
-    gen_min_span_tree=True,
-    prediction_data=True   # needed for transform()
-)
-
-if os.path.exists(MODEL_PATH):
-    print(f"Loading BERTopic model from {MODEL_PATH}")
-    topic_model = BERTopic.load(MODEL_PATH)
+# Safetensors directory is the primary artifact; the old pickle is only read once to migrate.
+MODEL_DIR = os.getenv("BERTOPIC_MODEL_DIR", "/opt/airflow/models/bertopic_st")
+# transform (full UMAP/HDBSCAN or similarity path) | centroid | knn  -- see nlp/topic_ann.py
+TOPIC_ASSIGN_MODE = os.getenv("TOPIC_ASSIGN_MODE", "transform").lower()
+LEGACY_MODEL_PATH = os.getenv("BERTOPIC_MODEL_PATH", "/opt/airflow/models/bertopic_model")
+os.makedirs(os.path.dirname(MODEL_DIR), exist_ok=True)
+
+if os.path.isdir(MODEL_DIR):
+    print(f"Loading BERTopic model from {MODEL_DIR}")
+    topic_model = topics.load_model(MODEL_DIR)
+elif os.path.isfile(LEGACY_MODEL_PATH):
+    print(f"Migrating pickled BERTopic model {LEGACY_MODEL_PATH} -> {MODEL_DIR}")
+    topics.save_model(BERTopic.load(LEGACY_MODEL_PATH), MODEL_DIR)
+    topic_model = topics.load_model(MODEL_DIR)
 else:
     print("Training new BERTopic model (first run)...")
-    topic_model = BERTopic(
-        vectorizer_model=vectorizer,
-        hdbscan_model=hdbscan_model,
-        nr_topics=None
-    )
-    if os.path.exists(DB_PATH):
-        con = sqlite3.connect(DB_PATH)
-        all_reviews = pd.read_sql("SELECT text FROM reviews_raw", con)
-        con.close()
-        if not all_reviews.empty:
-            docs = all_reviews["text"].tolist()
-            topic_model.fit(docs)
-            topic_model.reduce_topics(docs, nr_topics=10)  # force more diversity
-            topic_model.save(MODEL_PATH)
-            print(f"Trained and saved BERTopic model with {len(all_reviews)} docs.")
+    from sentence_transformers import SentenceTransformer
+    embedder = SentenceTransformer(topics.EMBEDDING_MODEL)
+    topic_model = topic_training.new_model(embedder)
+    if not DB_PATH or os.path.exists(DB_PATH):
+        # streamed reservoir sample of TOPIC_TRAIN_SAMPLE docs (junk left out), not the whole table;
+        # the rest of the history gets its topics as it is processed / via tools/reprocess.py
+        init_db(engine)
+        trained = topic_training.fit_sampled(
+            topic_model, engine, keep=(lambda t: triage.triage(t) is None) if TRIAGE else None)
+        if trained is not None:
+            embeddings, report = trained
+            # complete model swapped in at once: a crash mid-save must not leave a partial MODEL_DIR
+            # that the next run would load instead of retraining
+            topic_training.save_model_dir(topic_model, embeddings, report, MODEL_DIR)
+            print(f"Trained and saved BERTopic model on {report['sample']['train_docs']} of "
+                  f"{report['sample']['rows_seen']} docs: {json.dumps(report['quality'])}")
     else:
         print(" No DB found, starting with empty BERTopic model.")
 
-# --- Junk words to filter out ---
-JUNK_WORDS = {
-    # basic stopwords
-    "the","a","an","is","are","was","were","be","been","do","did","does",
-    "at","in","on","with","to","from","of","by","about","into","over","under",
-    "so","very","much","many","few","more","most","some","any","all","every",
-    "can","could","should","would","will","may","might","must",
-
-    # casual / reddit filler
-    "lol","haha","omg","damn","bro","dude","hey","hi","hello",
-    "pls","please","thanks","thank","thx","yep","yeah","nope","ok","okay",
-    "idk","imo","imho","btw","wtf","smh","lmao","rofl",
-
-    # tech filler
-    "app","apps","update","version","feature","features","option","options",
-    "thing","stuff","item","items","product","products","device","devices",
-    "model","models","series","line","brand","brands",
-
-    # short tokens
-    "nah","yup","wow","ugh","meh","ayy","ehh",
-
-    # from your list
-    "not","and","but","you","your","this","pro","for","new","one","get",
-    "just","like","iphone","phone","message","read"
-}
-
-def get_clean_topic_label(topic_id):
-    if topic_id == -1:
-        return "Misc"
-    words = topic_model.get_topic(topic_id)
-    if not words:
-        return "Misc"
-    clean_words = [w for w, _ in words if w.lower() not in JUNK_WORDS and len(w) > 2]
-    if not clean_words:
-        return words[0][0]
-    return " ".join(clean_words[:3])
+MODEL_VERSION = topics.model_version(MODEL_DIR) if os.path.isdir(MODEL_DIR) else "untrained"
 
 def extract_probs(probs):
     """Safely handle probs whether float or array."""
@@ -143,62 +127,240 @@ def extract_probs(probs):
             out.append(float(p))
     return out
 
-def main():
-    if not os.path.exists(DB_PATH):
+topic_index = None
+if TOPIC_ASSIGN_MODE in {"centroid", "knn"} and MODEL_VERSION != "untrained":
+    topic_index = topic_ann.build_index(topic_model, TOPIC_ASSIGN_MODE, MODEL_DIR)
+    TOPIC_ASSIGN_MODE = topic_index.mode   # knn falls back to centroid without a saved reference
+    print(f"Topic assignment: ANN {topic_index.mode} ({topic_index.backend})")
+
+def assign_topics(docs):
+    """Return (topic_ids, probs, source) using the configured assignment mode."""
+    if topic_index is None:
+        topic_ids, probs = topic_model.transform(docs)
+        return topic_ids, extract_probs(probs), "bertopic-transform"
+    emb = topic_ann.embed_documents(topic_model, docs)
+    topic_ids, probs = topic_index.assign(emb)
+    return topic_ids, probs.tolist(), f"ann-{topic_index.mode}"
+
+# --- Inference cache (skip models for repeated / near-duplicate texts) ---
+USE_CACHE = os.getenv("INFERENCE_CACHE", "1") == "1"
+# Any change to a model, the sentiment backend or the topic assignment mode invalidates cached results
+_SENTIMENT_KEY = SENTIMENT_MODEL if sentiment.backend_tag() == "torch" else f"{SENTIMENT_MODEL}|{sentiment.backend_tag()}"
+CACHE_VERSION = hashlib.sha1(
+    f"{_SENTIMENT_KEY}|keybert|en_core_web_sm|{MODEL_VERSION}|{TOPIC_ASSIGN_MODE}".encode()
+).hexdigest()[:12]
+RESULT_FIELDS = ["aspects", "aspect_csv", "sentiment_label", "score", "score_signed",
+                 "topic_id", "topic_prob", "topic_label", "topic_source"]
+MODEL_STAGES = ["aspects", "sentiment", "topics"]
+
+# --- Stage versions: stamped on every row; tools/reprocess.py recomputes rows whose stamp differs ---
+STAGE_VERSIONS = {
+    "aspects": versions.fingerprint("keybert", SPACY_MODEL, KEYBERT_TOP_N),
+    "sentiment": versions.fingerprint(_SENTIMENT_KEY),
+    "topics": versions.fingerprint(MODEL_VERSION, TOPIC_ASSIGN_MODE),
+    "aspect_sentiment": versions.fingerprint(versions.lexicon_fingerprint(), ASPECTS_MIN_HITS, _SENTIMENT_KEY,
+                                             aspect_sentiment.ASPECT_SENT_MAX_CHARS),
+}
+if not ASPECT_SENTIMENT:
+    STAGE_VERSIONS["aspect_sentiment"] = None
+VERSION_FIELDS = [versions.column(s) for s in STAGE_VERSIONS]
+
+def infer(texts, topic_labels, stages=MODEL_STAGES):
+    """Run the given model stages for a list of texts -> DataFrame of their fields (all of RESULT_FIELDS by default)."""
+    out = pd.DataFrame(index=range(len(texts)))
+    if "aspects" in stages:
+        with metrics.stage("aspects"):
+            aspects = [extract_aspects(txt) for txt in texts]
+        out["aspects"] = [json.dumps(a.split(",")) if a else "[]" for a in aspects]
+        out["aspect_csv"] = aspects
+
+    if "sentiment" in stages:
+        sentiments, scores, signed_scores = [], [], []
+        with metrics.stage("sentiment"):
+            for lab, sc, signed in analyze_sentiments(texts):
+                sentiments.append(lab)
+                scores.append(sc)
+                signed_scores.append(signed)
+        out["sentiment_label"] = sentiments
+        out["score"] = scores
+        out["score_signed"] = signed_scores
+
+    if "topics" in stages:
+        with metrics.stage("topics"):
+            topic_ids, probs, topic_source = assign_topics(list(texts))
+        out["topic_id"] = [int(t) for t in topic_ids]
+        out["topic_prob"] = probs
+        out["topic_label"] = topics.label_topics(topic_ids, topic_labels)
+        out["topic_source"] = topic_source
+    return out
+
+def infer_with_cache(texts, topic_labels, cache):
+    """Serve cache hits, run the models once per distinct uncached text, backfill the cache."""
+    with metrics.stage("cache_lookup"):
+        cached = cache.get_many(texts) if cache else [None] * len(texts)
+    todo, first = {}, {}
+    for i, (txt, hit) in enumerate(zip(texts, cached)):
+        if hit is None:
+            key = text_hash(normalize_text(txt))
+            first.setdefault(key, txt)
+            todo.setdefault(key, []).append(i)
+
+    results = list(cached)
+    if todo:
+        keys = list(todo)
+        uniq = [first[k] for k in keys]
+        t0 = time.perf_counter()
+        fresh = infer(uniq, topic_labels)
+        if cache:
+            cache.record_inference(len(uniq), time.perf_counter() - t0)
+        records = fresh[RESULT_FIELDS].to_dict("records")
+        for key, rec in zip(keys, records):
+            for i in todo[key]:
+                results[i] = rec
+        if cache:
+            with metrics.stage("cache_store"):
+                cache.put_many(uniq, records)
+    metrics.incr("model_inferences", len(todo))
+    return pd.DataFrame(results, columns=RESULT_FIELDS)
+
+# --- Sharding (Airflow maps one task per id range, see dags/aspect_sentiment_dag.py) ---
+BATCH_SIZE = int(os.getenv("PHASE3_BATCH", "500"))
+SHARD_MIN_ID = int(os.getenv("SHARD_MIN_ID", "0"))
+SHARD_MAX_ID = int(os.getenv("SHARD_MAX_ID", str(2**62)))
+
+def main(profiler=None, drain=False):
+    if DB_PATH and not os.path.exists(DB_PATH):
         raise SystemExit(f"DB not found: {DB_PATH}")
-    con = sqlite3.connect(DB_PATH)
+    cache = InferenceCache(CACHE_VERSION) if USE_CACHE else None
 
     try:
-        # --- Get new reviews ---
-        df = pd.read_sql("""
-            SELECT r.id, r.text
-            FROM reviews_raw r
-            LEFT JOIN reviews_processed p ON p.review_id = r.id
-            WHERE p.review_id IS NULL
-            ORDER BY r.id ASC
-            LIMIT 500
-        """, con)
-
-        if df.empty:
-            print("No new reviews found.")
-            return
-
-        # --- Aspects + Sentiment ---
-        aspects, sentiments, scores, signed_scores = [], [], [], []
-        for txt in df["text"]:
-            aspects.append(extract_aspects(txt))
-            lab, sc, signed = analyze_sentiment(txt)
-            sentiments.append(lab)
-            scores.append(sc)
-            signed_scores.append(signed)
-
-        df["aspects"] = [json.dumps(a.split(",")) if a else "[]" for a in aspects]
-        df["aspect_csv"] = aspects
-        df["sentiment_label"] = sentiments
-        df["score"] = scores
-        df["score_signed"] = signed_scores
-
-        # --- Topics ---
-        topics, probs = topic_model.transform(df["text"].tolist())
-        df["topic_id"] = topics
-        df["topic_prob"] = extract_probs(probs)
-        df["topic_label"] = [get_clean_topic_label(t) for t in topics]
-        df["topic_source"] = "bertopic-transform"
-
-        # --- Add processed_at ---
-        df["processed_at"] = datetime.utcnow()
-
-        # --- Save (replace table so schema always matches) ---
-        df_to_save = (
-            df.drop(columns=["text"])
-              .rename(columns={"id": "review_id"})
-        )
-        df_to_save.to_sql("reviews_processed", con, if_exists="append", index=False)
-
-        print(f" Processed {len(df)} reviews with aspects + sentiment + topics")
-
+        with metrics.pipeline_run("phase3", engine, profiler):
+            with engine.connect() as conn:
+                run(conn, cache, drain)
     finally:
-        con.close()
+        if cache:
+            cache.close()
+
+def process_pending():
+    """Realtime trigger entry point (src/process_trigger.py): everything pending, in batches."""
+    main(drain=True)
+
+def prepare():
+    """Load/train/migrate the topic model and its label table once, before shards start."""
+    with engine.connect() as conn:
+        init_db(conn)
+        topics.load_topic_labels(conn, topic_model, MODEL_VERSION)
+    print(f"Models ready (topic model {MODEL_VERSION}, sentiment backend {sentiment.backend_tag()}).")
+
+def run(conn, cache, drain=False):
+    init_db(conn)
+    topic_labels = topics.load_topic_labels(conn, topic_model, MODEL_VERSION)
+
+    # ids at or below the backlog watermark (src/backlog.py) are done; don't re-scan them
+    total, min_id = 0, max(SHARD_MIN_ID, backlog.after(conn) + 1)
+    while True:
+        n, last_id = process_batch(conn, topic_labels, cache, min_id)
+        total += n
+        if not drain or n == 0:
+            break
+        min_id = last_id + 1
+    backlog.advance(conn)
+    conn.commit()
+
+    if total == 0:
+        print("No new reviews found.")
+        return
+    if cache:
+        report = cache.report()
+        metrics.gauge("cache_hit_rate", report["hit_rate"])
+        metrics.incr("cache_saved_seconds_est", report["saved_seconds_est"])
+        print(" Inference cache:", json.dumps(report))
+    if sentiment_tuner:
+        sentiment_tuner.save()
+        metrics.gauge("autotune_budget_tokens", sentiment_tuner.budget)
+        print(" Autotune:", json.dumps({"budget_tokens": sentiment_tuner.budget, **sentiment_tuner.stats}))
+
+def process_batch(conn, topic_labels, cache, min_id=SHARD_MIN_ID):
+    # --- Get new reviews (within this task's shard) ---
+    with metrics.stage("fetch"):
+        df = pd.read_sql(text(queries.UNPROCESSED_RANGE), conn,
+                         params={"min_id": min_id, "max_id": SHARD_MAX_ID, "limit": BATCH_SIZE})
+
+    if df.empty:
+        return 0, min_id
+
+    # --- Triage: cheap heuristics decide which rows are worth a model call ---
+    with metrics.stage("triage"):
+        reasons = triage.triage_many(df["text"].tolist()) if TRIAGE else [None] * len(df)
+    df["triage_reason"] = reasons
+    keep = df["triage_reason"].isna().to_numpy()
+    for reason, n in triage.summarize(reasons).items():
+        metrics.incr(f"triage_{reason}", n)
+    metrics.incr("triage_rejected", int((~keep).sum()))
+
+    # --- Aspects + Sentiment + Topics (cached) on the kept rows ---
+    if keep.all():
+        res = infer_with_cache(df["text"].fillna("").tolist(), topic_labels, cache)
+        for col in RESULT_FIELDS:
+            df[col] = res[col].values
+    else:
+        for col in RESULT_FIELDS:
+            df[col] = pd.Series([TRIAGE_DEFAULT[col]] * len(df), index=df.index, dtype=object)
+        if keep.any():
+            res = infer_with_cache(df.loc[keep, "text"].fillna("").tolist(), topic_labels, cache)
+            for col in RESULT_FIELDS:
+                df.loc[keep, col] = res[col].values
+
+    # --- Add processed_at + stage versions (cached results were produced by the same versions) ---
+    df["processed_at"] = df["updated_at"] = datetime.utcnow()
+    for stage, version in STAGE_VERSIONS.items():
+        df[versions.column(stage)] = version
+
+    # --- Per-aspect sentiment on aspect-bearing sentences only ---
+    aspect_rows = []
+    if ASPECT_SENTIMENT:
+        with metrics.stage("aspect_sentiment"):
+            aspect_rows = aspect_sentiment_rows(df[keep])
+
+    # --- Save (ON CONFLICT upsert: concurrent processors never fail on the same review) ---
+    df_to_save = (
+        df.drop(columns=["text"])
+          .rename(columns={"id": "review_id"})
+    )
+    with metrics.stage("write"):
+        upsert(conn, Processed.__table__, df_to_save.to_dict("records"), ["review_id"],
+               RESULT_FIELDS + ["processed_at", "updated_at", "triage_reason"] + VERSION_FIELDS)
+        upsert(conn, ReviewAspectSentiment.__table__, aspect_rows, ["review_id", "aspect"],
+               ASPECT_SENTIMENT_FIELDS)
+        conn.commit()
+    metrics.incr("rows_processed", len(df))
+
+    print(f" Processed {len(df)} reviews with aspects + sentiment + topics ({int((~keep).sum())} triaged)")
+    return len(df), int(df["id"].iloc[-1])
+
+def aspect_sentiment_rows(df):
+    """review_aspect_sentiment rows for a fetched batch (columns id, text, processed_at)."""
+    stats = {}
+    per_review = aspect_sentiment.score_aspects(df["text"].fillna("").tolist(), sentiment_model,
+                                                aspect_tagger, stats, tuner=sentiment_tuner)
+    rows = [
+        {"review_id": int(rid), "processed_at": at, "updated_at": at, **r}
+        for rid, at, rs in zip(df["id"], df["processed_at"], per_review)
+        for r in rs
+    ]
+    metrics.incr("aspect_clauses_scored", stats.get("clauses_scored", 0))
+    metrics.incr("aspect_chars_scored", stats.get("chars_scored", 0))
+    metrics.incr("aspect_chars_total", stats.get("chars_total", 0))
+    return rows
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--drain", action="store_true", help="keep going until no unprocessed rows are left in the shard")
+    ap.add_argument("--prepare", action="store_true", help="only load/train the models and exit")
+    profiling.add_cli_args(ap)
+    args = ap.parse_args()
+    if args.prepare:
+        prepare()
+    else:
+        main(profiler=profiling.from_args(args, "phase3"), drain=args.drain)
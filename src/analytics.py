@@ -0,0 +1,299 @@
+# src/analytics.py
+# Analytical queries for the dashboard (trend, KPIs, word cloud, per-aspect summary) and the Power BI
+# exporters' derived tables, run in DuckDB: the SQLite / Postgres database is attached read-only, or
+# Parquet snapshots are read directly (ANALYTICS_PARQUET_DIR, written by export_for_powerbi --parquet).
+# DuckDB scans and aggregates vectorized on all cores and only the small result comes back to pandas,
+# so nothing loads a whole table into a DataFrame.
+#
+# duckdb is optional. Without it (or with ANALYTICS_ENGINE=pandas, or when the database cannot be
+# attached) the dashboard gets FrameAnalytics, which answers the same calls from the compact frame
+# of src/dashboard_data.py, and the exporters keep their pandas path.
+from __future__ import annotations
+import os
+from typing import Dict, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy.engine import make_url
+
+from src.queries import ASPECT_SENTIMENT_SUMMARY
+
+try:
+    import duckdb
+except ImportError:   # optional: pip install duckdb
+    duckdb = None
+
+DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "duckdb").lower()    # duckdb | pandas
+ANALYTICS_PARQUET_DIR = os.getenv("ANALYTICS_PARQUET_DIR", "")        # <table>.parquet or <table>/*.parquet
+ANALYTICS_THREADS = int(os.getenv("ANALYTICS_THREADS", "0"))           # 0 = DuckDB default (all cores)
+ANALYTICS_MEMORY_LIMIT = os.getenv("ANALYTICS_MEMORY_LIMIT", "")       # e.g. "2GB"; DuckDB spills beyond it
+
+TABLES = ["reviews_raw", "reviews_processed", "review_aspect_sentiment"]
+# dashboard bucket column (src/dashboard_data.py) -> date_trunc part; both label a period by its start
+BUCKETS = {"hour": "hour", "date": "day", "week": "week", "month": "month"}
+WORDCLOUD_TOP_N = 200
+SENTIMENT_LABELS = ["POSITIVE", "NEGATIVE", "NEUTRAL"]
+
+# ---------- exporter derived tables ----------
+# tools/export_for_powerbi.py (full export): same columns as its pandas aspect_frames();
+# triaged rows (placeholder NEUTRAL result) are left out of every derived table, as on the dashboard
+EXPORT_SQL = {
+    "aspects.csv": "SELECT review_id, aspect_csv, 0.7 AS confidence FROM reviews_processed WHERE triage_reason IS NULL",
+    "aspect_sentiment.csv": """SELECT review_id, aspect_csv, sentiment_label, score_signed, 0.7 AS confidence
+                               FROM reviews_processed WHERE triage_reason IS NULL""",
+    "topics.csv": """SELECT review_id, topic_id, topic_label, 1.0 AS topic_prob
+                     FROM reviews_processed WHERE triage_reason IS NULL""",
+}
+# realtime/process_new_phase1.py: one row per (review, aspect)
+_EXPLODED = """
+    SELECT review_id, aspect, sentiment_label, score_signed
+    FROM (SELECT review_id, unnest(string_split(aspect_csv, ',')) AS aspect, sentiment_label, score_signed
+          FROM reviews_processed
+          WHERE aspect_csv IS NOT NULL AND triage_reason IS NULL)
+    WHERE aspect <> ''
+"""
+EXPLODED_EXPORT_SQL = {
+    "aspects.csv": f"SELECT review_id, aspect, 0.7 AS confidence FROM ({_EXPLODED})",
+    "aspect_sentiment.csv": f"SELECT review_id, aspect, sentiment_label, score_signed FROM ({_EXPLODED})",
+}
+DAILY_SQL = """
+    SELECT CAST(r.created_at AS DATE) AS date, AVG(p.score_signed) AS avg_sentiment, COUNT(p.review_id) AS n_reviews
+    FROM reviews_processed p
+    JOIN reviews_raw r ON r.id = p.review_id
+    WHERE r.created_at IS NOT NULL
+      AND p.triage_reason IS NULL
+    GROUP BY 1
+    ORDER BY 1
+"""
+# Parquet snapshots for ANALYTICS_PARQUET_DIR; reviews_raw without text/author (nothing aggregates them)
+# (timestamps cast explicitly: SQLite stores them as text, the snapshot should not)
+PARQUET_SQL = {
+    "reviews_raw": """SELECT id, source, CAST(created_at AS TIMESTAMP) AS created_at, product_id, brand, rating
+                      FROM reviews_raw""",
+    "reviews_processed": """SELECT * REPLACE (CAST(processed_at AS TIMESTAMP) AS processed_at,
+                                      CAST(updated_at AS TIMESTAMP) AS updated_at)
+                            FROM reviews_processed""",
+    "review_aspect_sentiment": """SELECT * REPLACE (CAST(processed_at AS TIMESTAMP) AS processed_at,
+                                            CAST(updated_at AS TIMESTAMP) AS updated_at)
+                                  FROM review_aspect_sentiment""",
+}
+
+def _labels_filter(labels: Optional[Sequence[str]]):
+    """WHERE clause + params for the dashboard's sentiment filter (None / all labels = no filter)."""
+    where = "triage_reason IS NULL"
+    if labels is None or set(labels) >= set(SENTIMENT_LABELS):
+        return where, []
+    return where + " AND list_contains(?, sentiment_label)", [list(labels)]
+
+def _parquet_source(parquet_dir: str, table: str) -> str:
+    if not parquet_dir:
+        return ""
+    path = os.path.join(parquet_dir, f"{table}.parquet")
+    if os.path.isfile(path):
+        return path
+    if os.path.isdir(os.path.join(parquet_dir, table)):
+        return os.path.join(parquet_dir, table, "*.parquet")
+    return ""
+
+def _quote(s: str) -> str:
+    return "'" + s.replace("'", "''") + "'"
+
+class DuckAnalytics:
+    """One in-memory DuckDB per process; views named like the tables point at the attached DB or Parquet."""
+    engine = "duckdb"
+
+    def __init__(self, db_url: str = DB_URL, parquet_dir: str = ANALYTICS_PARQUET_DIR):
+        self.con = duckdb.connect()
+        if ANALYTICS_THREADS > 0:
+            self.con.execute(f"SET threads = {ANALYTICS_THREADS}")
+        if ANALYTICS_MEMORY_LIMIT:
+            self.con.execute(f"SET memory_limit = {_quote(ANALYTICS_MEMORY_LIMIT)}")
+        self.sources: Dict[str, str] = {}
+        attached = False
+        for table in TABLES:
+            pq = _parquet_source(parquet_dir, table)
+            if pq:
+                self.con.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet({_quote(pq)})")
+                self.sources[table] = "parquet"
+                continue
+            if not attached:
+                self._attach(db_url)
+                attached = True
+            if self._db_has(table):
+                self.con.execute(f"CREATE VIEW {table} AS SELECT * FROM db.{table}")
+                self.sources[table] = "db"
+
+    def _attach(self, db_url: str) -> None:
+        url = make_url(db_url)
+        if url.get_backend_name() == "sqlite":
+            self.con.execute(f"ATTACH {_quote(url.database)} AS db (TYPE sqlite, READ_ONLY)")
+        elif url.get_backend_name() == "postgresql":
+            dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+            self.con.execute(f"ATTACH {_quote(dsn)} AS db (TYPE postgres, READ_ONLY)")
+        else:
+            raise ValueError(f"DuckDB analytics cannot attach {url.get_backend_name()!r}")
+
+    def _db_has(self, table: str) -> bool:
+        return bool(self.con.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = 'db' AND table_name = ?", [table]
+        ).fetchone()[0])
+
+    def query(self, sql: str, params: Optional[list] = None) -> pd.DataFrame:
+        # a cursor per call: Streamlit sessions query from different threads
+        return self.con.cursor().execute(sql, params or []).df()
+
+    # ---------- dashboard ----------
+    def trend(self, bucket: str, labels: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        where, params = _labels_filter(labels)
+        return self.query(f"""
+            SELECT date_trunc('{BUCKETS[bucket]}', processed_at) AS {bucket},
+                   AVG(score_signed) AS Average_Sentiment,
+                   COUNT(review_id) AS Review_Count
+            FROM reviews_processed
+            WHERE {where} AND processed_at IS NOT NULL
+            GROUP BY 1
+            ORDER BY 1
+        """, params)
+
+    def cumulative(self, labels: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        where, params = _labels_filter(labels)
+        return self.query(f"""
+            WITH d AS (
+                SELECT date_trunc('day', processed_at) AS datetime,
+                       AVG(score_signed) AS Daily_Sentiment,
+                       COUNT(review_id) AS Daily_Count
+                FROM reviews_processed
+                WHERE {where} AND processed_at IS NOT NULL
+                GROUP BY 1
+            )
+            SELECT *,
+                   SUM(Daily_Count) OVER w AS Cumulative_Count,
+                   SUM(Daily_Sentiment * Daily_Count) OVER w / SUM(Daily_Count) OVER w AS Cumulative_Sentiment
+            FROM d
+            WINDOW w AS (ORDER BY datetime)
+            ORDER BY datetime
+        """, params)
+
+    def kpis(self, bucket: Optional[str] = None, labels: Optional[Sequence[str]] = None) -> Dict:
+        """Label counts + mean confidence over everything (bucket=None) or the latest bucket only."""
+        where, params = _labels_filter(labels)
+        if bucket:
+            part = BUCKETS[bucket]
+            where += (f" AND date_trunc('{part}', processed_at) = "
+                      f"(SELECT MAX(date_trunc('{part}', processed_at)) FROM reviews_processed WHERE {where})")
+            params = params + params
+        df = self.query(f"""
+            SELECT sentiment_label, COUNT(*) AS n, SUM(score) AS score_sum, COUNT(score) AS score_n
+            FROM reviews_processed
+            WHERE {where}
+            GROUP BY 1
+        """, params)
+        return _kpi_dict(df)
+
+    def aspect_frequencies(self, labels: Optional[Sequence[str]] = None, top_n: int = WORDCLOUD_TOP_N) -> Dict[str, int]:
+        where, params = _labels_filter(labels)
+        df = self.query(f"""
+            SELECT trim(aspect) AS aspect, COUNT(*) AS n
+            FROM (SELECT unnest(string_split(aspect_csv, ',')) AS aspect
+                  FROM reviews_processed
+                  WHERE {where} AND aspect_csv IS NOT NULL)
+            WHERE trim(aspect) <> ''
+            GROUP BY 1
+            ORDER BY n DESC, aspect
+            LIMIT {int(top_n)}
+        """, params)
+        return dict(zip(df["aspect"], df["n"].astype(int)))
+
+    def aspect_summary(self) -> pd.DataFrame:
+        if "review_aspect_sentiment" not in self.sources:
+            return pd.DataFrame(columns=["aspect", "mentions", "avg_sentiment", "positive", "negative"])
+        df = self.query(ASPECT_SENTIMENT_SUMMARY)
+        df["avg_sentiment"] = df["avg_sentiment"].astype("float32")
+        return df
+
+    # ---------- exporters ----------
+    def copy_csv(self, sql: str, path: str) -> int:
+        """Stream a query result straight to CSV (no DataFrame); returns the row count."""
+        return int(self.con.cursor().execute(f"COPY ({sql}) TO {_quote(path)} (FORMAT csv, HEADER)").fetchone()[0])
+
+    def export_tables(self, out_dir: str, queries: Dict[str, str]) -> Dict[str, int]:
+        return {name: self.copy_csv(sql, os.path.join(out_dir, name)) for name, sql in queries.items()}
+
+    def write_parquet(self, out_dir: str) -> Dict[str, int]:
+        """Snapshots for ANALYTICS_PARQUET_DIR (zstd, one file per table)."""
+        out = {}
+        for table, sql in PARQUET_SQL.items():
+            if table in self.sources:
+                path = os.path.join(out_dir, f"{table}.parquet")
+                out[table] = int(self.con.cursor().execute(
+                    f"COPY ({sql}) TO {_quote(path)} (FORMAT parquet, COMPRESSION zstd)").fetchone()[0])
+        return out
+
+def _kpi_dict(df: pd.DataFrame) -> Dict:
+    counts = dict(zip(df["sentiment_label"], df["n"].astype(int)))
+    score_n = float(df["score_n"].sum()) if len(df) else 0.0
+    return {
+        "n_pos": counts.get("POSITIVE", 0),
+        "n_neg": counts.get("NEGATIVE", 0),
+        "n_neu": counts.get("NEUTRAL", 0),
+        "avg_conf": float(df["score_sum"].sum()) / score_n if score_n else 0.0,
+    }
+
+class FrameAnalytics:
+    """Same calls answered in pandas from the compact dashboard frame (fallback without DuckDB)."""
+    engine = "pandas"
+
+    def __init__(self, df_proc: pd.DataFrame, df_aspects: pd.DataFrame):
+        self.df = df_proc
+        self.df_aspects = df_aspects
+
+    def _filtered(self, labels):
+        # boolean mask on the shared frame; with every label selected there is nothing to filter or copy
+        if labels is None or set(labels) >= set(SENTIMENT_LABELS):
+            return self.df
+        return self.df[self.df["sentiment_label"].isin(list(labels))]
+
+    def trend(self, bucket, labels=None):
+        return self._filtered(labels).groupby(bucket, observed=True).agg(
+            Average_Sentiment=("score_signed", "mean"),
+            Review_Count=("review_id", "count"),
+        ).reset_index()
+
+    def cumulative(self, labels=None):
+        daily = self._filtered(labels).groupby("date", observed=True).agg(
+            Daily_Sentiment=("score_signed", "mean"),
+            Daily_Count=("review_id", "count"),
+        ).reset_index()
+        daily["Cumulative_Count"] = daily["Daily_Count"].cumsum()
+        daily["Cumulative_Sentiment"] = (
+            (daily["Daily_Sentiment"] * daily["Daily_Count"]).cumsum() / daily["Cumulative_Count"]
+        )
+        return daily.rename(columns={"date": "datetime"})
+
+    def kpis(self, bucket=None, labels=None):
+        df = self._filtered(labels)
+        if bucket and not df.empty:
+            df = df[df[bucket] == df[bucket].max()]
+        g = df.groupby("sentiment_label", observed=True)["score"]
+        return _kpi_dict(pd.DataFrame({"n": g.size(), "score_sum": g.sum(), "score_n": g.count()})
+                         .reset_index())
+
+    def aspect_frequencies(self, labels=None, top_n=WORDCLOUD_TOP_N):
+        s = self._filtered(labels)["aspect_csv"].dropna().astype(str).str.split(",").explode().str.strip()
+        counts = s[s != ""].value_counts()
+        counts = counts.sort_index(kind="stable").sort_values(ascending=False, kind="stable").head(top_n)
+        return {k: int(v) for k, v in counts.items()}
+
+    def aspect_summary(self):
+        return self.df_aspects
+
+def open_duckdb(db_url: str = DB_URL, parquet_dir: str = ANALYTICS_PARQUET_DIR) -> Optional[DuckAnalytics]:
+    """DuckAnalytics, or None when duckdb is missing / disabled or the database cannot be attached."""
+    if duckdb is None or ANALYTICS_ENGINE != "duckdb":
+        return None
+    try:
+        return DuckAnalytics(db_url, parquet_dir)
+    except (duckdb.Error, ValueError) as e:
+        # e.g. the sqlite/postgres extension is not installed and cannot be downloaded
+        print(f"DuckDB analytics unavailable ({e.__class__.__name__}: {str(e).splitlines()[0]}); using pandas")
+        return None
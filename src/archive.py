@@ -0,0 +1,154 @@
+# src/archive.py
+# Tiered storage for reviews_raw.text: text of processed reviews older than ARCHIVE_AFTER_DAYS
+# moves to compressed, date-partitioned JSONL files; the hot row keeps ids/metadata and an
+# `archive_ref` pointer (path relative to ARCHIVE_DIR). Readers that need the text call
+# get_texts()/hydrate(), which load a partition once and serve the rest from memory.
+#
+#   <ARCHIVE_DIR>/2024/05/2024-05-01/part-20241101T020000-0000.jsonl.zst   (gzip if zstandard is missing)
+from __future__ import annotations
+import gzip
+import io
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+try:
+    import zstandard
+except ImportError:   # optional; gzip is always available
+    zstandard = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "zstd" if zstandard else "gzip").lower()   # zstd | gzip
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "5000"))
+ARCHIVE_CACHE_PARTS = int(os.getenv("ARCHIVE_CACHE_PARTS", "32"))    # decompressed partitions kept in memory
+ZSTD_LEVEL = 10
+
+_EXT = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+
+# Only rows that already have a processed row are archived: phases 2/3 still need the text.
+CANDIDATES_SQL = """
+    SELECT r.id, r.source, r.source_id, r.author, r.text, r.url, r.created_at
+    FROM reviews_raw r
+    JOIN reviews_processed p ON p.review_id = r.id
+    WHERE r.created_at < :cutoff
+      AND r.archive_ref IS NULL
+      AND r.text IS NOT NULL
+    ORDER BY r.created_at
+    LIMIT :limit
+"""
+
+# ---------- file I/O ----------
+def _open_write(path: str):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("ARCHIVE_FORMAT=zstd needs the zstandard package")
+        raw = open(path, "wb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw), encoding="utf-8")
+    return gzip.open(path, "wt", encoding="utf-8")
+
+def _open_read(path: str):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed; install zstandard to read it")
+        raw = open(path, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw), encoding="utf-8")
+    return gzip.open(path, "rt", encoding="utf-8")
+
+def _partition_ref(day: str, run_tag: str, fmt: str) -> str:
+    return f"{day[:4]}/{day[5:7]}/{day}/part-{run_tag}{_EXT[fmt]}"
+
+def write_partition(rows: List[Dict], ref: str, root: str = ARCHIVE_DIR) -> None:
+    path = os.path.join(root, ref)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with _open_write(tmp) as f:
+        for r in rows:
+            f.write(json.dumps(r, default=str, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)   # the pointer is only written to the DB after the file is complete
+
+@lru_cache(maxsize=ARCHIVE_CACHE_PARTS)
+def _load_partition(path: str) -> Dict[int, str]:
+    out = {}
+    with _open_read(path) as f:
+        for line in f:
+            rec = json.loads(line)
+            out[int(rec["id"])] = rec.get("text")
+    return out
+
+# ---------- archiving ----------
+def archive_old(engine, older_than_days: int = ARCHIVE_AFTER_DAYS, batch: int = ARCHIVE_BATCH,
+                fmt: str = ARCHIVE_FORMAT, root: str = ARCHIVE_DIR, dry_run: bool = False) -> Dict:
+    """Move text older than the cutoff into archive partitions; returns counts for the run."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    run_tag = f"{datetime.utcnow():%Y%m%dT%H%M%S}"
+    stats = {"rows": 0, "partitions": 0, "bytes_text": 0, "cutoff": cutoff.isoformat(sep=" ")}
+    if dry_run:
+        with engine.connect() as conn:
+            n, size = conn.execute(text(
+                f"SELECT COUNT(*), SUM(LENGTH(text)) FROM ({CANDIDATES_SQL}) c"
+            ), {"cutoff": cutoff, "limit": -1 if engine.dialect.name == "sqlite" else None}).fetchone()
+        stats.update(rows=int(n or 0), bytes_text=int(size or 0))
+        return stats
+
+    seq = 0
+    while True:
+        with engine.connect() as conn:
+            df = pd.read_sql(text(CANDIDATES_SQL), conn, params={"cutoff": cutoff, "limit": batch})
+        if df.empty:
+            break
+        df["day"] = pd.to_datetime(df["created_at"]).dt.strftime("%Y-%m-%d")
+        updates = []
+        for day, part in df.groupby("day", sort=False):
+            ref = _partition_ref(day, f"{run_tag}-{seq:04d}", fmt)
+            write_partition(part.drop(columns=["day"]).to_dict("records"), ref, root)
+            updates += [{"ref": ref, "id": int(i)} for i in part["id"]]
+            stats["partitions"] += 1
+        seq += 1
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE reviews_raw SET text = NULL, archive_ref = :ref WHERE id = :id"), updates)
+        stats["rows"] += len(df)
+        stats["bytes_text"] += int(df["text"].str.len().sum())
+    return stats
+
+# ---------- lazy access ----------
+def get_texts(conn, review_ids: Iterable[int], root: str = ARCHIVE_DIR) -> Dict[int, str]:
+    """id -> text for hot and archived rows; each archive partition is decompressed at most once."""
+    ids = [int(i) for i in review_ids]
+    if not ids:
+        return {}
+    q = text("SELECT id, text, archive_ref FROM reviews_raw WHERE id IN :ids").bindparams(
+        bindparam("ids", expanding=True))
+    out, by_ref = {}, defaultdict(list)
+    for start in range(0, len(ids), 900):   # stay under SQLite's bound-parameter limit
+        for rid, txt, ref in conn.execute(q, {"ids": ids[start:start + 900]}):
+            if txt is None and ref:
+                by_ref[ref].append(rid)
+            else:
+                out[rid] = txt
+    for ref, rids in by_ref.items():
+        part = _load_partition(os.path.join(root, ref))
+        for rid in rids:
+            out[rid] = part.get(rid)
+    return out
+
+def hydrate(df: pd.DataFrame, id_col: str = "review_id", text_col: str = "text",
+            ref_col: str = "archive_ref", root: str = ARCHIVE_DIR) -> pd.DataFrame:
+    """Fill text for archived rows of a frame that carries `archive_ref`; hot rows are untouched."""
+    if ref_col not in df.columns:
+        return df
+    need = df[text_col].isna() & df[ref_col].notna()
+    if not need.any():
+        return df
+    texts = {}
+    for ref, rids in df.loc[need].groupby(ref_col)[id_col]:
+        part = _load_partition(os.path.join(root, ref))
+        texts.update({int(r): part.get(int(r)) for r in rids})
+    df.loc[need, text_col] = df.loc[need, id_col].map(texts)
+    return df
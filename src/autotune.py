@@ -0,0 +1,211 @@
+# src/autotune.py
+# Adaptive micro-batching for model inference. A BatchTuner packs texts into micro-batches by
+# estimated token count (not row count): many short comments share one forward pass, and a few
+# long threads never fill a whole batch. After every micro-batch it looks at the latency and the
+# process RSS and moves the token budget toward AUTOTUNE_TARGET_MS / AUTOTUNE_MAX_RSS_MB
+# (additive increase, multiplicative decrease). The budget it settles on is saved per host
+# (AUTOTUNE_DIR/<hostname>.json), so a restarted worker starts from its own tuned value.
+#
+#   tuner = BatchTuner.for_stage("sentiment")
+#   results = tuner.map_batches(texts, lambda chunk: model(chunk, batch_size=len(chunk)))
+from __future__ import annotations
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:
+    import fcntl   # POSIX; elsewhere concurrent saves fall back to last-writer-wins per file
+except ImportError:
+    fcntl = None
+
+AUTOTUNE = os.getenv("AUTOTUNE", "1") == "1"
+AUTOTUNE_DIR = os.getenv("AUTOTUNE_DIR", "data/autotune")
+AUTOTUNE_TARGET_MS = float(os.getenv("AUTOTUNE_TARGET_MS", "250"))        # per micro-batch
+AUTOTUNE_MAX_RSS_MB = float(os.getenv("AUTOTUNE_MAX_RSS_MB", "0"))        # 0 = no memory target
+AUTOTUNE_START_TOKENS = int(os.getenv("AUTOTUNE_START_TOKENS", "4096"))
+AUTOTUNE_MIN_TOKENS = int(os.getenv("AUTOTUNE_MIN_TOKENS", "256"))
+AUTOTUNE_MAX_TOKENS = int(os.getenv("AUTOTUNE_MAX_TOKENS", "131072"))
+AUTOTUNE_MAX_ROWS = int(os.getenv("AUTOTUNE_MAX_ROWS", "256"))            # cap even for tiny texts
+AUTOTUNE_SAVE_EVERY_S = float(os.getenv("AUTOTUNE_SAVE_EVERY_S", "60"))
+
+INCREASE_FRAC = 0.10   # additive step: 10% of the start budget per fast batch
+DECREASE = 0.7         # multiplicative back-off on a slow / heavy batch
+EWMA_ALPHA = 0.3
+CHARS_PER_TOKEN = 4    # BPE tokenizers average ~4 chars per English token
+
+def estimate_tokens(text: Optional[str], max_tokens: int = 512) -> int:
+    """Cheap token estimate (no tokenizer call); +2 for the special tokens."""
+    return min(max_tokens, len(text or "") // CHARS_PER_TOKEN + 2)
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB (0.0 if the platform gives no way to read it)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        return 0.0
+
+def state_path(host: str = "") -> str:
+    return os.path.join(AUTOTUNE_DIR, f"{host or socket.gethostname()}.json")
+
+class _HostState:
+    """
+    All tuners of this process share one JSON file per host, written atomically. Several processes
+    on a host (phase-3 shards) save into the same file: each merges its own keys into what is on
+    disk under a file lock, so one worker's save never drops another's tuned stages.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._changed = set()   # keys this process put since its last save
+        self._saved_at = time.monotonic()
+        self.state: Dict[str, Dict] = self._read()
+
+    def _read(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}   # a corrupt file only costs us the warm start
+
+    def get(self, key: str) -> Dict:
+        with self._lock:
+            return dict(self.state.get(key, {}))
+
+    def put(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self.state[key] = value
+            self._changed.add(key)
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= AUTOTUNE_SAVE_EVERY_S
+        if due:
+            self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)   # released when the lock file is closed
+                merged = self._read()
+                merged.update({k: self.state[k] for k in self._changed})
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(merged, f, indent=2, sort_keys=True)
+                os.replace(tmp, self.path)
+            self.state = merged
+            self._changed.clear()
+            self._dirty, self._saved_at = False, time.monotonic()
+
+_hosts: Dict[str, _HostState] = {}
+_hosts_lock = threading.Lock()
+
+def _host_state(path: str) -> _HostState:
+    with _hosts_lock:
+        if path not in _hosts:
+            _hosts[path] = _HostState(path)
+        return _hosts[path]
+
+class BatchTuner:
+    def __init__(self, key: str, target_ms: float = AUTOTUNE_TARGET_MS, max_rss_mb: float = AUTOTUNE_MAX_RSS_MB,
+                 start_tokens: int = AUTOTUNE_START_TOKENS, min_tokens: int = AUTOTUNE_MIN_TOKENS,
+                 max_tokens: int = AUTOTUNE_MAX_TOKENS, max_rows: int = AUTOTUNE_MAX_ROWS,
+                 path: Optional[str] = None):
+        self.key = key
+        self.target_ms = target_ms
+        self.max_rss_mb = max_rss_mb
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_rows = max_rows
+        self.step = max(1, int(start_tokens * INCREASE_FRAC))
+        self._store = _host_state(path or state_path())
+        saved = self._store.get(key)
+        self.budget = int(min(max_tokens, max(min_tokens, saved.get("budget_tokens", start_tokens))))
+        self.ms_per_token: Optional[float] = saved.get("ms_per_token")
+        self.stats = {"batches": 0, "tokens": 0, "increases": 0, "decreases": 0, "warm_start": bool(saved)}
+
+    @classmethod
+    def for_stage(cls, stage: str, variant: str = "") -> Optional["BatchTuner"]:
+        """Tuner for a model stage, or None when AUTOTUNE=0 (callers then keep their fixed batch size)."""
+        if not AUTOTUNE:
+            return None
+        return cls(f"{stage}|{variant}" if variant else stage)
+
+    def plan(self, texts: Sequence[Optional[str]], max_tokens_per_text: int = 512) -> List[List[int]]:
+        """
+        Micro-batches as lists of positions into texts. Texts are length-sorted first, so each
+        batch holds similar lengths and pads little; every batch fits the current token budget.
+        """
+        est = [estimate_tokens(t, max_tokens_per_text) for t in texts]
+        order = sorted(range(len(texts)), key=est.__getitem__)
+        batches, cur = [], []
+        for i in order:
+            # padded cost: every row costs as much as the longest one in the batch (the current one)
+            if cur and ((len(cur) + 1) * est[i] > self.budget or len(cur) >= self.max_rows):
+                batches.append(cur)
+                cur = []
+            cur.append(i)
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def observe(self, tokens: int, seconds: float) -> None:
+        """Feed back one micro-batch: tokens it held and how long it took."""
+        ms = seconds * 1000.0
+        rate = ms / max(tokens, 1)
+        self.ms_per_token = rate if self.ms_per_token is None else \
+            (1 - EWMA_ALPHA) * self.ms_per_token + EWMA_ALPHA * rate
+        rss = rss_mb()
+        if ms > self.target_ms or (self.max_rss_mb > 0 and rss > self.max_rss_mb):
+            # batches planned before the last back-off are still in flight; only a batch that fits
+            # the current budget and is still too slow/heavy may shrink it again
+            if tokens <= self.budget:
+                self.budget = max(self.min_tokens, int(self.budget * DECREASE))
+                self.stats["decreases"] += 1
+        elif ms < 0.8 * self.target_ms and tokens >= 0.5 * self.budget:
+            # only grow when the batch actually used the budget (a half-empty batch says nothing)
+            self.budget = min(self.max_tokens, self.budget + self.step)
+            self.stats["increases"] += 1
+        self.stats["batches"] += 1
+        self.stats["tokens"] += tokens
+        self._store.put(self.key, {
+            "budget_tokens": self.budget,
+            "ms_per_token": round(self.ms_per_token, 6),
+            "rss_mb": round(rss, 1),
+            "target_ms": self.target_ms,
+            "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        })
+
+    def map_batches(self, texts: Sequence[Optional[str]], fn: Callable[[List], List],
+                    max_tokens_per_text: int = 512) -> List:
+        """fn over the planned micro-batches, timed and fed back; results come back in input order."""
+        out: List = [None] * len(texts)
+        for idx in self.plan(texts, max_tokens_per_text):
+            chunk = [texts[i] for i in idx]
+            padded = len(chunk) * max(estimate_tokens(t, max_tokens_per_text) for t in chunk)
+            t0 = time.perf_counter()
+            res = fn(chunk)
+            self.observe(padded, time.perf_counter() - t0)
+            for i, r in zip(idx, res):
+                out[i] = r
+        return out
+
+    def save(self) -> None:
+        self._store.save()
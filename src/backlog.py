@@ -0,0 +1,39 @@
+# src/backlog.py
+# Low-water mark of the processing backlog: every reviews_raw id <= the mark has a processed row.
+# The unprocessed queries (src/queries.py) start just above it, so each batch range-searches the
+# unprocessed tail of the primary key instead of anti-joining the whole history. The mark is the
+# one row of `processing_watermark`; processors advance it after a run and it never moves back.
+#
+#   after = backlog.after(conn)              # ... WHERE p.review_id IS NULL AND r.id > :after
+#   backlog.advance(conn); conn.commit()
+import os
+
+from sqlalchemy import text
+
+from src import queries
+
+# ids are reserved before their insert commits, so a row can appear below ids already processed;
+# the queries re-check this many ids below the mark to pick such late commits up
+BACKLOG_WATERMARK_LAG = int(os.getenv("BACKLOG_WATERMARK_LAG", "1000"))
+
+def lagged(mark: int) -> int:
+    return max(0, int(mark or 0) - BACKLOG_WATERMARK_LAG)
+
+def mark(conn) -> int:
+    row = conn.execute(text(queries.BACKLOG_MARK)).fetchone()
+    return int(row[0]) if row else 0
+
+def after(conn) -> int:
+    """Lower bound (exclusive) for the unprocessed queries."""
+    return lagged(mark(conn))
+
+def advance(conn) -> int:
+    """Move the mark to just below the first unprocessed id (the newest id when none is left)."""
+    start = after(conn)
+    first = conn.execute(text(queries.UNPROCESSED_BATCH), {"after": start, "limit": 1}).fetchone()
+    if first is not None:
+        new = int(first[0]) - 1
+    else:
+        new = int(conn.execute(text("SELECT MAX(id) FROM reviews_raw")).scalar() or 0)
+    conn.execute(text(queries.BACKLOG_ADVANCE), {"last_id": new})
+    return mark(conn)
@@ -0,0 +1,68 @@
+# src/dashboard_data.py
+# Dashboard frames in a compact, read-only form: categoricals for the low-cardinality labels,
+# Arrow-backed strings, float32 scores and the time buckets precomputed once at load.
+# Used when DuckDB analytics (src/analytics.py) is unavailable: streamlit_app.py caches the result
+# with st.cache_resource, so every session shares one copy; nothing downstream may mutate these
+# frames (filter with masks, aggregate into new frames).
+from __future__ import annotations
+from typing import Tuple
+
+import pandas as pd
+from sqlalchemy import inspect
+
+from src import archive
+from src.queries import ASPECT_SENTIMENT_SUMMARY, DASHBOARD_PROCESSED, LATEST_FEEDBACK
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:   # plain pandas strings still beat object columns of Python str
+    STRING_DTYPE = "string"
+
+SENTIMENT_LABELS = ["POSITIVE", "NEGATIVE", "NEUTRAL"]
+
+def compact_processed(df: pd.DataFrame) -> pd.DataFrame:
+    out = pd.DataFrame({
+        "review_id": pd.to_numeric(df["review_id"], downcast="integer"),
+        "sentiment_label": pd.Categorical(df["sentiment_label"], categories=SENTIMENT_LABELS),
+        "score": df["score"].astype("float32"),
+        "score_signed": df["score_signed"].astype("float32"),
+        "topic_label": df["topic_label"].astype("category"),
+        "aspect_csv": df["aspect_csv"].astype(STRING_DTYPE),
+    })
+    dt = pd.to_datetime(df["processed_at"], errors="coerce")
+    out["datetime"] = dt
+    # trend buckets, labelled by period start (the KPI row compares against the same labels)
+    out["hour"] = dt.dt.floor("h")
+    out["date"] = dt.dt.normalize()
+    out["week"] = dt.dt.to_period("W").dt.start_time
+    out["month"] = dt.dt.to_period("M").dt.start_time
+    return out
+
+def compact_reviews(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()   # only the 10 newest rows
+    df["source"] = df["source"].astype("category")
+    df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
+    for col in ("author", "text"):
+        df[col] = df[col].astype(STRING_DTYPE)
+    return df
+
+def load_latest(conn, latest_n: int = 10) -> pd.DataFrame:
+    """Newest raw feedback (archived text hydrated) for the dashboard table."""
+    return compact_reviews(archive.hydrate(pd.read_sql(LATEST_FEEDBACK, conn, params={"n": latest_n})))
+
+def load_processed(conn) -> pd.DataFrame:
+    """All non-triaged processed rows, compacted (the pandas side of src/analytics.FrameAnalytics)."""
+    return compact_processed(pd.read_sql(DASHBOARD_PROCESSED, conn))
+
+def load_frames(conn, latest_n: int = 10) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(latest feedback, processed rows) for the dashboard."""
+    return load_latest(conn, latest_n), load_processed(conn)
+
+def load_aspect_summary(conn) -> pd.DataFrame:
+    """Per-aspect mentions and mean signed sentiment from review_aspect_sentiment (empty before phase 3 fills it)."""
+    if not inspect(conn).has_table("review_aspect_sentiment"):
+        return pd.DataFrame(columns=["aspect", "mentions", "avg_sentiment", "positive", "negative"])
+    df = pd.read_sql(ASPECT_SENTIMENT_SUMMARY, conn)
+    df["avg_sentiment"] = df["avg_sentiment"].astype("float32")
+    return df
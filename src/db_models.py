@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, func, Column, Index, Integer, String, Text, Float, DateTime, ForeignKey
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from dotenv import load_dotenv
 from datetime import datetime
@@ -9,8 +10,63 @@ load_dotenv()
 # Database URL
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
 
+# Connection pool (server databases only; SQLite keeps SQLAlchemy's defaults)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))      # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # drop connections older than this
+
+# SQLite concurrency: WAL lets readers run alongside the single writer, busy_timeout makes a
+# blocked writer wait instead of failing with "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")   # NORMAL is durable enough under WAL
+
+_ENGINES = {}
+
+def _sqlite_pragmas(dbapi_con, read_only: bool) -> None:
+    cur = dbapi_con.cursor()
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    if not read_only:
+        cur.execute("PRAGMA journal_mode=WAL")    # persisted in the file; no-op once set
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    if read_only:
+        cur.execute("PRAGMA query_only=1")
+    cur.close()
+
+def get_engine(url: str = None, read_only: bool = False):
+    """
+    One engine per URL for the whole process. Ingestors, processors, the exporter and the
+    dashboard all come through here so pool sizing is configured in one place.
+    read_only=True gives SQLite readers their own query_only connections.
+    """
+    url = url or DB_URL
+    key = (url, read_only and url.startswith("sqlite"))
+    if key not in _ENGINES:
+        kw = {"echo": False, "future": True, "pool_pre_ping": True}
+        if not url.startswith("sqlite"):
+            kw.update(
+                poolclass=QueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+            )
+        eng = create_engine(url, **kw)
+        if url.startswith("sqlite"):
+            event.listen(eng, "connect", lambda con, _rec, ro=key[1]: _sqlite_pragmas(con, ro))
+        _ENGINES[key] = eng
+    return _ENGINES[key]
+
+def get_read_engine(url: str = None):
+    return get_engine(url, read_only=True)
+
+def is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
 # SQLAlchemy setup
-engine = create_engine(DB_URL, echo=False, future=True)
+engine = get_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
@@ -26,9 +82,20 @@ class Review(Base):
     text = Column(Text)
     url = Column(String(300))
     created_at = Column(DateTime, default=datetime.utcnow)
+    archive_ref = Column(String(200))  # archive partition holding `text` once archived (src/archive.py)
+
+    # Offline review files only (tools/import_reviews.py); NULL for Reddit/YouTube comments
+    product_id = Column(String(100))
+    brand = Column(String(100))
+    rating = Column(Float)
 
     processed = relationship("Processed", back_populates="review", uselist=False)
 
+    __table_args__ = (
+        Index("ix_reviews_raw_created_at", "created_at"),                  # latest feedback
+        Index("ix_reviews_raw_source_created_at", "source", "created_at"),  # per-source listings
+    )
+
 class Processed(Base):
     __tablename__ = "reviews_processed"
 
@@ -50,10 +117,114 @@ class Processed(Base):
     topic_prob = Column(Float)         # NEW: probability score for topic
     topic_source = Column(String(50))  # NEW: where topic came from ("bertopic")
 
+    # Phase 3 – pre-filter: reason the models were skipped (nlp/triage.py); NULL = fully processed
+    triage_reason = Column(String(20))
+
+    # Version fingerprint of what produced each stage (nlp/versions.py); NULL = unknown / pre-versioning
+    aspects_version = Column(String(12))
+    sentiment_version = Column(String(12))
+    topics_version = Column(String(12))
+    aspect_sentiment_version = Column(String(12))
+
     processed_at = Column(DateTime, default=datetime.utcnow)
+    # last write of any stage; tools/reprocess.py bumps it and leaves processed_at alone (export watermark)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
     review = relationship("Review", back_populates="processed")
 
-# --- Helper ---
-def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    __table_args__ = (
+        # time bucketing; covers the trend/KPI columns so the table itself is never read
+        Index("ix_reviews_processed_processed_at",
+              "processed_at", "sentiment_label", "score", "score_signed", "review_id"),
+        Index("ix_reviews_processed_sentiment_processed_at", "sentiment_label", "processed_at"),
+        Index("ix_reviews_processed_updated_at", "updated_at"),   # incremental export
+    )
+
+class ReviewAspectSentiment(Base):
+    __tablename__ = "review_aspect_sentiment"
+
+    # Phase 3 – one row per (review, aspect): sentiment of only the sentences mentioning the aspect
+    review_id = Column(Integer, ForeignKey("reviews_raw.id"), primary_key=True, autoincrement=False)
+    aspect = Column(String(50), primary_key=True)
+    sentiment_label = Column(String(10))
+    score = Column(Float)
+    score_signed = Column(Float)
+    n_sentences = Column(Integer)
+    processed_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # per-aspect summary (dashboard) reads only this index
+        Index("ix_review_aspect_sentiment_aspect", "aspect", "sentiment_label", "score_signed"),
+        Index("ix_review_aspect_sentiment_updated_at", "updated_at"),
+    )
+
+class TopicLabel(Base):
+    __tablename__ = "topic_labels"
+
+    # One clean label per topic, computed once per saved BERTopic model
+    model_version = Column(String(40), primary_key=True)
+    topic_id = Column(Integer, primary_key=True, autoincrement=False)
+    topic_label = Column(String(200))
+
+class ProcessingWatermark(Base):
+    __tablename__ = "processing_watermark"
+
+    # Backlog low-water mark (src/backlog.py): every reviews_raw id <= last_id has a processed row
+    name = Column(String(50), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+
+class PipelineRunRecord(Base):
+    __tablename__ = "pipeline_runs"
+
+    # One row per processing/export script invocation (see src/metrics.py)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    script = Column(String(50), nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    status = Column(String(10))
+    duration_s = Column(Float)
+    rows_processed = Column(Integer)
+    queue_depth = Column(Integer)
+    metrics_json = Column(Text)
+
+# --- Helpers ---
+def init_db(bind=None):
+    """Bring the schema to the latest version (src/migrations.py); a version check once it is current."""
+    from src.migrations import ensure_current
+    ensure_current(bind if bind is not None else engine)
+
+def upsert(conn, table, rows, conflict_cols, update_cols=None, keep_existing=False) -> int:
+    """
+    Bulk INSERT ... ON CONFLICT for SQLite and Postgres.
+    update_cols=None -> DO NOTHING; keep_existing=True keeps the stored value when the new one is NULL.
+    Returns the driver's row count (rows actually inserted/updated) when it reports one.
+    """
+    if not rows:
+        return 0
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif conn.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"upsert not supported for {conn.dialect.name}")
+    stmt = dialect_insert(table)
+    if update_cols:
+        new = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_cols,
+            set_={c: func.coalesce(new[c], table.c[c]) if keep_existing else new[c] for c in update_cols},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_cols)
+    res = conn.execute(stmt, rows)
+    return res.rowcount if res.rowcount is not None and res.rowcount >= 0 else len(rows)
+
+def copy_to_csv(bind, query: str, path: str) -> None:
+    """Stream a query straight to CSV with Postgres COPY (no DataFrame in between)."""
+    raw = bind.raw_connection()
+    try:
+        with raw.cursor() as cur, open(path, "w", encoding="utf-8", newline="") as f:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", f)
+    finally:
+        raw.close()
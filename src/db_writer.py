@@ -0,0 +1,151 @@
+# src/db_writer.py
+# Single-writer queue: producers (ingestors) hand rows to one thread that owns the write
+# connection and commits many rows per transaction, instead of every caller committing per row.
+#
+#   with DBWriter() as writer:
+#       writer.submit(Review.__table__, [row], conflict_cols=["source_id"])
+#       writer.flush()        # e.g. before running a processing step that must see the rows
+from __future__ import annotations
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from itertools import groupby
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import insert
+
+from src.db_models import get_engine, upsert
+
+log = logging.getLogger("db-writer")
+
+WRITER_BATCH_ROWS = int(os.getenv("DB_WRITER_BATCH_ROWS", "500"))
+WRITER_FLUSH_MS = int(os.getenv("DB_WRITER_FLUSH_MS", "200"))       # max wait to fill a transaction
+WRITER_QUEUE_SIZE = int(os.getenv("DB_WRITER_QUEUE_SIZE", "10000"))  # producers block when full
+
+_STOP = object()
+
+class _Job:
+    __slots__ = ("table", "rows", "conflict_cols", "update_cols", "future")
+
+    def __init__(self, table, rows, conflict_cols, update_cols):
+        self.table = table
+        self.rows = rows
+        self.conflict_cols = conflict_cols
+        self.update_cols = update_cols
+        self.future: Future = Future()
+
+    def key(self):
+        return (id(self.table), tuple(self.conflict_cols or ()), tuple(self.update_cols or ()))
+
+class DBWriter:
+    def __init__(self, engine=None, batch_rows: int = WRITER_BATCH_ROWS,
+                 flush_ms: int = WRITER_FLUSH_MS, queue_size: int = WRITER_QUEUE_SIZE):
+        self.engine = engine or get_engine()
+        self.batch_rows = batch_rows
+        self.flush_s = flush_ms / 1000.0
+        self.q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.stats = {"rows": 0, "transactions": 0, "errors": 0}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- producer API ----------
+    def submit(self, table, rows: Sequence[Dict], conflict_cols: Optional[List[str]] = None,
+               update_cols: Optional[List[str]] = None) -> Future:
+        """
+        Queue rows for `table`. With conflict_cols the insert is INSERT ... ON CONFLICT
+        (DO NOTHING, or DO UPDATE of update_cols). The future resolves once committed.
+        """
+        if self._closed:
+            raise RuntimeError("DBWriter is closed")
+        job = _Job(table, list(rows), conflict_cols, update_cols)
+        self.q.put(job)
+        return job.future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until everything submitted so far is committed."""
+        marker = _Job(None, [], None, None)
+        self.q.put(marker)
+        marker.future.result(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.q.put(_STOP)
+        self._thread.join(timeout)
+        log.info("DB writer closed: %s", self.stats)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- writer thread ----------
+    def _run(self):
+        stop = False
+        while not stop:
+            job = self.q.get()
+            if job is _STOP:
+                break
+            batch, n = [job], len(job.rows)
+            deadline = time.monotonic() + self.flush_s
+            while job.table is not None and n < self.batch_rows:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    job = self.q.get(timeout=wait)
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                batch.append(job)
+                n += len(job.rows)
+            self._commit(batch)
+
+    def _write(self, conn, jobs: List[_Job]) -> None:
+        # consecutive jobs for the same table/conflict spec become one executemany
+        for _, group in groupby(jobs, key=_Job.key):
+            group = list(group)
+            rows = [r for j in group for r in j.rows]
+            first = group[0]
+            if first.conflict_cols:
+                upsert(conn, first.table, rows, first.conflict_cols, first.update_cols)
+            else:
+                conn.execute(insert(first.table), rows)
+
+    def _commit(self, batch: List[_Job]) -> None:
+        jobs = [j for j in batch if j.table is not None and j.rows]
+        try:
+            if jobs:
+                with self.engine.begin() as conn:
+                    self._write(conn, jobs)
+                self.stats["transactions"] += 1
+                self.stats["rows"] += sum(len(j.rows) for j in jobs)
+            for j in batch:
+                j.future.set_result(len(j.rows))
+        except Exception as e:
+            # one bad job must not drop everyone else's rows: retry each on its own
+            log.warning("Batched write failed (%s); retrying %d jobs individually", e, len(jobs))
+            for j in batch:
+                if j.future.done():
+                    continue
+                if j.table is None or not j.rows:
+                    j.future.set_result(0)
+                    continue
+                try:
+                    with self.engine.begin() as conn:
+                        self._write(conn, [j])
+                    self.stats["transactions"] += 1
+                    self.stats["rows"] += len(j.rows)
+                    j.future.set_result(len(j.rows))
+                except Exception as job_err:
+                    self.stats["errors"] += 1
+                    log.warning("Write to %s failed: %s", j.table.name, job_err)
+                    j.future.set_exception(job_err)
@@ -0,0 +1,216 @@
+# src/metrics.py
+# Per-stage timers/counters for the processing + export scripts.
+# Each run is stored as a JSON record in `pipeline_runs` and, if METRICS_TEXTFILE_DIR is set,
+# written as a Prometheus textfile (node_exporter textfile collector format).
+#
+#   with metrics.pipeline_run("phase3", con):
+#       with metrics.stage("fetch"):
+#           ...
+#       metrics.incr("rows_processed", len(df))
+from __future__ import annotations
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+log = logging.getLogger("pipeline-metrics")
+
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", "")
+METRIC_PREFIX = "aspect_pipeline"
+
+# :after is the backlog watermark (src/backlog.py): everything below it is processed
+QUEUE_DEPTH_SQL = """
+    SELECT COUNT(*)
+    FROM reviews_raw r
+    LEFT JOIN reviews_processed p ON p.review_id = r.id
+    WHERE p.review_id IS NULL
+      AND r.id > :after
+"""
+
+class PipelineRun:
+    def __init__(self, script: str):
+        self.script = script
+        self.started_at = datetime.utcnow()
+        self._t0 = time.perf_counter()
+        self.timers: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.status = "running"
+        self.duration = 0.0
+        self.profiler = None   # src.profiling.Profiler when --profile is given
+
+    @contextmanager
+    def stage(self, name: str):
+        prof = self.profiler
+        if prof is not None:
+            prof.enter(name)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.exit(name)
+            self.timers[name] = self.timers.get(name, 0.0) + (time.perf_counter() - t0)
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def incr(self, name: str, n: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def as_record(self) -> Dict:
+        return {
+            "script": self.script,
+            "started_at": self.started_at.isoformat(sep=" "),
+            "duration_s": round(self.duration, 4),
+            "status": self.status,
+            "stages": {k: {"seconds": round(v, 4), "calls": self.calls[k]} for k, v in self.timers.items()},
+            "counters": self.counters,
+            "gauges": self.gauges,
+        }
+
+    def prometheus_text(self) -> str:
+        lbl = f'script="{self.script}"'
+        lines = [
+            f"# TYPE {METRIC_PREFIX}_stage_seconds gauge",
+            *[f'{METRIC_PREFIX}_stage_seconds{{{lbl},stage="{k}"}} {v:.6f}' for k, v in self.timers.items()],
+            f"# TYPE {METRIC_PREFIX}_stage_calls gauge",
+            *[f'{METRIC_PREFIX}_stage_calls{{{lbl},stage="{k}"}} {v}' for k, v in self.calls.items()],
+            f"# TYPE {METRIC_PREFIX}_count gauge",
+            *[f'{METRIC_PREFIX}_count{{{lbl},name="{k}"}} {v}' for k, v in self.counters.items()],
+            *[f'{METRIC_PREFIX}_{k}{{{lbl}}} {v}' for k, v in self.gauges.items()],
+            f'{METRIC_PREFIX}_last_run_duration_seconds{{{lbl}}} {self.duration:.6f}',
+            f'{METRIC_PREFIX}_last_run_success{{{lbl}}} {1 if self.status == "ok" else 0}',
+            f'{METRIC_PREFIX}_last_run_timestamp_seconds{{{lbl}}} {time.time():.0f}',
+        ]
+        return "\n".join(lines) + "\n"
+
+# ---------- module-level "current run" so deep helpers can record without plumbing ----------
+_CURRENT: List[PipelineRun] = []
+
+def current() -> Optional[PipelineRun]:
+    return _CURRENT[-1] if _CURRENT else None
+
+@contextmanager
+def stage(name: str):
+    run = current()
+    if run is None:
+        yield
+        return
+    with run.stage(name):
+        yield
+
+def incr(name: str, n: float = 1) -> None:
+    run = current()
+    if run is not None:
+        run.incr(name, n)
+
+def gauge(name: str, value: float) -> None:
+    run = current()
+    if run is not None:
+        run.gauge(name, value)
+
+# ---------- DB helpers (sqlite3 connection or SQLAlchemy engine/connection) ----------
+def _execute(con, sql: str, params: Optional[Dict] = None):
+    if isinstance(con, sqlite3.Connection):
+        cur = con.execute(sql, params or {})
+        con.commit()
+        return cur
+    from sqlalchemy import text
+    if hasattr(con, "begin") and not hasattr(con, "in_transaction"):   # Engine
+        with con.begin() as c:
+            return c.execute(text(sql), params or {})
+    res = con.execute(text(sql), params or {})
+    con.commit()
+    return res
+
+def queue_depth(con) -> int:
+    """Unprocessed reviews_raw rows (the backlog the processors still have to drain)."""
+    from src import backlog, queries
+    row = _execute(con, queries.BACKLOG_MARK).fetchone()
+    return int(_execute(con, QUEUE_DEPTH_SQL, {"after": backlog.lagged(row[0] if row else 0)}).fetchone()[0])
+
+def _ensure_runs_table(con) -> None:
+    _execute(con, """
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            id INTEGER PRIMARY KEY,
+            script VARCHAR(50) NOT NULL,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            status VARCHAR(10),
+            duration_s FLOAT,
+            rows_processed INTEGER,
+            queue_depth INTEGER,
+            metrics_json TEXT
+        )
+    """)
+
+def _write_textfile(run: PipelineRun) -> None:
+    os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+    path = os.path.join(METRICS_TEXTFILE_DIR, f"{METRIC_PREFIX}_{run.script}.prom")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(run.prometheus_text())
+    os.replace(tmp, path)   # collector never reads a half-written file
+
+def record(run: PipelineRun, con=None) -> None:
+    if con is not None:
+        try:
+            run.gauge("queue_depth", queue_depth(con))
+        except Exception as e:
+            log.warning("queue depth unavailable: %s", e)
+    rec = run.as_record()
+    if con is not None:
+        try:
+            _ensure_runs_table(con)
+            _execute(con, """
+                INSERT INTO pipeline_runs
+                    (script, started_at, finished_at, status, duration_s, rows_processed, queue_depth, metrics_json)
+                VALUES (:script, :started_at, :finished_at, :status, :duration_s, :rows, :queue_depth, :metrics)
+            """, {
+                "script": run.script,
+                "started_at": run.started_at.isoformat(sep=" "),
+                "finished_at": datetime.utcnow().isoformat(sep=" "),
+                "status": run.status,
+                "duration_s": run.duration,
+                "rows": int(run.counters.get("rows_processed", 0)),
+                "queue_depth": run.gauges.get("queue_depth"),
+                "metrics": json.dumps(rec),
+            })
+        except Exception as e:
+            log.warning("could not store pipeline run: %s", e)
+    if METRICS_TEXTFILE_DIR:
+        try:
+            _write_textfile(run)
+        except OSError as e:
+            log.warning("could not write metrics textfile: %s", e)
+
+@contextmanager
+def pipeline_run(script: str, con=None, profiler=None):
+    """Scope one script invocation; the run is recorded even when the body raises."""
+    run = PipelineRun(script)
+    run.profiler = profiler
+    _CURRENT.append(run)
+    try:
+        yield run
+        run.status = "ok"
+    except SystemExit as e:
+        # sys.exit() / sys.exit(0) inside a run is a normal early return, not a failure
+        run.status = "ok" if e.code in (None, 0) else "error"
+        raise
+    except BaseException:
+        run.status = "error"
+        raise
+    finally:
+        _CURRENT.pop()
+        run.duration = time.perf_counter() - run._t0
+        if profiler is not None:
+            profiler.close()
+        record(run, con)
+        print(f"Run metrics [{script}]:", json.dumps(run.as_record()))
@@ -0,0 +1,274 @@
+# src/migrations.py
+# Versioned schema migrations. Each step is idempotent and runs once per database; the applied
+# version is recorded in `schema_version`, so the processing hot path (init_db) only compares
+# a version number instead of re-running dedupe/backfill/DDL on every mini-batch.
+#
+#   python -m src.migrations            # apply pending steps
+#   python -m src.migrations --status   # show applied / pending
+#   python -m src.migrations --check    # migrate, then fail if a model change has no step
+#
+# To change the schema: edit the model in src/db_models.py, then append a step here with the
+# next version number and explicit DDL for that change. Never renumber or edit a step that has shipped.
+from __future__ import annotations
+import threading
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from src.db_models import engine, upsert
+
+_meta = MetaData()
+schema_version = Table(
+    "schema_version", _meta,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(100)),
+    Column("applied_at", DateTime),
+)
+
+# ---------- steps ----------
+# Each step spells out its own DDL and never reads the live models in src/db_models.py: a step
+# must do today exactly what it did when it shipped. Column/index DDL is guarded (inspect /
+# IF NOT EXISTS) because databases created by create_all() (bench/synth.py) already have it.
+_v1 = MetaData()   # the tables as they were when migrations were introduced (step 1)
+Table(
+    "reviews_raw", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("source", String(50), nullable=False),
+    Column("source_id", String(100), unique=True, nullable=False),
+    Column("author", String(100)),
+    Column("text", Text),
+    Column("url", String(300)),
+    Column("created_at", DateTime),
+)
+Table(
+    "reviews_processed", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("review_id", Integer, ForeignKey("reviews_raw.id"), nullable=False, unique=True),
+    Column("aspects", Text),
+    Column("aspect_csv", Text),
+    Column("sentiment_label", String(10)),
+    Column("score", Float),
+    Column("score_signed", Float),
+    Column("topic_id", Integer),
+    Column("topic_label", String(200)),
+    Column("processed_at", DateTime),
+)
+Table(
+    "review_aspect_sentiment", _v1,
+    Column("review_id", Integer, ForeignKey("reviews_raw.id"), primary_key=True, autoincrement=False),
+    Column("aspect", String(50), primary_key=True),
+    Column("sentiment_label", String(10)),
+    Column("score", Float),
+    Column("score_signed", Float),
+    Column("n_sentences", Integer),
+    Column("processed_at", DateTime),
+)
+Table(
+    "topic_labels", _v1,
+    Column("model_version", String(40), primary_key=True),
+    Column("topic_id", Integer, primary_key=True, autoincrement=False),
+    Column("topic_label", String(200)),
+)
+Table(
+    "pipeline_runs", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("script", String(50), nullable=False),
+    Column("started_at", DateTime),
+    Column("finished_at", DateTime),
+    Column("status", String(10)),
+    Column("duration_s", Float),
+    Column("rows_processed", Integer),
+    Column("queue_depth", Integer),
+    Column("metrics_json", Text),
+)
+
+def _add_columns(conn, table: str, columns: List[Tuple[str, object]]) -> None:
+    """ALTER TABLE ... ADD COLUMN for each (name, type) the table doesn't have yet (all nullable)."""
+    have = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name, type_ in columns:
+        if name not in have:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {type_.compile(dialect=conn.dialect)}"))
+
+def _create_tables(conn):
+    _v1.create_all(bind=conn, checkfirst=True)
+
+def _model_columns(conn):
+    # phase-3 topic details, archiving and the offline-import columns, on databases created before them
+    _add_columns(conn, "reviews_processed", [("topic_prob", Float()), ("topic_source", String(50))])
+    _add_columns(conn, "reviews_raw", [("archive_ref", String(200)), ("product_id", String(100)),
+                                       ("brand", String(100)), ("rating", Float())])
+
+def _dedupe_processed(conn):
+    # old databases could hold several processed rows per review; keep the newest, then make
+    # review_id unique so ON CONFLICT(review_id) has an index to target
+    conn.execute(text("""
+        DELETE FROM reviews_processed
+        WHERE review_id IS NOT NULL
+          AND id NOT IN (
+            SELECT MAX(id) FROM reviews_processed
+            WHERE review_id IS NOT NULL
+            GROUP BY review_id
+          )
+    """))
+    conn.execute(text("""CREATE UNIQUE INDEX IF NOT EXISTS ux_reviews_processed_review_id
+                         ON reviews_processed(review_id)"""))
+
+def _backfill_processed_at(conn):
+    conn.execute(text("""UPDATE reviews_processed
+                         SET processed_at = CURRENT_TIMESTAMP
+                         WHERE processed_at IS NULL"""))
+
+def _model_indexes(conn):
+    for ddl in (
+        "ix_reviews_raw_created_at ON reviews_raw(created_at)",
+        "ix_reviews_raw_source_created_at ON reviews_raw(source, created_at)",
+        "ix_reviews_processed_processed_at "
+        "ON reviews_processed(processed_at, sentiment_label, score, score_signed, review_id)",
+        "ix_reviews_processed_sentiment_processed_at ON reviews_processed(sentiment_label, processed_at)",
+        "ix_review_aspect_sentiment_aspect ON review_aspect_sentiment(aspect, sentiment_label, score_signed)",
+    ):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {ddl}"))
+
+def _processed_triage_reason(conn):
+    # reason the phase-3 models were skipped (nlp/triage.py)
+    _add_columns(conn, "reviews_processed", [("triage_reason", String(20))])
+
+def _processed_stage_versions(conn):
+    # per-stage version fingerprints (nlp/versions.py)
+    _add_columns(conn, "reviews_processed", [(f"{stage}_version", String(12))
+                                             for stage in ("aspects", "sentiment", "topics", "aspect_sentiment")])
+
+def _processed_updated_at(conn):
+    # row version for the incremental export: reprocess rewrites results but keeps processed_at
+    for table in ("reviews_processed", "review_aspect_sentiment"):
+        _add_columns(conn, table, [("updated_at", DateTime())])
+        conn.execute(text(f"UPDATE {table} SET updated_at = processed_at WHERE updated_at IS NULL"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_updated_at ON {table}(updated_at)"))
+
+def _processing_watermark(conn):
+    # backlog low-water mark (src/backlog.py); starts at 0, the first processor run advances it
+    conn.execute(text("""CREATE TABLE IF NOT EXISTS processing_watermark (
+                             name VARCHAR(50) PRIMARY KEY,
+                             last_id INTEGER NOT NULL
+                         )"""))
+    conn.execute(text("""INSERT INTO processing_watermark (name, last_id)
+                         SELECT 'backlog', 0
+                         WHERE NOT EXISTS (SELECT 1 FROM processing_watermark WHERE name = 'backlog')"""))
+
+# (version, name, step) in apply order
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "create_tables", _create_tables),
+    (2, "model_columns", _model_columns),
+    (3, "dedupe_processed", _dedupe_processed),
+    (4, "backfill_processed_at", _backfill_processed_at),
+    (5, "model_indexes", _model_indexes),
+    (6, "processed_triage_reason", _processed_triage_reason),
+    (7, "processed_stage_versions", _processed_stage_versions),
+    (8, "processed_updated_at", _processed_updated_at),
+    (9, "processing_watermark", _processing_watermark),
+]
+LATEST = MIGRATIONS[-1][0]
+
+# ---------- runner ----------
+_current_urls = set()   # databases this process has already seen at LATEST
+_lock = threading.Lock()
+
+def _url(bind) -> str:
+    return str(bind.engine.url if isinstance(bind, Connection) else bind.url)
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+def _apply(conn, version: int, name: str, step: Callable) -> None:
+    schema_version.create(conn, checkfirst=True)
+    step(conn)
+    upsert(conn, schema_version, [{"version": version, "name": name, "applied_at": datetime.utcnow()}],
+           ["version"])
+    print(f"Schema migration {version} ({name}) applied")
+
+def migrate(bind=None) -> List[int]:
+    """Apply pending steps in order. An Engine commits per step; a Connection runs them inside its transaction."""
+    bind = bind if bind is not None else engine
+    applied = []
+    if isinstance(bind, Engine):
+        with bind.connect() as conn:
+            have = current_version(conn)
+        for version, name, step in MIGRATIONS:
+            if version > have:
+                with bind.begin() as conn:
+                    _apply(conn, version, name, step)
+                applied.append(version)
+    else:
+        have = current_version(bind)
+        for version, name, step in MIGRATIONS:
+            if version > have:
+                _apply(bind, version, name, step)
+                applied.append(version)
+    return applied
+
+def ensure_current(bind=None) -> None:
+    """Hot-path check: one version lookup per database per process, migrations only when behind."""
+    bind = bind if bind is not None else engine
+    key = _url(bind)
+    if key in _current_urls:
+        return
+    with _lock:
+        if key in _current_urls:
+            return
+        if isinstance(bind, Engine):
+            with bind.connect() as conn:
+                behind = current_version(conn) < LATEST
+        else:
+            behind = current_version(bind) < LATEST
+        if behind:
+            migrate(bind)
+        _current_urls.add(key)
+
+def status(bind=None) -> List[dict]:
+    bind = bind if bind is not None else engine
+    with bind.connect() as conn:
+        have = current_version(conn)
+    return [{"version": v, "name": n, "applied": v <= have} for v, n, _ in MIGRATIONS]
+
+def drift(bind=None) -> List[str]:
+    """Model columns / indexes (src/db_models.py) a migrated database lacks: a model change without a step."""
+    from src.db_models import Base
+    bind = bind if bind is not None else engine
+    out = []
+    with bind.connect() as conn:
+        insp = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                out.append(f"table {table.name}")
+                continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            out += [f"column {table.name}.{c.name}" for c in table.columns if c.name not in have]
+            have = {i["name"] for i in insp.get_indexes(table.name)}
+            out += [f"index {i.name}" for i in table.indexes if i.name not in have]
+    return out
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--status", action="store_true", help="list steps without applying them")
+    ap.add_argument("--check", action="store_true",
+                    help="apply pending steps, then exit 1 if the schema lacks anything the models declare")
+    args = ap.parse_args()
+    if args.check:
+        migrate()
+        missing = drift()
+        for m in missing:
+            print(f"missing  {m}")
+        if missing:
+            raise SystemExit("Schema differs from src/db_models.py: add a migration step for the change.")
+        print(f"Schema at version {LATEST} matches src/db_models.py.")
+    elif args.status:
+        for s in status():
+            print(f"{'applied' if s['applied'] else 'pending'}  {s['version']:>3}  {s['name']}")
+    else:
+        done = migrate()
+        print(f"Applied {len(done)} migration(s); schema at version {LATEST}.")
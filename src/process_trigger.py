@@ -0,0 +1,120 @@
+# src/process_trigger.py
+# Micro-batching trigger for the realtime ingestors: the stream loop only calls notify();
+# a worker thread runs the processor once `flush_rows` new rows are pending or the oldest
+# pending row has waited `flush_ms`, whichever comes first. Notifications that arrive while
+# the processor is running are coalesced into the next run instead of queueing one run each.
+#
+#   trigger = ProcessTrigger(process_batch, flush_rows=100, flush_ms=5000, before=writer.flush)
+#   ... trigger.notify() per saved row ...
+#   trigger.close()     # runs once more for anything still pending
+from __future__ import annotations
+import importlib
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+log = logging.getLogger("process-trigger")
+
+TRIGGER_QUEUE_SIZE = int(os.getenv("PROCESS_TRIGGER_QUEUE", "1000"))
+# "module:function" run per micro-batch. It must write the full result (sentiment, topics): any
+# reviews_processed row takes the review out of phase 3's queue, so an aspect-only processor
+# (phase 2) would leave those reviews without sentiment for good.
+REALTIME_PROCESSOR = os.getenv("REALTIME_PROCESSOR", "realtime.process_new_phase3:process_pending")
+
+def load_processor(spec: str = REALTIME_PROCESSOR) -> Optional[Callable[[], object]]:
+    """The configured processor, or None (ingest only) when it cannot be imported."""
+    module, _, name = spec.partition(":")
+    try:
+        return getattr(importlib.import_module(module), name or "main")
+    except Exception as e:   # heavy NLP dependencies missing on an ingest-only box
+        log.warning("Realtime processor %s unavailable (%s: %s); ingesting without processing",
+                    spec, e.__class__.__name__, e)
+        return None
+
+_STOP = object()
+
+class ProcessTrigger:
+    def __init__(self, process_fn: Callable[[], object], flush_rows: int, flush_ms: int,
+                 before: Optional[Callable[[], object]] = None, queue_size: int = TRIGGER_QUEUE_SIZE):
+        self.process_fn = process_fn
+        self.before = before
+        self.flush_rows = max(1, flush_rows)
+        self.flush_s = flush_ms / 1000.0
+        # bounded: if the worker falls far behind, counts spill into _overflow instead of blocking the stream
+        self.q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._overflow = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {"runs": 0, "rows": 0, "coalesced": 0, "errors": 0,
+                                        "max_wait_s": 0.0, "process_seconds": 0.0}
+        self._thread = threading.Thread(target=self._run, name="process-trigger", daemon=True)
+        self._thread.start()
+
+    def notify(self, n: int = 1) -> None:
+        """Record n newly saved rows; never blocks the caller."""
+        try:
+            self.q.put_nowait((n, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._overflow += n
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self.q.put(_STOP)
+        self._thread.join(timeout)
+        log.info("Process trigger closed: %s", self.stats)
+
+    # ---------- worker ----------
+    def _take_overflow(self) -> int:
+        with self._lock:
+            n, self._overflow = self._overflow, 0
+        return n
+
+    def _run(self):
+        pending, first_at, stop = 0, None, False
+        while not stop:
+            wait = None if not pending else max(0.0, first_at + self.flush_s - time.monotonic())
+            try:
+                item = self.q.get(timeout=wait)
+            except queue.Empty:
+                item = None
+            events = [item] if item is not None else []
+            while True:   # coalesce everything that queued up while we were waiting/processing
+                try:
+                    events.append(self.q.get_nowait())
+                except queue.Empty:
+                    break
+            for ev in events:
+                if ev is _STOP:
+                    stop = True
+                    continue
+                n, at = ev
+                pending += n
+                first_at = at if first_at is None else min(first_at, at)
+            spilled = self._take_overflow()
+            if spilled:
+                pending += spilled
+                first_at = first_at or time.monotonic()
+            self.stats["coalesced"] += max(0, len(events) - 1)
+
+            due = pending and (pending >= self.flush_rows or time.monotonic() - first_at >= self.flush_s)
+            if due or (stop and pending):
+                self._process(pending, first_at)
+                pending, first_at = 0, None
+
+    def _process(self, rows: int, first_at: float) -> None:
+        t0 = time.monotonic()
+        try:
+            if self.before:
+                self.before()
+            self.process_fn()
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning("Processing error: %s", e)
+        t1 = time.monotonic()
+        self.stats["runs"] += 1
+        self.stats["rows"] += rows
+        self.stats["process_seconds"] += t1 - t0
+        self.stats["max_wait_s"] = max(self.stats["max_wait_s"], t1 - first_at)
+        log.info("Processed micro-batch of %d new rows in %.2fs", rows, t1 - t0)
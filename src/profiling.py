@@ -0,0 +1,174 @@
+# src/profiling.py
+# Opt-in profiling for the processing/export scripts (`--profile`).
+# Hooks into the metrics stages (fetch/aspects/sentiment/topics/write/...), so each stage gets:
+#   <stage>.pstats        cProfile stats            (mode=cprofile)
+#   <stage>.collapsed     folded stacks for flamegraph.pl / speedscope
+#   <stage>.alloc.txt     tracemalloc allocation hotspots
+# mode=sample uses a low-overhead stack sampler thread instead of cProfile and writes one
+# collapsed file with the stage as the root frame.
+# When --profile is not given nothing is attached and stages pay a single attribute check.
+from __future__ import annotations
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")          # cprofile | sample
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "1") == "1"
+ALLOC_TOP_N = 30
+MIN_FRAME_SECONDS = 1e-6   # prune sub-microsecond paths when folding cProfile stacks
+
+def add_cli_args(ap) -> None:
+    ap.add_argument("--profile", action="store_true", help="write per-stage profiles (see src/profiling.py)")
+    ap.add_argument("--profile-dir", default=PROFILE_DIR)
+    ap.add_argument("--profile-mode", choices=["cprofile", "sample"], default=PROFILE_MODE)
+
+def from_args(args, script: str) -> Optional["Profiler"]:
+    if not getattr(args, "profile", False):
+        return None
+    return Profiler(script, args.profile_dir, args.profile_mode)
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+class _Sampler(threading.Thread):
+    """Samples the target thread's Python stack every interval; counts folded stacks."""
+
+    def __init__(self, thread_id: int, interval_s: float, stage_of):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stage_of = stage_of
+        self.counts: Counter = Counter()
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval_s):
+            stage = self.stage_of()
+            if not stage:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            self.counts[";".join([stage] + stack[::-1])] += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join(timeout=1)
+
+class Profiler:
+    def __init__(self, script: str, out_dir: str = PROFILE_DIR, mode: str = PROFILE_MODE):
+        self.script = script
+        self.mode = mode
+        self.run_dir = os.path.join(out_dir, f"{script}-{datetime.utcnow():%Y%m%dT%H%M%S}")
+        os.makedirs(self.run_dir, exist_ok=True)
+        self._stack: List[str] = []
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._alloc: Dict[str, Counter] = defaultdict(Counter)
+        self._alloc_peak: Dict[str, int] = {}
+        self._snapshots: List = []
+        self._sampler = None
+        if PROFILE_TRACEMALLOC:
+            tracemalloc.start(1)
+        if mode == "sample":
+            self._sampler = _Sampler(threading.get_ident(), PROFILE_SAMPLE_MS / 1000.0,
+                                     lambda: self._stack[-1] if self._stack else None)
+            self._sampler.start()
+
+    # ---------- stage hooks (called by metrics.PipelineRun.stage) ----------
+    def enter(self, stage: str) -> None:
+        if self.mode == "cprofile":
+            if self._stack:
+                self._profiles[self._stack[-1]].disable()   # only one profiler may be active
+            self._profiles.setdefault(stage, cProfile.Profile()).enable()
+        if PROFILE_TRACEMALLOC:
+            tracemalloc.reset_peak()
+            self._snapshots.append(tracemalloc.take_snapshot())
+        self._stack.append(stage)
+
+    def exit(self, stage: str) -> None:
+        self._stack.pop()
+        if self.mode == "cprofile":
+            self._profiles[stage].disable()
+            if self._stack:
+                self._profiles[self._stack[-1]].enable()
+        if PROFILE_TRACEMALLOC and self._snapshots:
+            before = self._snapshots.pop()
+            after = tracemalloc.take_snapshot()
+            for st in after.compare_to(before, "lineno")[:ALLOC_TOP_N * 2]:
+                if st.size_diff > 0:
+                    self._alloc[stage][str(st.traceback[0])] += st.size_diff
+            _, peak = tracemalloc.get_traced_memory()
+            self._alloc_peak[stage] = max(self._alloc_peak.get(stage, 0), peak)
+
+    # ---------- output ----------
+    def close(self) -> str:
+        if self._sampler:
+            self._sampler.stop()
+            self._write_lines(f"{self.script}.collapsed",
+                              [f"{k} {v}" for k, v in self._sampler.counts.most_common()])
+        for stage, prof in self._profiles.items():
+            prof.dump_stats(os.path.join(self.run_dir, f"{stage}.pstats"))
+            self._write_lines(f"{stage}.collapsed", collapse_pstats(pstats.Stats(prof), root=stage))
+        for stage, alloc in self._alloc.items():
+            lines = [f"# peak traced memory during stage: {self._alloc_peak.get(stage, 0) / 2**20:.1f} MiB",
+                     "# bytes_allocated  location"]
+            lines += [f"{size:>14,d}  {loc}" for loc, size in alloc.most_common(ALLOC_TOP_N)]
+            self._write_lines(f"{stage}.alloc.txt", lines)
+        if PROFILE_TRACEMALLOC and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        print(f"Profiles written to {self.run_dir}")
+        return self.run_dir
+
+    def _write_lines(self, name: str, lines: List[str]) -> None:
+        with open(os.path.join(self.run_dir, name), "w") as f:
+            f.write("\n".join(lines) + ("\n" if lines else ""))
+
+def collapse_pstats(stats: pstats.Stats, root: str = "", max_depth: int = 64) -> List[str]:
+    """
+    Convert cProfile call-graph stats to folded stacks ("a;b;c <microseconds>").
+    cProfile only keeps caller->callee edges, so time is split across paths
+    proportionally to each edge's cumulative time.
+    """
+    raw = stats.stats
+    callees: Dict = defaultdict(dict)
+    for func, (_, _, _, ct, callers) in raw.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            callees[caller][func] = edge_ct
+    roots = [f for f, v in raw.items() if not v[4]]
+    out: Counter = Counter()
+
+    def name(f):
+        file, line, fn = f
+        return f"{os.path.basename(file)}:{fn}:{line}" if file != "~" else fn
+
+    def walk(func, path, budget, depth):
+        total_ct = raw[func][3] or 1e-12
+        ratio = min(1.0, budget / total_ct)
+        spent = 0.0
+        if depth < max_depth:
+            for child, edge_ct in callees.get(func, {}).items():
+                if child in path or child not in raw:
+                    continue
+                child_budget = edge_ct * ratio
+                if child_budget < MIN_FRAME_SECONDS:
+                    continue
+                spent += child_budget
+                walk(child, path + (child,), child_budget, depth + 1)
+        self_time = budget - spent
+        if self_time > 0:
+            stack = ([root] if root else []) + [name(f) for f in path]
+            out[";".join(stack)] += self_time
+
+    for r in roots:
+        walk(r, (r,), raw[r][3], 0)
+    return [f"{k} {int(v * 1e6)}" for k, v in out.most_common() if int(v * 1e6) > 0]
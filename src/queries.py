@@ -0,0 +1,143 @@
+# src/queries.py
+# Hot queries shared by the processors and the dashboard, plus the registry that
+# tools/check_query_plans.py runs EXPLAIN on. Each one is backed by an index in src/db_models.py.
+from src.metrics import QUEUE_DEPTH_SQL
+
+# Phase 1/2: next batch of raw reviews without a processed row. :after is the backlog watermark
+# (src/backlog.py), so the anti-join range-searches the unprocessed tail of the primary key
+# instead of walking the whole history.
+UNPROCESSED_BATCH = """
+    SELECT r.id, r.text
+    FROM reviews_raw r
+    LEFT JOIN reviews_processed p ON p.review_id = r.id
+    WHERE p.review_id IS NULL
+      AND r.id > :after
+    ORDER BY r.id ASC
+    LIMIT :limit
+"""
+
+# Phase 3 shards: same anti-join restricted to an id range (min_id is at least the watermark + 1)
+UNPROCESSED_RANGE = """
+    SELECT r.id, r.text
+    FROM reviews_raw r
+    LEFT JOIN reviews_processed p ON p.review_id = r.id
+    WHERE p.review_id IS NULL
+      AND r.id BETWEEN :min_id AND :max_id
+    ORDER BY r.id ASC
+    LIMIT :limit
+"""
+
+UNPROCESSED_IDS = """
+    SELECT r.id
+    FROM reviews_raw r
+    LEFT JOIN reviews_processed p ON p.review_id = r.id
+    WHERE p.review_id IS NULL
+      AND r.id > :after
+    ORDER BY r.id ASC
+"""
+
+# src/backlog.py: the watermark row, moved forward only
+BACKLOG_MARK = "SELECT last_id FROM processing_watermark WHERE name = 'backlog'"
+BACKLOG_ADVANCE = """
+    UPDATE processing_watermark SET last_id = :last_id
+    WHERE name = 'backlog' AND last_id < :last_id
+"""
+
+# Dashboard: newest raw feedback
+LATEST_FEEDBACK = """
+    SELECT id AS review_id, author, text, created_at, source, archive_ref
+    FROM reviews_raw
+    ORDER BY created_at DESC
+    LIMIT :n
+"""
+
+# Dashboard: only the columns it plots (full read, cached once per process in src/dashboard_data.py);
+# triaged rows carry a placeholder NEUTRAL result and would skew the KPIs
+DASHBOARD_PROCESSED = """
+    SELECT review_id, sentiment_label, score, score_signed, topic_label, aspect_csv, processed_at
+    FROM reviews_processed
+    WHERE triage_reason IS NULL
+"""
+
+# Dashboard: per-aspect sentiment summary (covered by ix_review_aspect_sentiment_aspect)
+ASPECT_SENTIMENT_SUMMARY = """
+    SELECT aspect,
+           COUNT(*) AS mentions,
+           AVG(score_signed) AS avg_sentiment,
+           SUM(CASE WHEN sentiment_label = 'POSITIVE' THEN 1 ELSE 0 END) AS positive,
+           SUM(CASE WHEN sentiment_label = 'NEGATIVE' THEN 1 ELSE 0 END) AS negative
+    FROM review_aspect_sentiment
+    GROUP BY aspect
+    ORDER BY aspect
+"""
+
+# Dashboard / exports: processed rows in a time window (trend bucketing on processed_at)
+PROCESSED_SINCE = """
+    SELECT review_id, sentiment_label, score, score_signed, processed_at
+    FROM reviews_processed
+    WHERE processed_at >= :since
+    ORDER BY processed_at
+"""
+
+PROCESSED_BY_SENTIMENT = """
+    SELECT review_id, processed_at
+    FROM reviews_processed
+    WHERE sentiment_label = :label AND processed_at >= :since
+    ORDER BY processed_at
+"""
+
+# tools/reprocess.py: next processed rows (keyset on review_id) where a stage's version stamp differs
+# from the target; a NULL target leaves that stage out. Walks ux_reviews_processed_review_id.
+STALE_PROCESSED = """
+    SELECT p.review_id, r.text, r.archive_ref, p.processed_at,
+           p.aspects_version, p.sentiment_version, p.topics_version, p.aspect_sentiment_version
+    FROM reviews_processed p
+    JOIN reviews_raw r ON r.id = p.review_id
+    WHERE p.review_id > :after
+      AND p.triage_reason IS NULL
+      AND (   COALESCE(p.aspects_version, '') <> :aspects_version
+           OR COALESCE(p.sentiment_version, '') <> :sentiment_version
+           OR COALESCE(p.topics_version, '') <> :topics_version
+           OR COALESCE(p.aspect_sentiment_version, '') <> :aspect_sentiment_version)
+    ORDER BY p.review_id
+    LIMIT :limit
+"""
+
+# nlp/topic_training.py: reviews_raw in primary-key pages, streamed into the training sample
+RAW_TEXT_PAGE = """
+    SELECT id, text, archive_ref, source, brand, product_id
+    FROM reviews_raw
+    WHERE id > :after
+    ORDER BY id
+    LIMIT :limit
+"""
+
+# Ingestors: duplicate check and per-source listings
+SOURCE_LOOKUP = """
+    SELECT id FROM reviews_raw WHERE source = :source AND source_id = :source_id
+"""
+
+LATEST_BY_SOURCE = """
+    SELECT id, created_at
+    FROM reviews_raw
+    WHERE source = :source
+    ORDER BY created_at DESC
+    LIMIT :n
+"""
+
+# name -> (sql, sample params, tables allowed to be scanned)
+HOT_QUERIES = {
+    "unprocessed_batch": (UNPROCESSED_BATCH, {"after": 0, "limit": 500}, set()),
+    "unprocessed_range": (UNPROCESSED_RANGE, {"min_id": 1, "max_id": 10_000, "limit": 500}, set()),
+    "unprocessed_ids": (UNPROCESSED_IDS, {"after": 0}, set()),
+    "queue_depth": (QUEUE_DEPTH_SQL, {"after": 0}, set()),
+    "latest_feedback": (LATEST_FEEDBACK, {"n": 10}, set()),
+    "aspect_sentiment_summary": (ASPECT_SENTIMENT_SUMMARY, {}, set()),
+    "processed_since": (PROCESSED_SINCE, {"since": "2024-01-01"}, set()),
+    "processed_by_sentiment": (PROCESSED_BY_SENTIMENT, {"label": "NEGATIVE", "since": "2024-01-01"}, set()),
+    "stale_processed": (STALE_PROCESSED, {"after": 0, "limit": 200, "aspects_version": "x", "sentiment_version": "x",
+                                          "topics_version": "x", "aspect_sentiment_version": "x"}, set()),
+    "raw_text_page": (RAW_TEXT_PAGE, {"after": 0, "limit": 10_000}, set()),
+    "source_lookup": (SOURCE_LOOKUP, {"source": "reddit", "source_id": "abc"}, set()),
+    "latest_by_source": (LATEST_BY_SOURCE, {"source": "reddit", "n": 50}, set()),
+}
@@ -0,0 +1,54 @@
+# src/rate_limit.py
+# Thread-safe token bucket: one instance is shared by every consumer that spends the same
+# API quota (e.g. all Reddit stream consumers on one client id), so N threads together stay
+# under the budget instead of each one assuming it has the whole quota.
+#
+#   bucket = TokenBucket(rate_per_s=1.0, burst=10)
+#   bucket.acquire()        # blocks until a token is free
+from __future__ import annotations
+import threading
+import time
+from typing import Optional
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: int = 1):
+        if rate_per_s <= 0:
+            raise ValueError("rate_per_s must be > 0")
+        self.rate = float(rate_per_s)
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "waited_s": 0.0}
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, n: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= n:
+                self._tokens -= n
+                self.stats["acquired"] += 1
+                return True
+            return False
+
+    def acquire(self, n: float = 1.0, stop: Optional[threading.Event] = None) -> bool:
+        """Block until n tokens are available; returns False if `stop` was set while waiting."""
+        t0 = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= n:
+                    self._tokens -= n
+                    self.stats["acquired"] += 1
+                    self.stats["waited_s"] += now - t0
+                    return True
+                wait = (n - self._tokens) / self.rate
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
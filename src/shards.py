@@ -0,0 +1,25 @@
+# src/shards.py
+# Split the unprocessed backlog into contiguous id ranges with roughly equal row counts,
+# one per phase-3 task (SHARD_MIN_ID / SHARD_MAX_ID env of realtime/process_new_phase3.py).
+import math
+import os
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from src import backlog
+from src.queries import UNPROCESSED_IDS
+
+SHARD_MAX = int(os.getenv("PHASE3_MAX_SHARDS", "8"))
+SHARD_MIN_ROWS = int(os.getenv("PHASE3_MIN_SHARD_ROWS", "500"))   # don't spin up a task for a handful of rows
+
+def plan_id_shards(conn, max_shards: int = SHARD_MAX, min_rows: int = SHARD_MIN_ROWS) -> List[Dict[str, int]]:
+    ids = [r[0] for r in conn.execute(text(UNPROCESSED_IDS), {"after": backlog.after(conn)})]
+    if not ids:
+        return []
+    n = max(1, min(max_shards, math.ceil(len(ids) / max(min_rows, 1))))
+    step = math.ceil(len(ids) / n)
+    return [
+        {"min_id": ids[i], "max_id": ids[min(i + step, len(ids)) - 1], "rows": min(step, len(ids) - i)}
+        for i in range(0, len(ids), step)
+    ]
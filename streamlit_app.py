@@ -1,27 +1,60 @@
 # streamlit_app.py
 import streamlit as st
 import pandas as pd
-import sqlite3
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 from streamlit_autorefresh import st_autorefresh
+from src import analytics
+from src.dashboard_data import load_aspect_summary, load_latest, load_processed
+from src.db_models import get_read_engine
 
 # --- Auto Refresh ---
 st_autorefresh(interval=60 * 1000, limit=None, key="refresh")  # refresh every 60 sec
 
 # --- DB Connection ---
+# Aggregates come from src/analytics.py: DuckDB over the attached DB / Parquet snapshots, so only
+# the small result sets reach pandas. Without DuckDB, one compact frame per process (cache_resource:
+# shared by all sessions, never copied) answers the same calls in pandas.
+@st.cache_resource(ttl=60)
+def get_analytics():
+    an = analytics.open_duckdb()
+    if an is not None:
+        return an
+    with get_read_engine().connect() as conn:
+        return analytics.FrameAnalytics(load_processed(conn), load_aspect_summary(conn))
+
+@st.cache_resource(ttl=60)
+def load_reviews():
+    with get_read_engine().connect() as conn:
+        # only the feedback table reads reviews_raw: pull the newest rows via ix_reviews_raw_created_at
+        return load_latest(conn, latest_n=10)
+
+# small results, cached per (view, filter) for every session
 @st.cache_data(ttl=60)
-def load_data():
-    conn = sqlite3.connect("data/aspect_reviews.db")
-    df_reviews = pd.read_sql("SELECT * FROM reviews_raw", conn)
-    df_proc = pd.read_sql("SELECT * FROM reviews_processed", conn)
-    conn.close()
-    return df_reviews, df_proc
+def query_trend(time_group, labels):
+    an = get_analytics()
+    if time_group in BUCKETS:
+        return an.trend(BUCKETS[time_group], labels)
+    return an.cumulative(labels)   # Total → cumulative trend
 
-df_reviews, df_proc = load_data()
-df_proc["datetime"] = pd.to_datetime(df_proc["processed_at"])
-df_proc["date"] = df_proc["datetime"].dt.date
+@st.cache_data(ttl=60)
+def query_kpis(time_group, labels):
+    return get_analytics().kpis(BUCKETS.get(time_group), labels)
+
+@st.cache_data(ttl=60)
+def query_aspect_frequencies(labels):
+    return get_analytics().aspect_frequencies(labels)
+
+@st.cache_data(ttl=60)
+def query_aspect_summary():
+    return get_analytics().aspect_summary()
+
+# time buckets are labelled by period start (precomputed columns / date_trunc)
+BUCKETS = {"Hourly": "hour", "Daily": "date", "Weekly": "week", "Monthly": "month"}
+
+df_reviews = load_reviews()
+df_aspects = query_aspect_summary()
 
 # --- Custom CSS ---
 st.markdown("""
@@ -66,73 +99,19 @@ sentiments_selected = st.sidebar.multiselect(
     default=sentiment_options
 )
 
-# --- Apply Sentiment Filter ---
-df_filtered = df_proc.copy()
-if sentiments_selected:
-    df_filtered = df_filtered[df_filtered["sentiment_label"].isin([s.upper() for s in sentiments_selected])]
-
-# --- Aggregate Data by Time ---
-if time_group == "Hourly":
-    trend_data = df_filtered.groupby(pd.Grouper(key="datetime", freq="H")).agg(
-        Average_Sentiment=("score_signed", "mean"),
-        Review_Count=("review_id", "count")
-    ).reset_index()
-
-elif time_group == "Daily":
-    trend_data = df_filtered.groupby("date").agg(
-        Average_Sentiment=("score_signed", "mean"),
-        Review_Count=("review_id", "count")
-    ).reset_index()
-
-elif time_group == "Weekly":
-    trend_data = df_filtered.groupby(pd.Grouper(key="datetime", freq="W")).agg(
-        Average_Sentiment=("score_signed", "mean"),
-        Review_Count=("review_id", "count")
-    ).reset_index()
-
-elif time_group == "Monthly":
-    trend_data = df_filtered.groupby(pd.Grouper(key="datetime", freq="M")).agg(
-        Average_Sentiment=("score_signed", "mean"),
-        Review_Count=("review_id", "count")
-    ).reset_index()
-
-else:  # Total → cumulative trend
-    daily = df_filtered.groupby("date").agg(
-        Daily_Sentiment=("score_signed", "mean"),
-        Daily_Count=("review_id", "count")
-    ).reset_index()
-
-    daily["Cumulative_Count"] = daily["Daily_Count"].cumsum()
-    daily["Cumulative_Sentiment"] = (
-        (daily["Daily_Sentiment"] * daily["Daily_Count"]).cumsum()
-        / daily["Cumulative_Count"]
-    )
-    trend_data = daily.rename(columns={"date": "datetime"})
+# --- Sentiment Filter + Aggregates by Time ---
+# no selection behaves like every label selected (same as before)
+labels = tuple(sorted(s.upper() for s in sentiments_selected)) or None
+bucket = BUCKETS.get(time_group)
+trend_data = query_trend(time_group, labels)
 
 # --- Dashboard Title ---
 st.set_page_config(page_title="Feedback Dashboard", layout="wide")
 st.title("📊 Feedback Dashboard")
 
-# --- KPI Values ---
-if time_group == "Total":
-    last_period = df_filtered
-else:
-    last_period = pd.DataFrame()
-    if not trend_data.empty:
-        latest_time = trend_data.iloc[-1][0]
-        if time_group == "Hourly":
-            last_period = df_filtered[df_filtered["datetime"].dt.floor("H") == latest_time]
-        elif time_group == "Daily":
-            last_period = df_filtered[df_filtered["date"] == latest_time]
-        elif time_group == "Weekly":
-            last_period = df_filtered[df_filtered["datetime"].dt.to_period("W").dt.start_time == latest_time]
-        elif time_group == "Monthly":
-            last_period = df_filtered[df_filtered["datetime"].dt.to_period("M").dt.start_time == latest_time]
-
-n_pos = (last_period["sentiment_label"] == "POSITIVE").sum() if not last_period.empty else 0
-n_neg = (last_period["sentiment_label"] == "NEGATIVE").sum() if not last_period.empty else 0
-n_neu = (last_period["sentiment_label"] == "NEUTRAL").sum() if not last_period.empty else 0
-avg_conf = last_period["score"].mean() if not last_period.empty else 0.00
+# --- KPI Values (whole range for Total, else the latest period) ---
+kpis = query_kpis(time_group, labels)
+n_pos, n_neg, n_neu, avg_conf = kpis["n_pos"], kpis["n_neg"], kpis["n_neu"], kpis["avg_conf"]
 
 total = n_pos + n_neg + n_neu
 pos_pct = f"{(n_pos/total):.1%}" if total > 0 else "0%"
@@ -169,16 +148,24 @@ if not trend_data.empty:
     if time_group == "Total":
         st.line_chart(trend_data.set_index("datetime")[["Cumulative_Sentiment", "Cumulative_Count"]])
     else:
-        index_col = "datetime" if time_group in ["Hourly", "Weekly", "Monthly"] else "date"
-        st.line_chart(trend_data.set_index(index_col)[["Average_Sentiment", "Review_Count"]])
+        st.line_chart(trend_data.set_index(bucket)[["Average_Sentiment", "Review_Count"]])
 else:
     st.info("No data available for selected filters.")
 
+# --- Aspect-level Sentiment ---
+# scored on the sentences that mention each aspect, not the whole comment
+st.subheader("🔎 Sentiment by Aspect")
+if not df_aspects.empty:
+    st.bar_chart(df_aspects.set_index("aspect")[["avg_sentiment"]])
+    st.dataframe(df_aspects.set_index("aspect")[["mentions", "positive", "negative"]])
+else:
+    st.info("No aspect-level sentiment yet.")
+
 # --- Word Cloud ---
 st.subheader("☁️ Word Cloud of Aspects / Techs")
-if not df_filtered.empty:
-    all_aspects = ",".join(df_filtered["aspect_csv"].dropna().astype(str))
-    wc = WordCloud(width=800, height=400, background_color="white").generate(all_aspects)
+aspect_freq = query_aspect_frequencies(labels)
+if aspect_freq:
+    wc = WordCloud(width=800, height=400, background_color="white").generate_from_frequencies(aspect_freq)
     fig_wc, ax = plt.subplots(figsize=(10, 5))
     ax.imshow(wc, interpolation="bilinear")
     ax.axis("off")
@@ -204,7 +191,7 @@ latest_feedback = df_display.sort_values("Date", ascending=False).head(10).reset
 latest_feedback.index = latest_feedback.index + 1
 latest_feedback.index.name = "S.No."
 
-if not df_filtered.empty:
+if n_pos + n_neg + n_neu > 0:
     st.dataframe(latest_feedback)
 else:
     st.info("No feedback available for selected filters.")
\ No newline at end of file
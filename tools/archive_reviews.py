@@ -0,0 +1,43 @@
+# tools/archive_reviews.py
+# Move processed review text older than N days out of reviews_raw into compressed archive partitions.
+#   python tools/archive_reviews.py --older-than-days 90
+#   python tools/archive_reviews.py --dry-run
+#   python tools/archive_reviews.py --vacuum        # SQLite: give the freed pages back to the OS
+import os, sys, json, argparse
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import archive, metrics
+from src.db_models import get_engine, init_db
+
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--older-than-days", type=int, default=archive.ARCHIVE_AFTER_DAYS)
+    ap.add_argument("--batch", type=int, default=archive.ARCHIVE_BATCH)
+    ap.add_argument("--format", choices=["zstd", "gzip"], default=archive.ARCHIVE_FORMAT)
+    ap.add_argument("--archive-dir", default=archive.ARCHIVE_DIR)
+    ap.add_argument("--dry-run", action="store_true", help="only count what would be archived")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM afterwards (SQLite; rewrites the file)")
+    args = ap.parse_args()
+
+    engine = get_engine(DB_URL)
+    init_db(engine)   # adds reviews_raw.archive_ref on older DBs
+    with metrics.pipeline_run("archive", engine):
+        with metrics.stage("archive"):
+            stats = archive.archive_old(engine, args.older_than_days, args.batch,
+                                        args.format, args.archive_dir, args.dry_run)
+        metrics.incr("rows_archived", stats["rows"])
+        if args.vacuum and not args.dry_run and engine.dialect.name == "sqlite":
+            with metrics.stage("vacuum"):
+                with engine.connect() as conn:
+                    conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                    conn.execute(text("VACUUM"))
+                    conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))   # shrink the file now, not at next checkpoint
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
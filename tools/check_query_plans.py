@@ -0,0 +1,80 @@
+# tools/check_query_plans.py
+# EXPLAIN every registered hot query (src/queries.HOT_QUERIES) and fail if one falls back to a
+# full table scan or an extra sort. Run after schema changes / in CI against a copy of the DB.
+#   python tools/check_query_plans.py            # check only
+#   python tools/check_query_plans.py --migrate  # create missing tables/columns/indexes first
+import os, sys, re, json, argparse
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.db_models import get_engine, init_db, is_postgres
+from src.queries import HOT_QUERIES
+
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
+
+# SQLite: "SCAN r" is a full scan, "SCAN r USING [COVERING] INDEX ix" is an ordered index walk
+_SQLITE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(?!.*USING)")
+_PG_SEQ_RE = re.compile(r"Seq Scan on (\w+)(?: (\w+))?")
+
+def _sqlite_plan(conn, sql, params):
+    rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).fetchall()
+    lines = [r[-1] for r in rows]
+    problems = []
+    for line in lines:
+        m = _SQLITE_SCAN_RE.match(line)
+        if m:
+            problems.append(("scan", {g for g in m.groups() if g}, line))
+        elif "USE TEMP B-TREE" in line:
+            problems.append(("sort", set(), line))
+    return lines, problems
+
+def _pg_plan(conn, sql, params):
+    # with seq scans disabled the planner only picks one when no index can serve the query
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    lines = [r[0] for r in conn.execute(text("EXPLAIN " + sql), params).fetchall()]
+    problems = []
+    for line in lines:
+        m = _PG_SEQ_RE.search(line)
+        if m:
+            problems.append(("scan", {g for g in m.groups() if g}, line.strip()))
+    return lines, problems
+
+def check(engine):
+    report, failed = {}, []
+    explain = _pg_plan if is_postgres(engine) else _sqlite_plan
+    with engine.connect() as conn:
+        for name, (sql, params, allowed_scans) in HOT_QUERIES.items():
+            lines, problems = explain(conn, sql, params)
+            bad = [p for p in problems if p[0] == "sort" or not (p[1] & allowed_scans)]
+            report[name] = {"plan": lines, "ok": not bad}
+            if bad:
+                failed.append(name)
+                report[name]["problems"] = [p[2] for p in bad]
+        conn.rollback()
+    return report, failed
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--migrate", action="store_true", help="create missing tables/columns/indexes before checking")
+    ap.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = ap.parse_args()
+
+    engine = get_engine(DB_URL)
+    if args.migrate:
+        init_db(engine)
+    report, failed = check(engine)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name, r in report.items():
+            print(f"{'OK  ' if r['ok'] else 'FAIL'} {name}")
+            for line in r["plan"]:
+                print(f"       {line}")
+    if failed:
+        raise SystemExit(f"Full scan / extra sort in: {', '.join(failed)}")
+    print("All hot queries use indexes.")
+
+if __name__ == "__main__":
+    main()
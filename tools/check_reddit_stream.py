@@ -0,0 +1,87 @@
+# tools/check_reddit_stream.py
+# End-to-end check of realtime/ingest_reddit_stream.py against tools/fake_reddit_api.py: streams
+# into a scratch SQLite DB and fails unless the stream stops by itself after --comments saves,
+# every save reached reviews_raw and the processing trigger was notified once per save.
+# Exits 1 on failure; no Reddit credentials or models needed.
+#   python tools/check_reddit_stream.py --comments 10
+import os, sys, json, socket, tempfile, threading, argparse
+from http.server import ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class CountingTrigger:
+    """Stands in for ProcessTrigger: counts notify() instead of running phase 2."""
+
+    def __init__(self):
+        self.notified = 0
+
+    def notify(self):
+        self.notified += 1
+
+    def close(self):
+        pass
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--comments", type=int, default=10, help="saves after which the stream must stop")
+    ap.add_argument("--rate", type=float, default=50.0, help="fake comments generated per second")
+    ap.add_argument("--timeout-s", type=float, default=60.0)
+    args = ap.parse_args()
+
+    from tools.fake_reddit_api import FakeReddit, make_handler
+    fake = FakeReddit(["iphone", "Android", "gadgets"], args.rate)
+    threading.Thread(target=fake.generate, daemon=True).start()
+    port = _free_port()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    work = tempfile.mkdtemp(prefix="reddit_stream_check_")
+    # the ingestor and the DB layer read their configuration at import time
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(work, 'check.db')}",
+        "REDDIT_OAUTH_URL": f"http://127.0.0.1:{port}",
+        "REDDIT_URL": f"http://127.0.0.1:{port}",
+        "REDDIT_CLIENT_ID": "check",
+        "REDDIT_CLIENT_SECRET": "check",
+        "REDDIT_SUBREDDITS": "iphone,Android,gadgets",
+    })
+    from sqlalchemy import text
+    from realtime import ingest_reddit_stream as ing
+    from src.db_models import get_engine
+    from src.db_writer import DBWriter
+
+    ing.init_db()
+    writer = DBWriter()
+    trigger = CountingTrigger()
+    result = {}
+    t = threading.Thread(
+        target=lambda: result.update(saved=ing.stream_and_process(ing.create_reddit(), writer, trigger, args.comments)),
+        daemon=True,
+    )
+    t.start()
+    t.join(args.timeout_s)
+    stopped = not t.is_alive()
+    writer.close()
+    server.shutdown()
+    with get_engine().connect() as conn:
+        rows = conn.execute(text("SELECT COUNT(*) FROM reviews_raw WHERE source = 'reddit'")).scalar()
+
+    report = {
+        "expected": args.comments,
+        "stopped": stopped,
+        "saved": result.get("saved"),
+        "rows": int(rows or 0),
+        "notified": trigger.notified,
+        "db": os.environ["DATABASE_URL"],
+    }
+    report["ok"] = stopped and report["saved"] == report["rows"] == report["notified"] == args.comments
+    print(json.dumps(report))
+    sys.exit(0 if report["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
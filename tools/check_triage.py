@@ -0,0 +1,66 @@
+# tools/check_triage.py
+# Fixed cases for the phase-3 pre-filter (nlp/triage.py): terse English reviews must reach the
+# models, junk must not. A false positive silently removes a review from the dashboard KPIs,
+# so run this after touching any triage rule or threshold. With --csv, every row of a file of
+# real reviews must be kept as well. Exits 1 on any mismatch.
+#   python tools/check_triage.py
+#   python tools/check_triage.py --csv sample_reviews.csv --column review_text
+import os, sys, json, argparse
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from nlp import triage
+
+# (text, expected reason; None = goes to the models)
+CASES = [
+    # terse / keyword-style English reviews
+    ("Camera quality superb, battery life excellent, screen bright, fast shipping", None),
+    ("Excellent build quality, premium materials, snappy performance, bright display", None),
+    ("Great phone!", None),
+    ("Terrible camera", None),
+    ("Love it", None),
+    ("Battery drains fast", None),
+    ("Overheats during gaming, returned", None),
+    ("5 stars, would buy again", None),
+    ("Pixel 8 Pro: 120Hz OLED, Tensor G3, 50MP main camera", None),
+    ("Shipping delayed 2 weeks, packaging damaged", None),
+    ("The battery on my iphone barely lasts a day since the update", None),
+    ("I love the Casa de la Playa case for my phone", None),
+    # junk
+    ("", "empty"),
+    ("   ", "empty"),
+    ("https://imgur.com/a/xyz", "url_only"),
+    ("[deleted]", "boilerplate"),
+    ("I am a bot, and this action was performed automatically.", "boilerplate"),
+    ("lol", "boilerplate"),
+    ("Thanks!", "boilerplate"),
+    ("Underrated", "too_short"),
+    ("😂😂😂 🔥🔥 100 100", "too_short"),
+    ("gg 10/10 99999 💯💯💯 🔥🔥🔥 ez", "no_text"),
+    # other languages
+    ("我今天也发现有这个问题", "non_english"),
+    ("Батарея держит весь день, камера отличная", "non_english"),
+    ("La batería del teléfono es muy mala y la cámara no funciona bien", "non_english"),
+    ("Der Akku ist leider nicht gut und die Kamera ist auch sehr schlecht", "non_english"),
+    ("Je suis très déçu, la batterie ne tient pas et le prix est trop élevé", "non_english"),
+]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default="", help="file of real reviews that must all be kept")
+    ap.add_argument("--column", default="text")
+    args = ap.parse_args()
+
+    failed = [{"text": t, "expected": want, "got": got}
+              for t, want in CASES for got in [triage.triage(t)] if got != want]
+    report = {"cases": len(CASES), "failed": failed}
+    if args.csv:
+        texts = pd.read_csv(args.csv)[args.column].tolist()
+        reasons = triage.triage_many(texts)
+        report["csv_rows"] = len(texts)
+        report["csv_rejected"] = [{"text": t, "got": r} for t, r in zip(texts, reasons) if r]
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if failed or report.get("csv_rejected") else 0)
+
+if __name__ == "__main__":
+    main()
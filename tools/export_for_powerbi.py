@@ -1,62 +1,235 @@
 # export_for_powerbi.py
-import os
-import sqlite3
+import os, sys, json
 import pandas as pd
+from sqlalchemy import inspect, text
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import analytics, archive, metrics, profiling
+from src.db_models import copy_to_csv, get_engine, is_postgres
+
 load_dotenv()
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
-DB_PATH = DB_URL.replace("sqlite:///", "", 1)
+engine = get_engine(DB_URL)
 
-OUT_DIR = "/opt/airflow/data/processed"
+OUT_DIR = os.getenv("EXPORT_DIR", "/opt/airflow/data/processed")
 os.makedirs(OUT_DIR, exist_ok=True)
 
-def main():
-    con = sqlite3.connect(DB_PATH)
+REVIEWS_SQL = "SELECT id AS review_id, source, author, text, created_at, archive_ref FROM reviews_raw"
+# Archived text (src/archive.py) is left empty with its archive_ref unless this is set
+EXPORT_ARCHIVED_TEXT = os.getenv("EXPORT_ARCHIVED_TEXT", "0") == "1"
+
+# --incremental: append only rows newer than the watermarks of the previous run
+STATE_PATH = os.path.join(OUT_DIR, "export_state.json")
+# triaged rows (nlp/triage.py) carry a placeholder NEUTRAL result: left out of every derived table
+PROCESSED_SQL = "SELECT * FROM reviews_processed WHERE triage_reason IS NULL"
+DAILY_SQL = """
+    SELECT DATE(r.created_at) AS date, AVG(p.score_signed) AS avg_sentiment, COUNT(p.review_id) AS n_reviews
+    FROM reviews_processed p
+    JOIN reviews_raw r ON r.id = p.review_id
+    WHERE r.created_at IS NOT NULL
+      AND p.triage_reason IS NULL
+    GROUP BY DATE(r.created_at)
+    ORDER BY date
+"""
+
+def main(profiler=None, incremental=False, parquet=False):
+    # derived tables / aggregates run in DuckDB when it is installed (src/analytics.py), else pandas;
+    # never from Parquet snapshots: those are written from this export
+    an = analytics.open_duckdb(DB_URL, parquet_dir="")
+    if parquet and an is None:
+        raise SystemExit("--parquet needs DuckDB (pip install duckdb)")
+    with metrics.pipeline_run("export", engine, profiler):
+        with engine.connect() as con:
+            state = load_state() if incremental else None
+            if state:
+                save_state(export_incremental(con, state, an))
+            else:
+                export(con, an)
+                if incremental:   # first incremental run: full export sets the watermarks
+                    save_state(current_watermarks(con))
+        if parquet:
+            with metrics.stage("parquet"):
+                written = an.write_parquet(OUT_DIR)
+            print(f"→ Parquet snapshots for ANALYTICS_PARQUET_DIR: {json.dumps(written)}")
+
+def load_state():
+    if not os.path.exists(STATE_PATH):
+        return None
+    with open(STATE_PATH) as f:
+        return json.load(f)
+
+def save_state(state):
+    tmp = f"{STATE_PATH}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE_PATH)
+
+def current_watermarks(con):
+    rid, at = con.execute(text(
+        "SELECT (SELECT MAX(id) FROM reviews_raw), (SELECT MAX(updated_at) FROM reviews_processed)"
+    )).fetchone()
+    return {"last_review_id": int(rid or 0), "last_updated_at": str(at) if at is not None else None}
+
+def _append(df, name):
+    path = f"{OUT_DIR}/{name}"
+    exists = os.path.exists(path)
+    df.to_csv(path, mode="a" if exists else "w", header=not exists, index=False)
+
+def aspect_frames(df_proc):
+    """Per-review frames derived from reviews_processed (shared by full and incremental export)."""
+    aspects = df_proc[["review_id", "aspect_csv"]].copy()
+    aspects["confidence"] = 0.7  # static confidence placeholder
+    aspect_sent = df_proc[["review_id", "aspect_csv", "sentiment_label", "score_signed"]].copy()
+    aspect_sent["confidence"] = 0.7
+    frames = {"aspects.csv": aspects, "aspect_sentiment.csv": aspect_sent}
+    if {"topic_id", "topic_label"}.issubset(df_proc.columns):
+        topics = df_proc[["review_id", "topic_id", "topic_label"]].copy()
+        topics["topic_prob"] = 1.0
+        frames["topics.csv"] = topics
+    return frames
+
+# Per-(review, aspect) sentiment from phase 3 (sentences mentioning the aspect only)
+ASPECT_SENTIMENT_SQL = """
+    SELECT review_id, aspect, sentiment_label, score_signed, score AS confidence, n_sentences, processed_at, updated_at
+    FROM review_aspect_sentiment
+"""
+
+def scoped_aspect_frame(con, since=None):
+    if not inspect(con).has_table("review_aspect_sentiment"):
+        return None
+    if since is None:
+        return pd.read_sql(text(ASPECT_SENTIMENT_SQL), con)
+    return pd.read_sql(text(ASPECT_SENTIMENT_SQL + " WHERE updated_at > :since ORDER BY updated_at"),
+                       con, params={"since": since})
+
+def export_incremental(con, state, an=None):
+    """
+    Append reviews with id > last_review_id and processed rows with updated_at > last_updated_at.
+    A re-processed review (phase 3 again, or tools/reprocess.py) is appended again
+    (keep the latest row per review_id downstream).
+    daily_metrics.csv is rewritten from a SQL aggregate, which never reads review text.
+    """
+    with metrics.stage("fetch"):
+        df_reviews = pd.read_sql(text(REVIEWS_SQL + " WHERE id > :after ORDER BY id"), con,
+                                 params={"after": state["last_review_id"]})
+        if EXPORT_ARCHIVED_TEXT:
+            archive.hydrate(df_reviews)
+        # state files written before updated_at existed carry last_processed_at (same values, backfilled)
+        since = state.get("last_updated_at") or state.get("last_processed_at") or "0001-01-01"
+        df_proc = pd.read_sql(text(PROCESSED_SQL + " AND updated_at > :since ORDER BY updated_at"),
+                              con, params={"since": since})
+        scoped = scoped_aspect_frame(con, since)
+    with metrics.stage("write"):
+        _append(df_reviews, "reviews_clean.csv")
+        for name, frame in aspect_frames(df_proc).items():
+            _append(frame, name)
+        if scoped is not None:
+            _append(scoped, "review_aspect_sentiment.csv")
+    metrics.incr("rows_exported", len(df_reviews))
+    print(f"→ {len(df_reviews)} new reviews, {len(df_proc)} new/updated processed rows appended")
+
+    with metrics.stage("aggregate"):
+        if an is not None:
+            n_daily = an.copy_csv(analytics.DAILY_SQL, f"{OUT_DIR}/daily_metrics.csv")
+        else:
+            daily = pd.read_sql(text(DAILY_SQL), con)
+            with metrics.stage("write"):
+                daily.to_csv(f"{OUT_DIR}/daily_metrics.csv", index=False)
+            n_daily = len(daily)
+    print(f"→ {n_daily} daily metrics rows exported")
+    print(f"✅ Incremental export complete → files in {OUT_DIR}/")
+
+    return {
+        "last_review_id": int(df_reviews["review_id"].max()) if len(df_reviews) else state["last_review_id"],
+        "last_updated_at": (str(df_proc["updated_at"].max()) if len(df_proc)
+                            else state.get("last_updated_at") or state.get("last_processed_at")),
+    }
+
+def export(con, an=None):
 
     # --- Reviews ---
-    df_reviews = pd.read_sql("""
-        SELECT id AS review_id, source, author, text, created_at
-        FROM reviews_raw
-    """, con)
-    df_reviews.to_csv(f"{OUT_DIR}/reviews_clean.csv", index=False)
+    if is_postgres(con):
+        # COPY streams the full text column server-side; only ids + dates come back for aggregation
+        with metrics.stage("write"):
+            copy_to_csv(con.engine, REVIEWS_SQL, f"{OUT_DIR}/reviews_clean.csv")
+        with metrics.stage("fetch"):
+            df_reviews = pd.read_sql("SELECT id AS review_id, created_at FROM reviews_raw", con)
+    else:
+        with metrics.stage("fetch"):
+            df_reviews = pd.read_sql(REVIEWS_SQL, con)
+            if EXPORT_ARCHIVED_TEXT:
+                archive.hydrate(df_reviews)
+        with metrics.stage("write"):
+            df_reviews.to_csv(f"{OUT_DIR}/reviews_clean.csv", index=False)
+    metrics.incr("rows_exported", len(df_reviews))
     print(f"→ {len(df_reviews)} reviews exported")
 
+    if an is not None:
+        export_derived(an)
+    else:
+        export_derived_pandas(con, df_reviews)
+    print(f"✅ Export complete → files in {OUT_DIR}/")
+
+def export_derived(an):
+    """Derived tables + daily metrics streamed by DuckDB from the attached DB straight to CSV."""
+    tables = {**analytics.EXPORT_SQL, "daily_metrics.csv": analytics.DAILY_SQL}
+    if "review_aspect_sentiment" in an.sources:
+        tables["review_aspect_sentiment.csv"] = ASPECT_SENTIMENT_SQL
+    with metrics.stage("aggregate"):
+        written = an.export_tables(OUT_DIR, tables)
+    for name, n in written.items():
+        print(f"→ {n} rows exported to {name}")
+
+def export_derived_pandas(con, df_reviews):
     # --- Processed ---
-    df_proc = pd.read_sql("SELECT * FROM reviews_processed", con)
+    with metrics.stage("fetch"):
+        df_proc = pd.read_sql(PROCESSED_SQL, con)
+    frames = aspect_frames(df_proc)
 
     # --- Aspects (use aspect_csv + confidence) ---
-    aspects = df_proc[["review_id", "aspect_csv"]].copy()
-    aspects["confidence"] = 0.7  # static confidence placeholder
-    aspects.to_csv(f"{OUT_DIR}/aspects.csv", index=False)
-    print(f"→ {len(aspects)} aspects exported")
+    with metrics.stage("write"):
+        frames["aspects.csv"].to_csv(f"{OUT_DIR}/aspects.csv", index=False)
+    print(f"→ {len(frames['aspects.csv'])} aspects exported")
 
     # --- Aspect-Sentiment (use aspect_csv + confidence) ---
-    aspect_sent = df_proc[["review_id", "aspect_csv", "sentiment_label", "score_signed"]].copy()
-    aspect_sent["confidence"] = 0.7
-    aspect_sent.to_csv(f"{OUT_DIR}/aspect_sentiment.csv", index=False)
-    print(f"→ {len(aspect_sent)} aspect-sentiment rows exported")
+    with metrics.stage("write"):
+        frames["aspect_sentiment.csv"].to_csv(f"{OUT_DIR}/aspect_sentiment.csv", index=False)
+    print(f"→ {len(frames['aspect_sentiment.csv'])} aspect-sentiment rows exported")
+
+    # --- Aspect-scoped sentiment (one row per review + aspect) ---
+    with metrics.stage("fetch"):
+        scoped = scoped_aspect_frame(con)
+    if scoped is not None:
+        with metrics.stage("write"):
+            scoped.to_csv(f"{OUT_DIR}/review_aspect_sentiment.csv", index=False)
+        print(f"→ {len(scoped)} review-aspect sentiment rows exported")
 
     # --- Daily metrics ---
-    df_reviews["date"] = pd.to_datetime(df_reviews["created_at"]).dt.date
-    joined = df_proc.merge(df_reviews[["review_id", "date"]], on="review_id", how="left")
-    daily = (
-        joined.groupby("date")
-        .agg(avg_sentiment=("score_signed", "mean"), n_reviews=("review_id", "count"))
-        .reset_index()
-    )
-    daily.to_csv(f"{OUT_DIR}/daily_metrics.csv", index=False)
+    with metrics.stage("aggregate"):
+        df_reviews["date"] = pd.to_datetime(df_reviews["created_at"]).dt.date
+        joined = df_proc.merge(df_reviews[["review_id", "date"]], on="review_id", how="left")
+        daily = (
+            joined.groupby("date")
+            .agg(avg_sentiment=("score_signed", "mean"), n_reviews=("review_id", "count"))
+            .reset_index()
+        )
+    with metrics.stage("write"):
+        daily.to_csv(f"{OUT_DIR}/daily_metrics.csv", index=False)
     print(f"→ {len(daily)} daily metrics rows exported")
 
     # --- Topics ---
-    if {"topic_id", "topic_label"}.issubset(df_proc.columns):
-        topics = df_proc[["review_id", "topic_id", "topic_label"]].copy()
-        topics["topic_prob"] = 1.0
-        topics.to_csv(f"{OUT_DIR}/topics.csv", index=False)
-        print(f"→ {len(topics)} topics exported")
-
-    print(f"✅ Export complete → files in {OUT_DIR}/")
-    con.close()
+    if "topics.csv" in frames:
+        with metrics.stage("write"):
+            frames["topics.csv"].to_csv(f"{OUT_DIR}/topics.csv", index=False)
+        print(f"→ {len(frames['topics.csv'])} topics exported")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--incremental", action="store_true", help="append only rows added since the last run")
+    ap.add_argument("--parquet", action="store_true",
+                    help="also write Parquet snapshots for the dashboard (ANALYTICS_PARQUET_DIR=<export dir>)")
+    profiling.add_cli_args(ap)
+    args = ap.parse_args()
+    main(profiler=profiling.from_args(args, "export"), incremental=args.incremental, parquet=args.parquet)
\ No newline at end of file
@@ -0,0 +1,127 @@
+# tools/fake_reddit_api.py
+# Minimal stand-in for the parts of the Reddit API the ingestors use (token endpoint and
+# /r/<a+b>/comments listings), generating comments at a fixed rate. Also counts requests per
+# minute so the shared rate budget of realtime/ingest_reddit_service.py can be checked.
+#   python tools/fake_reddit_api.py --port 8765 --rate 20
+#   REDDIT_OAUTH_URL=http://127.0.0.1:8765 REDDIT_URL=http://127.0.0.1:8765 \
+#   REDDIT_CLIENT_ID=x REDDIT_CLIENT_SECRET=y python realtime/ingest_reddit_service.py --max-runtime-s 60
+#   curl http://127.0.0.1:8765/_stats
+import json, random, re, threading, time, argparse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BODIES = [
+    "The battery on my iphone barely lasts a day since the update",
+    "Pixel camera in low light is still the best I have used",
+    "Galaxy screen brightness is great but the price is too expensive",
+    "My airpods keep dropping bluetooth connection",
+    "Anyone else think this thread is off topic?",
+    "lol",
+]
+AUTHORS = ["alice", "bob", "carol", "dave", "AutoModerator", "helper_bot"]
+
+def _b36(n: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while n:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+    return out or "0"
+
+class FakeReddit:
+    def __init__(self, subreddits, rate: float, keep: int = 1000):
+        self.subreddits = subreddits
+        self.rate = rate
+        self.next_id = int("k000000", 36)
+        self.comments = deque(maxlen=keep * max(1, len(subreddits)))   # newest last
+        self.lock = threading.Lock()
+        self.requests = deque()   # monotonic timestamps of listing requests
+        self.total_requests = 0
+
+    def generate(self):
+        while True:
+            time.sleep(1.0 / self.rate)
+            with self.lock:
+                cid = _b36(self.next_id)
+                self.next_id += 1
+                sr = random.choice(self.subreddits)
+                self.comments.append({
+                    "id": cid, "name": f"t1_{cid}", "subreddit": sr,
+                    "author": random.choice(AUTHORS), "body": random.choice(BODIES),
+                    "link_title": "Daily tech support thread", "link_id": "t3_fake",
+                    "permalink": f"/r/{sr}/comments/fake/thread/{cid}/",
+                    "created_utc": time.time(),
+                })
+
+    def listing(self, subs, limit: int, after: str):
+        wanted = {s.lower() for s in subs}
+        with self.lock:
+            now = time.monotonic()
+            self.requests.append(now)
+            self.total_requests += 1
+            while self.requests and now - self.requests[0] > 60:
+                self.requests.popleft()
+            rows = [c for c in reversed(self.comments) if c["subreddit"].lower() in wanted]
+        if after:
+            rows = [c for c in rows if int(c["id"], 36) < int(after.split("_")[-1], 36)]
+        page = rows[:limit]
+        return {
+            "kind": "Listing",
+            "data": {
+                "after": page[-1]["name"] if len(rows) > limit else None,
+                "before": None, "dist": len(page),
+                "children": [{"kind": "t1", "data": c} for c in page],
+            },
+        }
+
+def make_handler(fake: FakeReddit):
+    class Handler(BaseHTTPRequestHandler):
+        def _json(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path.startswith("/api/v1/access_token"):
+                return self._json({"access_token": "fake", "token_type": "bearer",
+                                   "expires_in": 3600, "scope": "*"})
+            self._json({"error": 404}, 404)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            m = re.match(r"^/r/([^/]+)/comments/?$", url.path)
+            if m:
+                q = parse_qs(url.query)
+                limit = min(100, int(q.get("limit", ["25"])[0]))
+                return self._json(fake.listing(m.group(1).split("+"), limit, q.get("after", [""])[0]))
+            if url.path == "/_stats":
+                with fake.lock:
+                    return self._json({"requests_last_minute": len(fake.requests),
+                                       "requests_total": fake.total_requests,
+                                       "comments_generated": fake.next_id - int("k000000", 36)})
+            self._json({"error": 404}, 404)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--rate", type=float, default=20.0, help="comments generated per second")
+    ap.add_argument("--subreddits", default="iphone,Android,gadgets")
+    args = ap.parse_args()
+
+    fake = FakeReddit([s.strip() for s in args.subreddits.split(",") if s.strip()], args.rate)
+    threading.Thread(target=fake.generate, daemon=True).start()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(fake))
+    print(f"Fake Reddit API on http://127.0.0.1:{args.port} ({args.rate}/s comments)")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
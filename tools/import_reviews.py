@@ -0,0 +1,145 @@
+# tools/import_reviews.py
+# Bulk-load offline review files (CSV / JSONL / Parquet, optionally .gz) into reviews_raw.
+# Files are streamed in chunks, so memory stays flat regardless of file size; each chunk is one
+# INSERT ... ON CONFLICT(source_id) DO NOTHING transaction, so re-running an import is a no-op.
+#   python tools/import_reviews.py sample_reviews.csv --source sample
+#   python tools/import_reviews.py exports/2023.jsonl.gz --source legacy --map text=body --map created_at=ts
+#   python tools/import_reviews.py big.parquet --source legacy --chunk-rows 100000 --defer-indexes
+import os, sys, json, time, argparse
+from datetime import datetime
+import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import metrics
+from src.db_models import Review, get_engine, init_db, upsert
+
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
+CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "50000"))
+
+# Review column -> file column; defaults match sample_reviews.csv
+DEFAULT_MAP = {
+    "source_id": "review_id",
+    "created_at": "date",
+    "text": "review_text",
+    "product_id": "product_id",
+    "brand": "brand",
+    "rating": "rating",
+    "author": "author",
+    "url": "url",
+}
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    for suffix in (".gz", ".bz2", ".zst", ".xz"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    if name.endswith(".parquet") or name.endswith(".pq"):
+        return "parquet"
+    if name.endswith(".jsonl") or name.endswith(".ndjson") or name.endswith(".json"):
+        return "jsonl"
+    return "csv"
+
+def read_chunks(path: str, fmt: str, chunk_rows: int):
+    """Yield DataFrames of at most chunk_rows rows; never holds the whole file."""
+    if fmt == "csv":
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[""])
+    elif fmt == "jsonl":
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    elif fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet import needs pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+def to_rows(df: pd.DataFrame, colmap: dict, source: str, now: datetime) -> list:
+    """Map a file chunk onto reviews_raw rows; rows without an id are dropped."""
+    def col(name):
+        src = colmap.get(name)
+        return df[src] if src in df.columns else pd.Series([None] * len(df), index=df.index)
+
+    ids = col("source_id").astype("string").str.strip()
+    created = pd.to_datetime(col("created_at"), errors="coerce", utc=True).dt.tz_localize(None)
+    rating = pd.to_numeric(col("rating"), errors="coerce")
+    out = pd.DataFrame({
+        "source": source,
+        # namespaced: source_id is unique across all sources (Reddit/YouTube ids included)
+        "source_id": f"{source}:" + ids,
+        "author": col("author"),
+        "text": col("text"),
+        "url": col("url"),
+        "created_at": created.fillna(pd.Timestamp(now)),
+        "product_id": col("product_id"),
+        "brand": col("brand"),
+        "rating": rating,
+    })
+    out = out[ids.notna() & (ids != "")]
+    out = out.astype(object).where(out.notna(), None)
+    out["created_at"] = [ts.to_pydatetime() if ts is not None else now for ts in out["created_at"]]
+    return out.to_dict("records")
+
+def deferrable_indexes():
+    # the unique source_id constraint stays: ON CONFLICT needs it
+    return [idx for idx in Review.__table__.indexes if not idx.unique]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("path")
+    ap.add_argument("--source", default="import", help="reviews_raw.source value (also prefixes source_id)")
+    ap.add_argument("--format", choices=["csv", "jsonl", "parquet"], help="default: from the file extension")
+    ap.add_argument("--map", action="append", default=[], metavar="COLUMN=FILE_COLUMN",
+                    help="override a column mapping, e.g. --map text=body")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--defer-indexes", action="store_true",
+                    help="drop the secondary indexes for the load and rebuild them at the end (faster for big "
+                         "files, but every other reader/writer of reviews_raw loses them meanwhile: stop them first)")
+    args = ap.parse_args()
+
+    colmap = dict(DEFAULT_MAP)
+    for m in args.map:
+        k, _, v = m.partition("=")
+        if k not in DEFAULT_MAP or not v:
+            raise SystemExit(f"Bad --map {m!r}; columns: {', '.join(DEFAULT_MAP)}")
+        colmap[k] = v
+    fmt = args.format or detect_format(args.path)
+
+    engine = get_engine(DB_URL)
+    init_db(engine)   # adds product_id / brand / rating on older DBs
+    deferred = deferrable_indexes() if args.defer_indexes else []
+    stats = {"file": args.path, "format": fmt, "read": 0, "inserted": 0, "chunks": 0}
+    t0 = time.perf_counter()
+    with metrics.pipeline_run("import", engine):
+        # --defer-indexes: bulk load without maintaining the secondary indexes, then build them once
+        with metrics.stage("drop_indexes"):
+            for idx in deferred:
+                idx.drop(engine, checkfirst=True)
+        try:
+            for chunk in read_chunks(args.path, fmt, args.chunk_rows):
+                with metrics.stage("map"):
+                    rows = to_rows(chunk, colmap, args.source, datetime.utcnow())
+                with metrics.stage("write"):
+                    with engine.begin() as conn:
+                        n = upsert(conn, Review.__table__, rows, ["source_id"])
+                stats["read"] += len(chunk)
+                stats["inserted"] += n
+                stats["chunks"] += 1
+                dt = time.perf_counter() - t0
+                print(f" {stats['read']:,} read | {stats['inserted']:,} inserted | "
+                      f"{stats['read'] / dt:,.0f} rows/s")
+        finally:
+            with metrics.stage("create_indexes"):
+                for idx in deferred:
+                    idx.create(engine, checkfirst=True)
+        metrics.incr("rows_imported", stats["inserted"])
+    stats["skipped"] = stats["read"] - stats["inserted"]
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    stats["rows_per_sec"] = round(stats["read"] / max(stats["seconds"], 1e-9), 1)
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# tools/reprocess.py
+# Selective reprocessing after a model / lexicon / config change. Every reviews_processed row
+# carries a version fingerprint per stage (nlp/versions.py); this walks the rows whose stamp
+# differs from what phase 3 would produce now and recomputes only those stages, in small
+# throttled transactions that can run next to live processing. processed_at is left alone, so
+# the dashboard trends don't move; updated_at is bumped, so the incremental Power BI export
+# (tools/export_for_powerbi.py --incremental) picks the recomputed rows up. Progress is checkpointed; rerunning continues where it stopped.
+#   python tools/reprocess.py --dry-run                       # stale rows per stage
+#   python tools/reprocess.py --adopt-unversioned             # stamp pre-versioning rows as current
+#   python tools/reprocess.py --stages topics --rows-per-s 20 --max-runtime-s 3600
+import os, sys, json, time, argparse
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import bindparam, delete, text, update
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from realtime import process_new_phase3 as p3   # loads the current models; its STAGE_VERSIONS are the targets
+from nlp import topics, versions
+from src import archive, metrics, queries
+from src.db_models import Processed, ReviewAspectSentiment, init_db
+from src.rate_limit import TokenBucket
+
+BATCH_ROWS = int(os.getenv("REPROCESS_BATCH_ROWS", "200"))
+ROWS_PER_S = float(os.getenv("REPROCESS_ROWS_PER_S", "50"))   # 0 = unthrottled
+CHECKPOINT_PATH = os.getenv("REPROCESS_CHECKPOINT_PATH", "data/reprocess_checkpoint.json")
+
+engine = p3.engine
+
+# ---------- checkpoint ----------
+def load_checkpoint(path: str, targets: dict) -> int:
+    """Last committed review_id of an unfinished run for these targets; otherwise start over."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        ck = json.load(f)
+    if ck.get("done") or ck.get("targets") != targets:
+        return 0
+    return int(ck.get("after", 0))
+
+def save_checkpoint(path: str, targets: dict, after: int, done: bool = False) -> None:
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"targets": targets, "after": after, "done": done}, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+# ---------- stale rows ----------
+def stale_counts(conn, targets: dict) -> dict:
+    cols = ", ".join(
+        f"SUM(CASE WHEN COALESCE({versions.column(s)}, '') <> :{s} THEN 1 ELSE 0 END) AS {s}"
+        for s in targets
+    )
+    row = conn.execute(text(f"SELECT {cols} FROM reviews_processed WHERE triage_reason IS NULL"),
+                       targets).mappings().first()
+    return {s: int(row[s] or 0) for s in targets}
+
+def adopt_unversioned(conn, targets: dict) -> dict:
+    """Declare rows without a stamp as produced by the current versions (no recompute)."""
+    out = {}
+    for stage, version in targets.items():
+        col = versions.column(stage)
+        res = conn.execute(text(f"UPDATE reviews_processed SET {col} = :v WHERE {col} IS NULL"), {"v": version})
+        out[stage] = res.rowcount
+    return out
+
+def fetch_stale(conn, targets: dict, after: int, limit: int) -> pd.DataFrame:
+    params = {versions.column(s): targets.get(s) for s in versions.STAGES}   # None: stage not requested
+    params.update({"after": after, "limit": limit})
+    df = pd.read_sql(text(queries.STALE_PROCESSED), conn, params=params, parse_dates=["processed_at"])
+    return archive.hydrate(df)
+
+# ---------- recompute ----------
+def _update_stmt(stage: str, now: datetime):
+    fields = versions.STAGE_FIELDS[stage] + [versions.column(stage)]
+    t = Processed.__table__
+    return (update(t).where(t.c.review_id == bindparam("b_review_id"))
+            .values({**{f: bindparam(f"b_{f}") for f in fields}, "updated_at": now}))
+
+def reprocess_batch(conn, df: pd.DataFrame, targets: dict, topic_labels) -> dict:
+    """Recompute each stale stage for the rows that need it; one UPDATE per stage."""
+    done = {}
+    now = datetime.utcnow()
+    df = df.rename(columns={"review_id": "id"})
+    df["text"] = df["text"].fillna("")
+    for stage, version in targets.items():
+        col = versions.column(stage)
+        part = df[df[col].fillna("") != version]
+        if part.empty:
+            continue
+        if stage == "aspect_sentiment":
+            # old (review, aspect) rows may name aspects the new lexicon no longer finds
+            ids = [int(i) for i in part["id"]]
+            with metrics.stage("aspect_sentiment"):
+                rows = p3.aspect_sentiment_rows(part)
+            for r in rows:
+                r["processed_at"] = r["processed_at"].to_pydatetime()
+                r["updated_at"] = now
+            with metrics.stage("write"):
+                conn.execute(delete(ReviewAspectSentiment.__table__)
+                             .where(ReviewAspectSentiment.__table__.c.review_id.in_(ids)))
+                if rows:
+                    conn.execute(ReviewAspectSentiment.__table__.insert(), rows)
+                conn.execute(_update_stmt(stage, now), [{"b_review_id": i, f"b_{col}": version} for i in ids])
+        else:
+            res = p3.infer(part["text"].tolist(), topic_labels, stages=[stage])
+            res[col] = version
+            res["review_id"] = part["id"].astype(int).values
+            payload = [{f"b_{k}": v for k, v in rec.items()}
+                       for rec in res[versions.STAGE_FIELDS[stage] + [col, "review_id"]].to_dict("records")]
+            with metrics.stage("write"):
+                conn.execute(_update_stmt(stage, now), payload)
+        done[stage] = len(part)
+        metrics.incr(f"reprocessed_{stage}", len(part))
+    return done
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stages", nargs="+", choices=versions.STAGES, default=versions.STAGES)
+    ap.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    ap.add_argument("--rows-per-s", type=float, default=ROWS_PER_S, help="throttle; 0 = as fast as possible")
+    ap.add_argument("--max-runtime-s", type=float, default=0, help="stop (resumably) after this long; 0 = until done")
+    ap.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    ap.add_argument("--restart", action="store_true", help="ignore the checkpoint and rescan from the first row")
+    ap.add_argument("--dry-run", action="store_true", help="only count stale rows per stage")
+    ap.add_argument("--adopt-unversioned", action="store_true",
+                    help="stamp rows without a version as current instead of recomputing them")
+    args = ap.parse_args()
+
+    targets = {s: p3.STAGE_VERSIONS[s] for s in args.stages if p3.STAGE_VERSIONS.get(s)}
+    with engine.connect() as conn:
+        init_db(conn)
+        conn.commit()
+        if args.dry_run:
+            print(json.dumps({"targets": targets, "stale": stale_counts(conn, targets)}))
+            return
+    if args.adopt_unversioned:
+        with engine.begin() as conn:
+            print(json.dumps({"targets": targets, "adopted": adopt_unversioned(conn, targets)}))
+        return
+
+    after = 0 if args.restart else load_checkpoint(args.checkpoint, targets)
+    bucket = TokenBucket(args.rows_per_s, burst=max(args.batch_rows, int(args.rows_per_s))) if args.rows_per_s > 0 else None
+    deadline = time.monotonic() + args.max_runtime_s if args.max_runtime_s > 0 else None
+    stats = {"targets": targets, "resumed_after": after, "rows_scanned": 0, "batches": 0,
+             **{f"updated_{s}": 0 for s in targets}}
+    t0 = time.perf_counter()
+    finished = False
+    with metrics.pipeline_run("reprocess", engine):
+        with engine.connect() as conn:
+            topic_labels = topics.load_topic_labels(conn, p3.topic_model, p3.MODEL_VERSION)
+        while deadline is None or time.monotonic() < deadline:
+            # short transactions: live ingest / phase 3 get the database between batches
+            with engine.connect() as conn:
+                with metrics.stage("fetch"):
+                    df = fetch_stale(conn, targets, after, args.batch_rows)
+            if df.empty:
+                finished = True
+                break
+            if bucket:
+                bucket.acquire(len(df))
+            with engine.begin() as conn:
+                done = reprocess_batch(conn, df, targets, topic_labels)
+            after = int(df["review_id"].iloc[-1])
+            save_checkpoint(args.checkpoint, targets, after)
+            stats["rows_scanned"] += len(df)
+            stats["batches"] += 1
+            for s, n in done.items():
+                stats[f"updated_{s}"] += n
+            dt = time.perf_counter() - t0
+            print(f" up to review_id {after} | {stats['rows_scanned']:,} rows | {stats['rows_scanned'] / dt:,.1f} rows/s")
+        metrics.incr("rows_processed", stats["rows_scanned"])
+    if finished:
+        save_checkpoint(args.checkpoint, targets, after, done=True)
+    stats["finished"] = finished
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    stats["rows_per_sec"] = round(stats["rows_scanned"] / max(stats["seconds"], 1e-9), 1)
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
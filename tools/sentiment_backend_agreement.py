@@ -0,0 +1,79 @@
+# tools/sentiment_backend_agreement.py
+# Compare the ONNX (int8) sentiment backend against the eager PyTorch pipeline on recent reviews:
+# label agreement, score drift and throughput of each. Exits non-zero below --min-agreement.
+#   python tools/sentiment_backend_agreement.py --sample 1000
+#   python tools/sentiment_backend_agreement.py --export       # re-export/quantize first
+import os, sys, json, time, argparse
+from collections import Counter
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from nlp import sentiment
+from src.db_models import get_read_engine
+
+load_dotenv()
+
+def _timed(model, docs, batch):
+    sentiment.classify(model, docs[:batch], batch)   # warm-up (graph/session init, allocator)
+    t0 = time.perf_counter()
+    res = sentiment.classify(model, docs, batch)
+    return res, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sample", type=int, default=1000, help="number of recent reviews to compare on")
+    ap.add_argument("--batch", type=int, default=sentiment.SENTIMENT_BATCH)
+    ap.add_argument("--export", action="store_true", help="export + quantize the ONNX model before comparing")
+    ap.add_argument("--min-agreement", type=float, default=0.97)
+    ap.add_argument("--out", default="", help="optional path for the JSON report")
+    args = ap.parse_args()
+
+    if args.export:
+        print(json.dumps(sentiment.export_onnx()))
+
+    with get_read_engine().connect() as conn:
+        docs = [r[0] for r in conn.execute(
+            text("SELECT text FROM reviews_raw WHERE text IS NOT NULL ORDER BY id DESC LIMIT :n"),
+            {"n": args.sample},
+        )]
+    if not docs:
+        raise SystemExit("No reviews to compare on.")
+
+    ref, ref_s = _timed(sentiment.load_sentiment("torch"), docs, args.batch)
+    onnx, onnx_s = _timed(sentiment.load_sentiment("onnx"), docs, args.batch)
+
+    ref_labels = [r["label"].upper() for r in ref]
+    onnx_labels = [r["label"].upper() for r in onnx]
+    same = [a == b for a, b in zip(ref_labels, onnx_labels)]
+    diffs = [abs(a["score"] - b["score"]) for a, b in zip(ref, onnx)]
+    report = {
+        "docs": len(docs),
+        "backend": sentiment.backend_tag("onnx"),
+        "label_agreement": round(sum(same) / len(docs), 4),
+        "confusion": {f"{a}->{b}": n for (a, b), n in Counter(zip(ref_labels, onnx_labels)).items() if a != b},
+        "score_abs_diff_mean": round(sum(diffs) / len(diffs), 4),
+        "score_abs_diff_max": round(max(diffs), 4),
+        "torch_docs_per_s": round(len(docs) / ref_s, 1),
+        "onnx_docs_per_s": round(len(docs) / onnx_s, 1),
+        "speedup": round(ref_s / onnx_s, 2),
+        "examples": [
+            {"text": d[:160], "torch": a, "onnx": b}
+            for d, a, b, ok in zip(docs, ref_labels, onnx_labels, same) if not ok
+        ][:10],
+    }
+    meta_path = os.path.join(sentiment.ONNX_MODEL_DIR, sentiment.META_FILE)
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            report["export"] = json.load(f)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    if report["label_agreement"] < args.min_agreement:
+        raise SystemExit(f"Label agreement {report['label_agreement']} below {args.min_agreement}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# tools/topic_ann_agreement.py
+# Compare ANN topic assignment (centroid / kNN) against BERTopic's full transform path.
+#   python tools/topic_ann_agreement.py --mode centroid --sample 1000
+import os, sys, json, sqlite3, argparse
+import pandas as pd
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from nlp import topics, topic_ann
+
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL", "sqlite:///data/aspect_reviews.db")
+DB_PATH = DB_URL.replace("sqlite:///", "", 1)
+MODEL_DIR = os.getenv("BERTOPIC_MODEL_DIR", "/opt/airflow/models/bertopic_st")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["centroid", "knn"], default="centroid")
+    ap.add_argument("--sample", type=int, default=1000, help="number of recent reviews to compare on")
+    ap.add_argument("--out", default="", help="optional path for the JSON report")
+    args = ap.parse_args()
+
+    if not os.path.isdir(MODEL_DIR):
+        raise SystemExit(f"Model dir not found: {MODEL_DIR}")
+    topic_model = topics.load_model(MODEL_DIR)
+    index = topic_ann.build_index(topic_model, args.mode, MODEL_DIR)
+
+    con = sqlite3.connect(DB_PATH)
+    try:
+        docs = pd.read_sql(
+            "SELECT text FROM reviews_raw WHERE text IS NOT NULL ORDER BY id DESC LIMIT ?",
+            con, params=(args.sample,),
+        )["text"].tolist()
+    finally:
+        con.close()
+
+    report = topic_ann.agreement_report(topic_model, index, docs)
+    report["model_version"] = topics.model_version(MODEL_DIR)
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+
+if __name__ == "__main__":
+    main()
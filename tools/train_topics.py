@@ -0,0 +1,84 @@
+# tools/train_topics.py
+# Train BERTopic on a bounded sample of the history (nlp/topic_training.py) and report topic
+# quality per sample size, so TOPIC_TRAIN_SAMPLE can be chosen from numbers instead of guessed.
+# One streamed pass samples the largest size; every smaller size is a prefix of that sample and
+# all sizes are scored on the same held-out docs. --save writes the (single) trained model to
+# BERTOPIC_MODEL_DIR; afterwards tools/reprocess.py --stages topics reassigns the history in chunks.
+#   python tools/train_topics.py --sample-size 5000 20000 50000 --out topic_sizes.json
+#   python tools/train_topics.py --sample-size 20000 --stratify source --save
+import os, sys, json, time, argparse
+from dotenv import load_dotenv
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from nlp import topic_training, topics, triage
+from src import autotune, metrics
+from src.db_models import get_engine, init_db
+
+load_dotenv()
+MODEL_DIR = os.getenv("BERTOPIC_MODEL_DIR", "/opt/airflow/models/bertopic_st")
+TRIAGE = os.getenv("TRIAGE", "1") == "1"
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sample-size", type=int, nargs="+", default=[topic_training.TOPIC_TRAIN_SAMPLE],
+                    help="training docs per candidate model (0 = every row)")
+    ap.add_argument("--holdout", type=int, default=topic_training.TOPIC_TRAIN_HOLDOUT)
+    ap.add_argument("--stratify", choices=topic_training.STRATA_COLUMNS, default=topic_training.TOPIC_TRAIN_STRATIFY or None)
+    ap.add_argument("--seed", type=int, default=topic_training.TOPIC_TRAIN_SEED)
+    ap.add_argument("--nr-topics", type=int, default=topic_training.TOPIC_NR_TOPICS)
+    ap.add_argument("--save", action="store_true", help=f"replace the model in {MODEL_DIR} (one --sample-size only)")
+    ap.add_argument("--out", default="", help="optional path for the JSON report")
+    args = ap.parse_args()
+    if args.save and len(args.sample_size) != 1:
+        raise SystemExit("--save takes exactly one --sample-size")
+
+    from sentence_transformers import SentenceTransformer
+    embedder = SentenceTransformer(topics.EMBEDDING_MODEL)
+    engine = get_engine()
+    init_db(engine)
+    # 0 (everything) sorts last: it is the largest sample
+    sizes = sorted(args.sample_size, key=lambda n: n or float("inf"))
+    keep = (lambda t: triage.triage(t) is None) if TRIAGE else None
+
+    report = {"runs": []}
+    with metrics.pipeline_run("train_topics", engine):
+        t0 = time.perf_counter()
+        with metrics.stage("sample"), engine.connect() as conn:
+            docs, held, stats = topic_training.sample_corpus(
+                conn, sizes[-1], args.holdout, args.stratify or "", args.seed, keep=keep)
+        report["sample"] = stats
+        report["sample_s"] = round(time.perf_counter() - t0, 2)
+        if not docs:
+            raise SystemExit("reviews_raw has nothing to train on")
+        t0 = time.perf_counter()
+        with metrics.stage("embed"):
+            embeddings = topic_training.embed_batched(embedder, docs)
+        report["embed_s"] = round(time.perf_counter() - t0, 2)
+
+        for size in sizes:
+            n = min(size or len(docs), len(docs))
+            topic_model = topic_training.new_model(embedder)
+            with metrics.stage("fit"):
+                run = {"train_docs": n, **topic_training.fit_on(topic_model, docs[:n], embeddings[:n], args.nr_topics)}
+            with metrics.stage("quality"):
+                run["quality"] = topic_training.quality_report(topic_model, docs[:n], topic_model.topics_, held)
+            run["rss_mb"] = round(autotune.rss_mb(), 1)
+            report["runs"].append(run)
+            print(json.dumps(run))
+        metrics.incr("rows_processed", len(docs))
+
+        if args.save:
+            with metrics.stage("save"):
+                topic_training.save_model_dir(topic_model, embeddings[:n], {**report, **report["runs"][0]}, MODEL_DIR)
+            report["model_version"] = topics.model_version(MODEL_DIR)
+            print(f"Saved model {report['model_version']} to {MODEL_DIR}; "
+                  f"reassign the history with: python tools/reprocess.py --stages topics")
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+
+if __name__ == "__main__":
+    main()